@@ -0,0 +1,19 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+import authuser.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("authuser", "0004_user_totp_secret"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="cache_version",
+            field=models.CharField(default=authuser.models.generate_cache_version, editable=False, max_length=16),
+        ),
+    ]
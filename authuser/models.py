@@ -7,6 +7,10 @@ from django.db import models
 from django.utils import timezone
 
 
+def generate_cache_version():
+    return secrets.token_hex(8)
+
+
 class CustomUserManager(UserManager):
     def _create_user(self, email, password, **extra_fields):
         """
@@ -53,6 +57,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     totp_secret = models.CharField(max_length=200, blank=True, default="")
 
+    # changed on any write to the user's data so their cached values are never stale
+    cache_version = models.CharField(max_length=16, default=generate_cache_version, editable=False)
+
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
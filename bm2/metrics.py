@@ -0,0 +1,160 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+# Per-request performance instrumentation, enabled with DJANGO_PERFORMANCE_METRICS.
+#
+# The `performance` middleware in `bm2.middleware` starts a `RequestTimings` for each
+# request, database queries, cache lookups and outbound HTTP requests add to it, and
+# it's reported in the Server-Timing header and aggregated into this process' registry
+# for the /metrics endpoint. A context variable carries the timings so they follow the
+# request into the threads used by async views.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    __slots__ = ["db_queries", "db_time", "cache_hits", "cache_misses", "http_requests", "http_time"]
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.http_requests = 0
+        self.http_time = 0.0
+
+    def server_timing(self, duration):
+        return ", ".join(
+            [
+                f"total;dur={duration * 1000:.1f}",
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+                f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+                f'http;dur={self.http_time * 1000:.1f};desc="{self.http_requests} requests"',
+            ]
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_time += time.perf_counter() - start
+
+
+def instrument_connection(connection, **kwargs):
+    # the same list that `connection.execute_wrapper()` manages, but added for the
+    # lifetime of every connection (including those in async views' database thread)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_connections():
+    connection_created.connect(instrument_connection)
+
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(connection)
+
+
+def record_cache(hit):
+    timings = current.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+@contextmanager
+def outbound_http():
+    timings = current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.http_requests += 1
+            timings.http_time += time.perf_counter() - start
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+        self.totals = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, view, timings, duration):
+        with self.lock:
+            self.buckets[view][bisect_left(DURATION_BUCKETS, duration)] += 1
+
+            totals = self.totals[view]
+            totals["duration"] += duration
+            totals["db_queries"] += timings.db_queries
+            totals["db_time"] += timings.db_time
+            totals["cache_hits"] += timings.cache_hits
+            totals["cache_misses"] += timings.cache_misses
+            totals["http_requests"] += timings.http_requests
+            totals["http_time"] += timings.http_time
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self.lock:
+            views = sorted(self.buckets)
+
+            samples = []
+            for view in views:
+                cumulative = 0
+                for le, count in zip([*DURATION_BUCKETS, "+Inf"], self.buckets[view]):
+                    cumulative += count
+                    samples.append(f'bm2_request_duration_seconds_bucket{{view="{view}",le="{le}"}} {cumulative}')
+                samples.append(f'bm2_request_duration_seconds_sum{{view="{view}"}} {self.totals[view]["duration"]}')
+                samples.append(f'bm2_request_duration_seconds_count{{view="{view}"}} {cumulative}')
+            metric("bm2_request_duration_seconds", "histogram", "Request wall time", samples)
+
+            for name, key, kind, help_text in [
+                ("bm2_db_queries_total", "db_queries", "counter", "Database queries"),
+                ("bm2_db_query_seconds_total", "db_time", "counter", "Time spent in database queries"),
+                ("bm2_cache_hits_total", "cache_hits", "counter", "Per-user cache hits"),
+                ("bm2_cache_misses_total", "cache_misses", "counter", "Per-user cache misses"),
+                ("bm2_http_requests_total", "http_requests", "counter", "Outbound HTTP requests"),
+                ("bm2_http_request_seconds_total", "http_time", "counter", "Time spent in outbound HTTP requests"),
+            ]:
+                metric(name, kind, help_text, [f'{name}{{view="{view}"}} {self.totals[view][key]}' for view in views])
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def metrics(request):
+    # the registry is per process, each gunicorn worker reports its own requests
+    if not settings.PERFORMANCE_METRICS:
+        raise Http404()
+
+    if not (request.user.is_staff or getattr(request, "api_key", None)):
+        return HttpResponseForbidden()
+
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
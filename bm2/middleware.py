@@ -5,124 +5,249 @@ https://github.com/sesh/django-middleware
 """
 
 import logging
+import random
+import time
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.conf import settings
 from django.contrib.auth import login, logout
+from django.core.exceptions import MiddlewareNotUsed
 from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
 
 from authuser.models import ApiKey
+from bm2 import metrics, queries
 
 logger = logging.getLogger("django")
 
 
+# Every middleware here supports both sync and async requests. A sync-only middleware
+# would force each request served by the ASGI worker through a thread and back.
+
+
+def response_middleware(process_response):
+    # builds a middleware from a function that modifies the response in place
+    @sync_and_async_middleware
+    def factory(get_response):
+        if iscoroutinefunction(get_response):
+
+            async def middleware(request):
+                response = await get_response(request)
+                process_response(request, response)
+                return response
+
+        else:
+
+            def middleware(request):
+                response = get_response(request)
+                process_response(request, response)
+                return response
+
+        return middleware
+
+    factory.__name__ = process_response.__name__
+    return factory
+
+
+def get_api_key(request):
+    authorization_header = request.META.get("HTTP_AUTHORIZATION")
+    api_key = authorization_header.replace("Bearer", "").strip() if authorization_header else None
+
+    if api_key:
+        return ApiKey.objects.select_related("user").filter(key=api_key, expires__gt=timezone.now()).first()
+
+
+@sync_and_async_middleware
 def login_with_api_key(get_response):
-    def middleware(request):
-        authorization_header = request.META.get("HTTP_AUTHORIZATION")
-        api_key = authorization_header.replace("Bearer", "").strip() if authorization_header else None
+    if iscoroutinefunction(get_response):
 
-        if api_key:
-            try:
-                api_key_obj = ApiKey.objects.get(key=api_key, expires__gt=timezone.now())
-            except ApiKey.DoesNotExist:
-                api_key_obj = None
+        async def middleware(request):
+            api_key_obj = await sync_to_async(get_api_key)(request)
+
+            if api_key_obj:
+                request.api_key = api_key_obj
+                await sync_to_async(login)(request, api_key_obj.user)
+                response = await get_response(request)
+                await sync_to_async(logout)(request)
+                return response
+
+            return await get_response(request)
+
+    else:
+
+        def middleware(request):
+            api_key_obj = get_api_key(request)
 
             if api_key_obj:
+                request.api_key = api_key_obj
                 login(request, api_key_obj.user)
                 response = get_response(request)
                 logout(request)
                 return response
 
-        return get_response(request)
+            return get_response(request)
 
     return middleware
 
 
-def set_remote_addr(get_response):
-    def middleware(request):
-        request.META["REMOTE_ADDR"] = request.META.get("HTTP_X_REAL_IP", request.META["REMOTE_ADDR"])
-        response = get_response(request)
-        return response
+@sync_and_async_middleware
+def performance(get_response):
+    # removed from the middleware chain entirely unless it's enabled
+    if not settings.PERFORMANCE_METRICS:
+        raise MiddlewareNotUsed()
 
-    return middleware
+    metrics.instrument_connections()
 
+    def finish(request, response, timings, start):
+        duration = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
 
-def permissions_policy(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["Permissions-Policy"] = "interest-cohort=(),microphone=(),camera=(),autoplay=()"
-        return response
+        response.headers["Server-Timing"] = timings.server_timing(duration)
+        metrics.registry.observe(match.view_name if match else "unmatched", timings, duration)
 
-    return middleware
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timings, start = metrics.RequestTimings(), time.perf_counter()
+            token = metrics.current.set(timings)
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.current.reset(token)
+
+            finish(request, response, timings, start)
+            return response
+
+    else:
 
+        def middleware(request):
+            timings, start = metrics.RequestTimings(), time.perf_counter()
+            token = metrics.current.set(timings)
+            try:
+                response = get_response(request)
+            finally:
+                metrics.current.reset(token)
 
-def referrer_policy(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["Referrer-Policy"] = "same-origin"  # using no-referrer breaks CSRF
-        return response
+            finish(request, response, timings, start)
+            return response
 
     return middleware
 
 
-def csp(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'none'; script-src 'self'; style-src 'self'; "
-            "img-src 'self' https://icons.duckduckgo.com https://media.brntn.me; "
-            "child-src 'self'; form-action 'self'"
-        )
+@sync_and_async_middleware
+def query_inspection(get_response):
+    if not settings.QUERY_INSPECTION_SAMPLE_RATE:
+        raise MiddlewareNotUsed()
 
-        if settings.DEBUG and settings.ENABLE_DEBUG_TOOLBAR:
-            response.headers["Content-Security-Policy"] += "; connect-src 'self'"
-        return response
+    queries.instrument_connections()
 
-    return middleware
+    def sampled():
+        return random.random() < settings.QUERY_INSPECTION_SAMPLE_RATE  # nosec - not security sensitive
 
+    def finish(request, inspection):
+        report = inspection.report(f"{request.method} {request.path}")
 
-def xss_protect(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        return response
+        if report and settings.QUERY_INSPECTION_RAISE:
+            raise queries.RepeatedQueriesError(report)
+        elif report:
+            logger.warning(report)
 
-    return middleware
+    if iscoroutinefunction(get_response):
 
+        async def middleware(request):
+            if not sampled():
+                return await get_response(request)
 
-def expect_ct(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["Expect-CT"] = "enforce, max-age=30m"
-        return response
+            with queries.inspecting() as inspection:
+                response = await get_response(request)
 
-    return middleware
+            finish(request, inspection)
+            return response
+
+    else:
 
+        def middleware(request):
+            if not sampled():
+                return get_response(request)
+
+            with queries.inspecting() as inspection:
+                response = get_response(request)
 
-def cache(get_response):
-    def middleware(request):
-        response = get_response(request)
-        if request.method in ["GET", "HEAD"] and "Cache-Control" not in response.headers:
-            response.headers["Cache-Control"] = "max-age=10"
-        return response
+            finish(request, inspection)
+            return response
 
     return middleware
 
 
-def corp_coop_coep(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["Cross-Origin-Resource-Policy"] = "same-origin"
-        response.headers["Cross-Origin-Opener-Policy"] = "same-origin"
-        # response.headers["Cross-Origin-Embedder-Policy"] = "require-corp"
-        return response
+@sync_and_async_middleware
+def set_remote_addr(get_response):
+    def process_request(request):
+        request.META["REMOTE_ADDR"] = request.META.get("HTTP_X_REAL_IP", request.META["REMOTE_ADDR"])
 
-    return middleware
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            process_request(request)
+            return await get_response(request)
 
+    else:
 
-def dns_prefetch(get_response):
-    def middleware(request):
-        response = get_response(request)
-        response.headers["X-DNS-Prefetch-Control"] = "off"
-        return response
+        def middleware(request):
+            process_request(request)
+            return get_response(request)
 
     return middleware
+
+
+@response_middleware
+def permissions_policy(request, response):
+    response.headers["Permissions-Policy"] = "interest-cohort=(),microphone=(),camera=(),autoplay=()"
+
+
+@response_middleware
+def referrer_policy(request, response):
+    response.headers["Referrer-Policy"] = "same-origin"  # using no-referrer breaks CSRF
+
+
+@response_middleware
+def csp(request, response):
+    response.headers["Content-Security-Policy"] = (
+        "default-src 'none'; script-src 'self'; style-src 'self'; "
+        "img-src 'self' https://media.brntn.me; "
+        "child-src 'self'; form-action 'self'"
+    )
+
+    if settings.DEBUG and settings.ENABLE_DEBUG_TOOLBAR:
+        response.headers["Content-Security-Policy"] += "; connect-src 'self'"
+
+    # archived pages are third party HTML, rendered as a unique origin without scripts or forms
+    if getattr(response, "csp_sandbox", False):
+        response.headers["Content-Security-Policy"] += "; sandbox"
+
+
+@response_middleware
+def xss_protect(request, response):
+    response.headers["X-XSS-Protection"] = "1; mode=block"
+
+
+@response_middleware
+def expect_ct(request, response):
+    response.headers["Expect-CT"] = "enforce, max-age=30m"
+
+
+@response_middleware
+def cache(request, response):
+    if request.method in ["GET", "HEAD"] and "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "max-age=10"
+
+
+@response_middleware
+def corp_coop_coep(request, response):
+    response.headers["Cross-Origin-Resource-Policy"] = "same-origin"
+    response.headers["Cross-Origin-Opener-Policy"] = "same-origin"
+    # response.headers["Cross-Origin-Embedder-Policy"] = "require-corp"
+
+
+@response_middleware
+def dns_prefetch(request, response):
+    response.headers["X-DNS-Prefetch-Control"] = "off"
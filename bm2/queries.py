@@ -0,0 +1,125 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+# N+1 and slow query detection.
+#
+# While a request is being inspected every query is grouped by its normalised SQL and
+# the place it came from: the template line being rendered, or the innermost frame in
+# our own code. The same query from the same place QUERY_REPEAT_THRESHOLD or more times
+# is almost always a missing select_related/prefetch_related. The `query_inspection`
+# middleware inspects a sample of requests and logs what it finds, the test runner in
+# `bm2.runner` inspects every request and fails the test instead.
+
+logger = logging.getLogger("bm2.queries")
+
+current = ContextVar("query_inspection", default=None)
+
+IGNORED_FILES = {os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), "middleware.py")}
+
+
+class RepeatedQueriesError(Exception):
+    pass
+
+
+def normalize(sql):
+    sql = re.sub(r"\((?:\s*%s\s*,)*\s*%s\s*\)", "(...)", sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    return re.sub(r"\b\d+\b", "?", sql)
+
+
+def is_project_file(filename):
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and "site-packages" not in filename
+        and filename not in IGNORED_FILES
+    )
+
+
+def call_site():
+    frame = sys._getframe(1)
+    python_site = None
+
+    while frame:
+        code = frame.f_code
+
+        if code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            if isinstance(node, Node) and node.origin:
+                return f"{node.origin.template_name}:{node.token.lineno}"
+
+        if python_site is None and is_project_file(code.co_filename):
+            python_site = f"{os.path.relpath(code.co_filename, settings.BASE_DIR)}:{frame.f_lineno} in {code.co_name}"
+
+        frame = frame.f_back
+
+    return python_site or "unknown"
+
+
+class QueryInspection:
+    def __init__(self):
+        self.patterns = Counter()
+
+    def record(self, sql, duration):
+        site = call_site()
+        self.patterns[(normalize(sql), site)] += 1
+
+        if duration * 1000 >= settings.QUERY_SLOW_MS:
+            logger.warning("Slow query (%.0fms) at %s: %s", duration * 1000, site, sql)
+
+    def repeated(self):
+        return [
+            (sql, site, count)
+            for (sql, site), count in self.patterns.most_common()
+            if count >= settings.QUERY_REPEAT_THRESHOLD
+        ]
+
+    def report(self, name):
+        repeated = self.repeated()
+        if repeated:
+            lines = [f"{count} repeated queries at {site}: {sql}" for sql, site, count in repeated]
+            return f"Repeated queries in {name}:\n" + "\n".join(lines)
+
+
+def inspect_query(execute, sql, params, many, context):
+    inspection = current.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        inspection.record(sql, time.perf_counter() - start)
+
+
+def instrument_connection(connection, **kwargs):
+    if inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_query)
+
+
+def instrument_connections():
+    connection_created.connect(instrument_connection)
+
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(connection)
+
+
+@contextmanager
+def inspecting():
+    inspection = QueryInspection()
+    token = current.set(inspection)
+    try:
+        yield inspection
+    finally:
+        current.reset(token)
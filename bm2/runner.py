@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryInspectionRunner(DiscoverRunner):
+    # inspects every request made by the tests, a view or template that repeats the same
+    # query fails the test with bm2.queries.RepeatedQueriesError
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_INSPECTION_SAMPLE_RATE = 1
+        settings.QUERY_INSPECTION_RAISE = True
@@ -14,6 +14,8 @@ import os
 from pathlib import Path
 
 import dj_database_url
+import django
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "bm2.middleware.performance",
+    "bm2.middleware.query_inspection",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -87,12 +91,84 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "bm2.wsgi.application"
+ASGI_APPLICATION = "bm2.asgi.application"
+
+# Route the dashboard, API and importers to the async views in `links.async_views`,
+# enabled by bm2/asgi.py so it's only on when served by an ASGI worker
+ASYNC_VIEWS = os.environ.get("DJANGO_ASYNC_VIEWS", "").lower() == "true"
+
+
+# Per-request timings in a Server-Timing header and Prometheus metrics at /metrics, see bm2/metrics.py
+PERFORMANCE_METRICS = os.environ.get("DJANGO_PERFORMANCE_METRICS", "").lower() == "true"
+
+
+# N+1 and slow query detection on a sample of requests, see bm2/queries.py
+# The test runner inspects every request and fails tests with repeated queries
+QUERY_INSPECTION_SAMPLE_RATE = float(os.environ.get("DJANGO_QUERY_INSPECTION_SAMPLE_RATE", 0))
+QUERY_INSPECTION_RAISE = False
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("DJANGO_QUERY_REPEAT_THRESHOLD", 10))
+QUERY_SLOW_MS = int(os.environ.get("DJANGO_QUERY_SLOW_MS", 500))
+TEST_RUNNER = "bm2.runner.QueryInspectionRunner"
+
+
+# Archive each page's HTML as well as its text, see links/archive.py
+ARCHIVE_HTML = os.environ.get("DJANGO_ARCHIVE_HTML", "").lower() == "true"
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/
 
-DATABASES = {"default": dj_database_url.config(default=f'sqlite:///{BASE_DIR / "db.sqlite3"}')}
+DATABASES = {
+    "default": dj_database_url.config(
+        default=f'sqlite:///{BASE_DIR / "db.sqlite3"}',
+        conn_max_age=int(os.environ.get("DATABASE_CONN_MAX_AGE", 60)),
+        conn_health_checks=os.environ.get("DATABASE_CONN_HEALTH_CHECKS", "true").lower() == "true",
+    )
+}
+
+# Under ASGI the sync database work of each request runs in its own thread, so persistent
+# connections aren't reused, they pile up until CONN_MAX_AGE. Close them after each
+# request instead, or use the pool below.
+# https://docs.djangoproject.com/en/5.2/ref/databases/#persistent-connections
+
+if ASYNC_VIEWS:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+
+# Connection pooling for Postgres (requires Django 5.1+ and `psycopg[pool]`)
+# https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+# The pool replaces persistent connections, each gunicorn worker gets its own pool.
+
+if os.environ.get("DATABASE_POOL", "").lower() == "true" and "postgresql" in DATABASES["default"]["ENGINE"]:
+    if django.VERSION < (5, 1):
+        raise ImproperlyConfigured("DATABASE_POOL requires Django 5.1 or later")
+
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+        "timeout": int(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Select the backend with DJANGO_CACHE: locmem, db (the table created by `createcachetable`) or file
+
+CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", BASE_DIR / "cache"),
+    },
+}
+
+CACHES = {"default": CACHE_BACKENDS[os.environ.get("DJANGO_CACHE", "locmem" if DEBUG else "db")]}
 
 
 # Password validation
@@ -127,8 +203,16 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = "static/"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
 if not DEBUG:
-    STATICFILES_STORAGE = "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+    # hashed file names plus .gz (and .br, if brotli is installed) siblings for nginx to serve
+    STORAGES["staticfiles"]["BACKEND"] = "bm2.storage.CompressedManifestStaticFilesStorage"
+
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
 
 
 # Default primary key field type
@@ -173,6 +257,9 @@ if not DEBUG:
 
 UP_GUNICORN_PORT = 15276
 UP_PYTHON_VERSION = "python3.11"
+UP_GUNICORN_WORKER_CLASS = os.environ.get("UP_GUNICORN_WORKER_CLASS", "gthread")
+UP_HEALTH_CHECK_PATH = "/health/"
+UP_WORKERS = {"importers": "run_importers"}
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_SCHEME", "https")
 
 
@@ -0,0 +1,49 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".ico", ".json", ".map", ".txt", ".xml", ".html")
+
+
+def compressors():
+    # nginx serves these in place of the original with gzip_static (and brotli_static)
+    yield ".gz", lambda content: gzip.compress(content, compresslevel=9, mtime=0)
+
+    if brotli:
+        yield ".br", lambda content: brotli.compress(content, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # writes compressed siblings of each text file during collectstatic, so they're
+    # compressed once at deploy time instead of by nginx on every request
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+
+        if dry_run:
+            return
+
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            content = f.read()
+
+        for ext, compress in compressors():
+            compressed = compress(content)
+
+            if self.exists(name + ext):
+                self.delete(name + ext)
+
+            # tiny files can grow, nginx falls back to the original when there's no sibling
+            if len(compressed) < len(content):
+                self._save(name + ext, ContentFile(compressed))
@@ -16,28 +16,59 @@ Including another URLconf
 """
 
 from django.conf import settings
+from django.conf.urls.static import static
+from django.db import connection
 from django.http import HttpResponse
 from django.urls import include, path
 
 from authuser.views import LoginWithTotpView
+from bm2.metrics import metrics
 from links.views import (
     add,
+    api_bulk_delete,
     api_link,
+    api_stats,
+    api_tags,
+    bulk_delete,
+    calendar,
     dashboard,
     delete,
+    domain_icon,
+    duplicates,
     edit,
+    icon,
     import_feedbin,
     import_github,
     import_hackernews,
     screenshot,
+    snapshot,
+    stats,
+    tags,
+    trash,
     user_settings,
 )
 
+if settings.ASYNC_VIEWS:
+    from links.async_views import (  # noqa: F811
+        api_link,
+        dashboard,
+        import_feedbin,
+        import_github,
+        import_hackernews,
+    )
+
 
 def robots(request):
     return HttpResponse("User-Agent: *", headers={"Content-Type": "text/plain; charset=UTF-8"})
 
 
+def health(request):
+    # the deploy's health check, a query so a release that can't reach the database fails it
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return HttpResponse("OK", headers={"Content-Type": "text/plain; charset=UTF-8"})
+
+
 def security(request):
     return HttpResponse(
         "Contact: security@brntn.me\nExpires: 2025-01-01T00:00:00.000Z",
@@ -48,12 +79,25 @@ def security(request):
 urlpatterns = [
     path("", dashboard, name="dashboard"),
     path("add/", add, name="add"),
+    path("delete/", bulk_delete, name="bulk-delete"),
     path("delete/<uuid:pk>/", delete, name="delete-link"),
+    path("trash/", trash, name="trash"),
+    path("tags/", tags, name="tags"),
+    path("duplicates/", duplicates, name="duplicates"),
+    path("stats/", stats, name="stats"),
+    path("calendar/", calendar, name="calendar"),
+    path("calendar/<int:year>/", calendar, name="calendar-year"),
     path("edit/<uuid:pk>/", edit, name="edit-link"),
     path("settings/", user_settings, name="user-settings"),
     path("screenshot/<uuid:pk>/", screenshot, name="screenshot"),
+    path("archive/<uuid:pk>/", snapshot, name="snapshot"),
+    path("icons/<str:domain>.ico", domain_icon, name="domain-icon"),
+    path("icons/<slug:digest>/", icon, name="icon"),
     # "api"
     path("api/<uuid:pk>/", api_link, name="api-link"),
+    path("api/delete/", api_bulk_delete, name="api-bulk-delete"),
+    path("api/tags/", api_tags, name="api-tags"),
+    path("api/stats/", api_stats, name="api-stats"),
     # importers
     path("import/github/", import_github, name="github-import"),
     path("import/feedbin/", import_feedbin, name="feedbin-import"),
@@ -61,11 +105,16 @@ urlpatterns = [
     # .well-known
     path("robots.txt", robots),
     path(".well-known/security.txt", security),
+    path("metrics", metrics, name="metrics"),
+    path("health/", health, name="health"),
     # Django accounts
     path("accounts/login/", LoginWithTotpView.as_view(), name="login"),
     path("accounts/", include("django.contrib.auth.urls")),
 ]
 
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
 if settings.DEBUG and settings.ENABLE_DEBUG_TOOLBAR:
     urlpatterns += [
         path("__debug__/", include("debug_toolbar.urls")),
@@ -0,0 +1,185 @@
+import hashlib
+import re
+from datetime import timedelta
+from html.parser import HTMLParser
+from urllib.error import URLError
+from urllib.request import Request, build_opener
+
+from django.conf import settings
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from links.blobs import save_compressed_blob
+from links.duplicates import update_signatures
+from links.models import Link, LinkSnapshot
+from links.search import index_snapshot
+from links.ssrf import SafeRedirectHandler, UnsafeRedirect, uri_is_safe
+
+# Archived copies of bookmarked pages.
+#
+# The page's readable text (and its HTML, with DJANGO_ARCHIVE_HTML) is split into
+# content-defined chunks, and each chunk is compressed and stored once in `links.blobs`.
+# Chunk boundaries depend on the bytes around them rather than their offset, so a
+# re-crawl of a page that only changed in one place, or boilerplate shared between the
+# pages of a site, reuses the chunks that are already stored.
+
+ARCHIVE_MAX_BYTES = 5 * 1024 * 1024
+ARCHIVE_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+ARCHIVE_REFRESH_AFTER = timedelta(days=90)
+
+CHUNK_MIN = 2 * 1024
+CHUNK_MAX = 64 * 1024
+CHUNK_MASK = ((1 << 13) - 1) << 19  # the top 13 of 32 bits, an 8KB average chunk (after CHUNK_MIN)
+
+# a fixed pseudo-random value for each byte, so boundaries are the same on every run
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "big") for i in range(256)]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def content_defined_chunks(content):
+    # a gear rolling hash over (roughly) the last 32 bytes, cutting where its top bits are zero
+    start, length = 0, len(content)
+
+    while start < length:
+        end = min(start + CHUNK_MAX, length)
+        cut, h = end, 0
+
+        for i in range(start + CHUNK_MIN, end):
+            h = ((h << 1) + GEAR[content[i]]) & 0xFFFFFFFF
+            if not h & CHUNK_MASK:
+                cut = i + 1
+                break
+
+        yield content[start:cut]
+        start = cut
+
+
+def save_chunks(content):
+    refs, stored = [], 0
+
+    for chunk in content_defined_chunks(content):
+        ref, size = save_compressed_blob(chunk)
+        refs.append(ref)
+        stored += size
+
+    return " ".join(refs), stored
+
+
+class TextExtractor(HTMLParser):
+    SKIP = set("script style noscript template svg iframe object".split())
+    BLOCK = set(
+        "p div br li ul ol tr td th pre blockquote section article header footer aside nav main "
+        "h1 h2 h3 h4 h5 h6 dt dd hr".split()
+    )
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title, self.parts = [], []
+        self.skipping, self.in_title = 0, False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag == "title":
+            self.in_title = True
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag == "title":
+            self.in_title = False
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title.append(data)
+        elif not self.skipping:
+            self.parts.append(data)
+
+    def text(self):
+        lines = (re.sub(r"\s+", " ", line).strip() for line in "".join(self.parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def extract_text(html):
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return " ".join("".join(extractor.title).split()), extractor.text()
+
+
+def fetch(url):
+    request = Request(url, headers={"User-Agent": "bm2", "Accept": "text/html,text/plain;q=0.9"})
+
+    with build_opener(SafeRedirectHandler).open(request, timeout=30) as response:  # nosec - checked by uri_is_safe
+        content_type = response.headers.get_content_type()
+        if content_type not in ARCHIVE_CONTENT_TYPES:
+            raise ArchiveError(f"Not archived: {content_type}")
+
+        content = response.read(ARCHIVE_MAX_BYTES + 1)
+        if len(content) > ARCHIVE_MAX_BYTES:
+            raise ArchiveError("Page is too large")
+
+        charset = response.headers.get_content_charset() or "utf-8"
+        return response.geturl(), response.status, content_type, content.decode(charset, errors="replace")
+
+
+def archive_link(link):
+    # returns the new snapshot and the number of compressed bytes it added to storage
+    snapshot = LinkSnapshot(link=link, fetched=timezone.now())
+    stored = 0
+
+    if not uri_is_safe(link.url):
+        snapshot.error = "Unsafe URL"
+    else:
+        try:
+            snapshot.url, snapshot.status, snapshot.content_type, page = fetch(link.url)
+        except (ArchiveError, UnsafeRedirect, URLError, OSError, ValueError, LookupError) as e:
+            snapshot.status = getattr(e, "code", None)  # HTTPError
+            snapshot.error = str(e)[:200] or e.__class__.__name__
+        else:
+            if snapshot.content_type == "text/plain":
+                text = page
+            else:
+                snapshot.title, text = extract_text(page)
+                snapshot.title = snapshot.title[:1000]
+
+                if settings.ARCHIVE_HTML:
+                    html = page.encode()
+                    snapshot.html_chunks, size = save_chunks(html)
+                    snapshot.html_size, stored = len(html), stored + size
+
+            encoded = text.encode()
+            snapshot.text_chunks, size = save_chunks(encoded)
+            snapshot.text_size, stored = len(encoded), stored + size
+
+    previous = link.snapshots.first()
+    if previous and all(getattr(previous, f) == getattr(snapshot, f) for f in ["text_chunks", "html_chunks", "error"]):
+        # unchanged since the last crawl, keep a single snapshot
+        previous.fetched = snapshot.fetched
+        previous.save(update_fields=["fetched"])
+        return previous, stored
+
+    snapshot.save()
+
+    # a failed fetch keeps the last page that was archived in the search index
+    if snapshot.text_chunks:
+        index_snapshot(snapshot, text)
+        update_signatures([link.pk])
+
+    return snapshot, stored
+
+
+def pending_links(refresh_after=ARCHIVE_REFRESH_AFTER):
+    # links that have never been archived, then those whose last snapshot is the oldest
+    return (
+        Link.objects.annotate(last_fetched=Max("snapshots__fetched"))
+        .filter(Q(last_fetched=None) | Q(last_fetched__lt=timezone.now() - refresh_after))
+        .order_by(F("last_fetched").asc(nulls_first=True), "added")
+    )
@@ -0,0 +1,159 @@
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+
+from links.importers import (
+    ExpiredCredentialException,
+    MissingCredentialException,
+    feedbin,
+    github,
+    hackernews,
+)
+from links.models import Link, LinkScreenshot, UserSettings
+from links.ssrf import uri_is_safe
+from links.views import (
+    bad_request,
+    dashboard_links,
+    dashboard_tags,
+    invalid_filter,
+    is_filtered,
+    link_json,
+)
+
+# Async variants of the views that spend most of their time waiting, routed instead of
+# the sync views in `links.views` when DJANGO_ASYNC_VIEWS is set (bm2/asgi.py sets it).
+# Upstream requests made by the importers use an async HTTP client, database work that
+# the async ORM can't do yet (pagination, prefetching, taggit) runs in a single hop to
+# the database thread per request.
+
+
+def login_required(view):
+    # django.contrib.auth.decorators.login_required only wraps async views from Django 5.1
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@login_required
+async def dashboard(request):
+    try:
+        links, next_url, prev_url = await sync_to_async(dashboard_links)(request)
+    except ValidationError as e:
+        return invalid_filter(request, e)
+
+    if "json" in request.GET:
+        data = {
+            "data": [link.as_json() for link in links],
+            "next": next_url,
+            "prev": prev_url,
+        }
+        return JsonResponse(data)
+
+    context = {
+        "links": links,
+        "next": next_url,
+        "prev": prev_url,
+        "tags": await sync_to_async(dashboard_tags)(request.user),
+        "filtered": is_filtered(request.GET),
+    }
+
+    # context processors read the session and messages from the database
+    return await sync_to_async(render)(request, "links.html", context)
+
+
+async def run_import(request, importer, missing_message, imported_message, expired_message=None):
+    if request.method == "POST":
+        try:
+            count = await importer(request.user)
+        except (UserSettings.DoesNotExist, MissingCredentialException):
+            messages.warning(request, missing_message)
+            return redirect("/")
+        except ExpiredCredentialException:
+            messages.warning(request, expired_message)
+            return redirect("/")
+
+        if count >= 0:
+            messages.info(request, imported_message.format(count=count))
+
+    return redirect("/")
+
+
+@login_required
+async def import_github(request):
+    return await run_import(
+        request,
+        github.aimport_stars,
+        "Please add your Github token in settings",
+        "Imported {count} stars from Github",
+        "Github token is expired (or Github is having an issue!)",
+    )
+
+
+@login_required
+async def import_feedbin(request):
+    return await run_import(
+        request,
+        feedbin.aimport_stars,
+        "Please add your Feedbin credentials in settings",
+        "Imported {count} starred entries from Feedbin",
+        "Feedbin token is expired (or Feedbin is having an issue!)",
+    )
+
+
+@login_required
+async def import_hackernews(request):
+    return await run_import(
+        request,
+        hackernews.aimport_favourites,
+        "Please add your Hacker News username in settings",
+        "Imported {count} favourites from Hacker News",
+    )
+
+
+@login_required
+async def api_link(request, pk):
+    try:
+        link = await Link.objects.aget(pk=pk, user=request.user)
+    except Link.DoesNotExist:
+        raise Http404()
+
+    if request.method == "POST":
+        try:
+            request_body = json.loads(request.body)
+        except Exception:
+            return bad_request("Failed to parse JSON body")
+
+        if not isinstance(request_body, dict):
+            return bad_request("The JSON body must be an object")
+
+        if "screenshot_url" in request_body:
+            url = request_body["screenshot_url"]
+
+            # uri_is_safe resolves the hostname, don't block the event loop while it does
+            if await sync_to_async(uri_is_safe, thread_sensitive=False)(url):
+                screenshot, created = await LinkScreenshot.objects.aget_or_create(link=link, url=url)
+                data = await sync_to_async(link_json)(link)
+
+                if created:
+                    return JsonResponse({"data": data, "messages": ["screeshot added"]}, status=201)
+                else:
+                    return JsonResponse({"data": data, "messages": ["screeshot already exists"]})
+
+        return bad_request("Invalid body or unsupported action")
+
+    else:
+        return JsonResponse({"data": await sync_to_async(link_json)(link)})
+
+
+# django.views.decorators.csrf.csrf_exempt only wraps async views from Django 5.0
+api_link.csrf_exempt = True
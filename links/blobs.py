@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import tempfile
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-addressed file storage: files are named after the sha256 of their
+# contents so the same bytes are only ever stored once, no matter how many
+# rows reference them.
+
+
+def blob_name(digest, ext=""):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def blob_url(digest, ext=""):
+    return default_storage.url(blob_name(digest, ext))
+
+
+def save_blob(content, ext=""):
+    digest = hashlib.sha256(content).hexdigest()
+    name = blob_name(digest, ext)
+
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+
+    return digest
+
+
+def save_blob_stream(chunks, ext=""):
+    # hash while spooling to disk so large files never have to be held in memory
+    sha = hashlib.sha256()
+
+    with tempfile.TemporaryFile() as f:
+        for chunk in chunks:
+            sha.update(chunk)
+            f.write(chunk)
+
+        digest = sha.hexdigest()
+        name = blob_name(digest, ext)
+
+        if not default_storage.exists(name):
+            f.seek(0)
+            default_storage.save(name, File(f))
+
+    return digest
+
+
+def open_blob(digest, ext=""):
+    return default_storage.open(blob_name(digest, ext), "rb")
+
+
+# Compressed blobs are named after the sha256 of their uncompressed contents, so the
+# same bytes are stored once whichever compression they were written with. References
+# include the extension that says how to read them back, e.g. "<digest>.gz".
+
+DECOMPRESSORS = {
+    ".gz": gzip.decompress,
+    ".zst": lambda content: zstandard.ZstdDecompressor().decompress(content),
+}
+
+
+def compressor():
+    if zstandard:
+        return ".zst", zstandard.ZstdCompressor(level=19).compress
+    return ".gz", lambda content: gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def save_compressed_blob(content):
+    # returns the reference and the number of bytes written, 0 if the blob already existed
+    digest = hashlib.sha256(content).hexdigest()
+
+    for ext in DECOMPRESSORS:
+        if default_storage.exists(blob_name(digest, ext)):
+            return f"{digest}{ext}", 0
+
+    ext, compress = compressor()
+    compressed = compress(content)
+    default_storage.save(blob_name(digest, ext), ContentFile(compressed))
+    return f"{digest}{ext}", len(compressed)
+
+
+def read_compressed_blob(ref):
+    digest, ext = ref[:64], ref[64:]
+
+    with open_blob(digest, ext) as f:
+        return DECOMPRESSORS[ext](f.read())
@@ -0,0 +1,186 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from taggit.models import Tag
+
+from links.cache import invalidate
+from links.models import (
+    Link,
+    LinkScreenshot,
+    LinkSnapshot,
+    LinkTag,
+    RelatedLink,
+    SearchDocument,
+    SimhashBand,
+)
+from links.related import mark_related_stale
+from links.stats import update_stats_for
+from links.suggestions import mark_suggestions_stale, update_suggestions
+from links.tags import adjust_tag_counts
+
+# Set-based operations on many of a user's links at once.
+#
+# `link.delete()` goes through Django's collector, which loads every screenshot and tag
+# row into Python and sends signals for each of them, and `link.tags.add()` saves one
+# link's tags at a time. These work on a chunk of links at a time with one query per
+# table instead, and adjust the user's tag counts and cache themselves since the signal
+# handlers in `links.signals` don't run.
+
+CHUNK_SIZE = 500  # sqlite allows 999 parameters per query
+
+
+def chunks(links):
+    # the links are re-queried for each chunk, so `links` must stop matching the links
+    # that have been handled (e.g. because they were deleted or moved to the trash)
+    while chunk := list(links.values_list("id", flat=True)[:CHUNK_SIZE]):
+        yield chunk
+
+
+def adjust_tag_counts_for(user_id, link_ids, sign):
+    # one UPDATE for each distinct number of links per tag, rather than one per tag
+    by_count = defaultdict(list)
+    for row in LinkTag.objects.filter(content_object_id__in=link_ids).values("tag_id").annotate(count=Count("id")):
+        by_count[row["count"]].append(row["tag_id"])
+
+    for count, tag_ids in by_count.items():
+        adjust_tag_counts(user_id, tag_ids, sign * count)
+
+
+def delete_links(user, links):
+    # permanently deletes `links`, which can include links in the trash
+    links = Link.all_objects.filter(user=user, id__in=links.values("id"))
+    deleted = 0
+
+    for chunk in chunks(links):
+        with transaction.atomic():
+            # links in the trash have already been removed from the tag counts
+            adjust_tag_counts_for(user.id, Link.objects.filter(id__in=chunk).values("id"), -1)
+            update_stats_for(chunk, -1)
+            update_suggestions(chunk, remove=True)
+            # the lists these links are in get refilled by `update_related_links`
+            mark_related_stale(chunk)
+
+            LinkScreenshot.objects.filter(link_id__in=chunk)._raw_delete(LinkScreenshot.objects.db)
+            LinkSnapshot.objects.filter(link_id__in=chunk)._raw_delete(LinkSnapshot.objects.db)
+            SearchDocument.objects.filter(link_id__in=chunk)._raw_delete(SearchDocument.objects.db)
+            SimhashBand.objects.filter(link_id__in=chunk)._raw_delete(SimhashBand.objects.db)
+            RelatedLink.objects.filter(Q(link_id__in=chunk) | Q(related_id__in=chunk))._raw_delete(
+                RelatedLink.objects.db
+            )
+            LinkTag.objects.filter(content_object_id__in=chunk)._raw_delete(LinkTag.objects.db)
+            deleted += Link.all_objects.filter(id__in=chunk)._raw_delete(Link.objects.db)
+
+    invalidate(user.id)
+    return deleted
+
+
+def trash_links(user, links):
+    links = Link.objects.filter(user=user, id__in=links.values("id"))
+    now = timezone.now()
+    trashed = 0
+
+    for chunk in chunks(links):
+        with transaction.atomic():
+            adjust_tag_counts_for(user.id, chunk, -1)
+            update_stats_for(chunk, -1)
+            mark_related_stale(chunk)
+            trashed += Link.objects.filter(id__in=chunk).update(deleted=now, suggestions_updated=None)
+
+    invalidate(user.id)
+    return trashed
+
+
+def restore_links(user, links):
+    links = Link.all_objects.filter(user=user, id__in=links.values("id")).exclude(deleted=None)
+    restored = 0
+
+    for chunk in chunks(links):
+        with transaction.atomic():
+            adjust_tag_counts_for(user.id, chunk, 1)
+            restored += Link.all_objects.filter(id__in=chunk).update(deleted=None, suggestions_updated=None)
+            update_stats_for(chunk, 1)
+
+    invalidate(user.id)
+    return restored
+
+
+def empty_trash(user, before=None):
+    links = Link.all_objects.filter(user=user).exclude(deleted=None)
+    if before:
+        links = links.filter(deleted__lt=before)
+    return delete_links(user, links)
+
+
+def find_tags(names):
+    # by name (ignoring case, like taggit with TAGGIT_CASE_INSENSITIVE) or by slug
+    query = Q(slug__in=[name.lower() for name in names])
+    for name in names:
+        query |= Q(name__iexact=name)
+    return list(Tag.objects.filter(query))
+
+
+def get_or_create_tag(name):
+    return Tag.objects.filter(name__iexact=name).first() or Tag.objects.create(name=name)
+
+
+def tag_links(user, links, tag):
+    links = Link.objects.filter(user=user, id__in=links.values("id")).exclude(tagged_items__tag=tag)
+    added = 0
+
+    for chunk in chunks(links):
+        LinkTag.objects.bulk_create([LinkTag(content_object_id=link_id, tag=tag) for link_id in chunk])
+        adjust_tag_counts(user.id, [tag.id], len(chunk))
+        mark_related_stale(chunk)
+        mark_suggestions_stale(chunk)
+        added += len(chunk)
+
+    return added
+
+
+def untag_links(user, links, tag):
+    links = Link.objects.filter(user=user, id__in=links.values("id"), tagged_items__tag=tag)
+    removed = 0
+
+    for chunk in chunks(links):
+        LinkTag.objects.filter(tag=tag, content_object_id__in=chunk).delete()
+        adjust_tag_counts(user.id, [tag.id], -len(chunk))
+        mark_related_stale(chunk)
+        mark_suggestions_stale(chunk)
+        removed += len(chunk)
+
+    return removed
+
+
+def add_tag(user, links, name):
+    with transaction.atomic():
+        added = tag_links(user, links, get_or_create_tag(name))
+
+    invalidate(user.id)
+    return added
+
+
+def remove_tag(user, links, name):
+    with transaction.atomic():
+        removed = sum(untag_links(user, links, tag) for tag in find_tags([name]))
+
+    invalidate(user.id)
+    return removed
+
+
+def rename_tags(user, names, new_name):
+    # renames a tag on all of the user's links, or merges several tags into one (e.g. "Python" and "python").
+    # Tags are shared between users, so the user's links are moved to the new tag instead of renaming it
+    with transaction.atomic():
+        target = get_or_create_tag(new_name)
+        tags = [tag for tag in find_tags(names) if tag != target]
+        links = Link.objects.filter(user=user, tagged_items__tag__in=tags)
+        changed = links.values("id").distinct().count()
+
+        tag_links(user, links, target)
+        for tag in tags:
+            untag_links(user, Link.objects.filter(user=user), tag)
+
+    invalidate(user.id)
+    return changed
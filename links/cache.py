@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from authuser.models import generate_cache_version
+from bm2.metrics import record_cache
+
+# Cache-aside helpers for per-user data.
+#
+# Every key includes the user's `cache_version`, which is loaded with the user
+# on every request and replaced by `invalidate` whenever any of their data
+# changes. Stale entries are never read again and expire on their own.
+#
+# Replacing the version is a write to the user's row, so bulk operations (like imports,
+# which save each link and then its tags) use `deferred_invalidation` to write it once at
+# the end instead of for every signal.
+
+CACHE_TIMEOUT = 60 * 60
+
+# the users to invalidate when the outermost `deferred_invalidation` block ends
+_deferred = ContextVar("deferred_invalidation", default=None)
+
+
+def cache_key(user, name):
+    return f"links:{user.pk}:{user.cache_version}:{name}"
+
+
+def cached(user, name, fn, timeout=CACHE_TIMEOUT):
+    key = cache_key(user, name)
+    value = cache.get(key)
+    record_cache(hit=value is not None)
+
+    if value is None:
+        value = fn()
+        cache.set(key, value, timeout)
+
+    return value
+
+
+def invalidate(user_id):
+    deferred = _deferred.get()
+
+    if not user_id:
+        return
+    elif deferred is not None:
+        deferred.add(user_id)
+    else:
+        get_user_model().objects.filter(pk=user_id).update(cache_version=generate_cache_version())
+
+
+@contextmanager
+def deferred_invalidation():
+    if _deferred.get() is not None:
+        yield
+        return
+
+    user_ids = set()
+    token = _deferred.set(user_ids)
+
+    try:
+        yield
+    finally:
+        # even if the block failed, whatever it wrote before then is still in the database
+        _deferred.reset(token)
+        for user_id in user_ids:
+            invalidate(user_id)
@@ -0,0 +1,119 @@
+import calendar
+from datetime import date, datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from links.models import DailyLinkCount
+
+# The dashboard's date filters and the calendar.
+#
+# Every date filter (?date, ?from, ?to, ?month and ?year) becomes one half-open range of
+# timestamps, `start <= added < end`, with the ends at midnight in the current time zone.
+# Comparing `added` itself (rather than `added__date`, which converts every row to a date
+# first) lets the database seek straight to the range in the (user, added) index. A value
+# that isn't a date (from the query string or a JSON filter, so it can be anything) raises
+# a ValidationError, which the views return as a 400.
+#
+# The calendar's counts come from the DailyLinkCount rollups in `links.stats`, so a year
+# is a single indexed query of at most 366 rows however many links there are.
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid date: {value}")
+
+
+def parse_month(value):
+    # YYYY-MM
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid month: {value}")
+
+
+def parse_year(value):
+    try:
+        return date(int(value), 1, 1)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid year: {value}")
+
+
+def day_after(day):
+    try:
+        return day + timedelta(days=1)
+    except OverflowError:
+        raise ValidationError(f"Invalid date: {day}")
+
+
+def next_month(day):
+    return day_after(day.replace(day=calendar.monthrange(day.year, day.month)[1]))
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def date_range(params):
+    # (start, end) as aware datetimes, either is None if it's open. Each filter narrows the
+    # range, so ?year=2023&from=2023-06-01 is the second half of 2023
+    first, after = [], []
+
+    if "date" in params:
+        day = parse_day(params["date"])
+        first.append(day)
+        after.append(day_after(day))
+
+    if "from" in params:
+        first.append(parse_day(params["from"]))
+
+    if "to" in params:
+        after.append(day_after(parse_day(params["to"])))
+
+    if "month" in params:
+        month = parse_month(params["month"])
+        first.append(month)
+        after.append(next_month(month))
+
+    if "year" in params:
+        year = parse_year(params["year"])
+        first.append(year)
+        after.append(next_month(year.replace(month=12)))
+
+    return (day_start(max(first)) if first else None, day_start(min(after)) if after else None)
+
+
+def link_years(user):
+    return [day.year for day in DailyLinkCount.objects.filter(user=user).dates("day", "year")]
+
+
+def calendar_year(user, year):
+    # plain data for the calendar page, so it can be cached: each month's count and its
+    # weeks of days (None for the days of other months)
+    days = dict(
+        DailyLinkCount.objects.filter(user=user, day__gte=date(year, 1, 1), day__lte=date(year, 12, 31)).values_list(
+            "day", "count"
+        )
+    )
+
+    months = []
+    for month in range(1, 13):
+        weeks = [
+            [
+                {"date": day.isoformat(), "day": day.day, "count": days.get(day, 0)} if day.month == month else None
+                for day in week
+            ]
+            for week in calendar.Calendar().monthdatescalendar(year, month)
+        ]
+        months.append(
+            {
+                "month": f"{year}-{month:02}",
+                "name": calendar.month_name[month],
+                "count": sum(count for day, count in days.items() if day.month == month),
+                "weeks": weeks,
+            }
+        )
+
+    return {"year": year, "total": sum(days.values()), "months": months}
@@ -0,0 +1,202 @@
+import hashlib
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from links.bulk import chunks, trash_links
+from links.models import (
+    Link,
+    LinkScreenshot,
+    LinkSnapshot,
+    LinkTag,
+    SearchDocument,
+    SimhashBand,
+)
+from links.related import mark_related_stale
+from links.suggestions import mark_suggestions_stale
+from links.tags import adjust_tag_counts
+
+# Near-duplicate links, the same article under different URLs (mirrors, AMP pages,
+# tracking parameters) that exact URL matching misses.
+#
+# A link's title and archived text are reduced to a 64 bit SimHash, where similar text
+# gives hashes that differ in only a few bits. The hash is split into three bands: two
+# hashes within SIMHASH_DISTANCE bits of each other are identical in at least one band,
+# so candidates come from an indexed lookup of the bands instead of comparing every pair.
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 3
+SIMHASH_DISTANCE = 2
+SIMHASH_MAX_WORDS = 1000
+SIMHASH_MIN_FEATURES = 3  # an empty or one word title doesn't say much
+SIMHASH_MAX_BUCKET = 50  # more links than this with the same band is boilerplate (e.g. a captcha page)
+
+# where each band starts and ends, 21, 21 and 22 bits wide
+BAND_EDGES = [SIMHASH_BITS * i // SIMHASH_BANDS for i in range(SIMHASH_BANDS + 1)]
+
+
+def features(title, text):
+    # words and word pairs, so reordered text still differs
+    words = re.findall(r"\w+", f"{title} {text}".lower())[:SIMHASH_MAX_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def simhash(features):
+    # each bit of the result is the majority vote of that bit in the features' hashes.
+    # The hashes are laid out as one string of bits so that the votes for each bit are
+    # counted by a single str.count over every feature, instead of in a Python loop
+    if len(features) < SIMHASH_MIN_FEATURES:
+        return 0
+
+    bits = "".join(
+        format(int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest()), "064b") for f in features
+    )
+    value = 0
+
+    for i in range(SIMHASH_BITS):
+        if bits[i::SIMHASH_BITS].count("1") * 2 > len(features):
+            value |= 1 << (SIMHASH_BITS - 1 - i)
+
+    # as a signed 64 bit integer for BigIntegerField
+    return value - (1 << SIMHASH_BITS) if value >> (SIMHASH_BITS - 1) else value
+
+
+def band_keys(value):
+    # with the band's number in the high bits, so only the same band of two hashes can match
+    return [
+        i << 24 | (value >> start) & ((1 << (end - start)) - 1)
+        for i, (start, end) in enumerate(zip(BAND_EDGES, BAND_EDGES[1:]))
+    ]
+
+
+def distance(a, b):
+    return ((a ^ b) & ((1 << SIMHASH_BITS) - 1)).bit_count()
+
+
+def latest_texts(link_ids):
+    # the text of each link's latest archived page
+    texts = {}
+    snapshots = (
+        LinkSnapshot.objects.filter(link_id__in=link_ids).exclude(text_chunks="").order_by("link_id", "-fetched")
+    )
+
+    for snapshot in snapshots.only("link_id", "text_chunks"):
+        if snapshot.link_id not in texts:
+            texts[snapshot.link_id] = snapshot.text()
+
+    return texts
+
+
+def update_signatures(link_ids):
+    rows = Link.all_objects.filter(id__in=link_ids).values_list("id", "user_id", "title")
+    texts = latest_texts(link_ids)
+    links, bands = [], []
+
+    for link_id, user_id, title in rows:
+        value = simhash(features(title, texts.get(link_id, "")))
+        links.append(Link(id=link_id, simhash=value))
+
+        if value and user_id:
+            bands += [SimhashBand(link_id=link_id, user_id=user_id, key=key) for key in band_keys(value)]
+
+    with transaction.atomic():
+        Link.all_objects.bulk_update(links, ["simhash"])
+        SimhashBand.objects.filter(link_id__in=link_ids).delete()
+        SimhashBand.objects.bulk_create(bands)
+
+    return len(links)
+
+
+def update_pending_signatures():
+    count = 0
+    for chunk in chunks(Link.all_objects.filter(simhash=None)):
+        count += update_signatures(chunk)
+    return count
+
+
+def possible_duplicates(link):
+    if not link.simhash:
+        return []
+
+    candidates = Link.objects.filter(
+        id__in=SimhashBand.objects.filter(user_id=link.user_id, key__in=band_keys(link.simhash)).values("link_id")
+    ).exclude(pk=link.pk)
+    return [candidate for candidate in candidates if distance(candidate.simhash, link.simhash) <= SIMHASH_DISTANCE]
+
+
+def duplicate_groups(user, limit=50):
+    # links that share a band with another link, grouped if their hashes are close enough
+    shared = (
+        SimhashBand.objects.filter(user=user)
+        .values("key")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1, count__lte=SIMHASH_MAX_BUCKET)
+    )
+    rows = SimhashBand.objects.filter(user=user, key__in=shared.values("key"), link__deleted=None).values_list(
+        "key", "link_id", "link__simhash"
+    )
+
+    buckets = defaultdict(dict)
+    for key, link_id, value in rows:
+        buckets[key][link_id] = value
+
+    # union-find over the pairs in each bucket
+    parent = {}
+
+    def root(link_id):
+        while parent.setdefault(link_id, link_id) != link_id:
+            link_id = parent[link_id]
+        return link_id
+
+    for bucket in buckets.values():
+        bucket = list(bucket.items())
+        for i, (a, a_value) in enumerate(bucket):
+            for b, b_value in bucket[i + 1 :]:
+                if distance(a_value, b_value) <= SIMHASH_DISTANCE:
+                    parent[root(b)] = root(a)
+
+    groups = defaultdict(list)
+    for link_id in parent:
+        groups[root(link_id)].append(link_id)
+
+    groups = [ids for ids in groups.values() if len(ids) > 1][:limit]
+    links = Link.objects.in_bulk([link_id for ids in groups for link_id in ids])
+    return [sorted((links[link_id] for link_id in ids), key=lambda link: link.added) for ids in groups]
+
+
+def merge_links(user, keep, links):
+    # moves the tags, notes, screenshots and archive of `links` onto `keep`, and `links` to the trash
+    links = Link.objects.filter(user=user, id__in=links.values("id")).exclude(pk=keep.pk)
+    merged = list(links)
+
+    if not merged:
+        return 0
+
+    with transaction.atomic():
+        tag_ids = set(LinkTag.objects.filter(content_object__in=merged).values_list("tag_id", flat=True))
+        tag_ids -= set(keep.tags.values_list("id", flat=True))
+        LinkTag.objects.bulk_create([LinkTag(content_object=keep, tag_id=tag_id) for tag_id in tag_ids])
+        adjust_tag_counts(user.id, tag_ids, 1)
+
+        notes = [keep.note] + [link.note for link in merged if link.note and link.note not in keep.note]
+        keep.note = "\n\n".join(note for note in notes if note)
+        keep.added = min([keep.added] + [link.added for link in merged])
+        keep.save(update_fields=["note", "added"])
+
+        LinkScreenshot.objects.filter(link__in=merged).update(link=keep)
+        LinkSnapshot.objects.filter(link__in=merged).update(link=keep)
+
+        # keeps one of their archives searchable, if `keep` hasn't been archived itself
+        document = SearchDocument.objects.filter(link__in=merged).first()
+        if document and not SearchDocument.objects.filter(link=keep).exists():
+            document.link = keep
+            document.save(update_fields=["link"])
+
+        trash_links(user, links)
+        mark_related_stale([keep.pk])
+        mark_suggestions_stale([keep.pk])
+
+    update_signatures([keep.pk])
+    return len(merged)
@@ -0,0 +1,78 @@
+import base64
+from datetime import timedelta
+from urllib.error import URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+from django.db.models import Q
+from django.utils import timezone
+
+from links.blobs import save_blob
+from links.models import Favicon, Link
+from links.ssrf import domain_is_valid
+
+ICON_SOURCE = "https://icons.duckduckgo.com/ip3/{hostname}.ico"
+ICON_MAX_BYTES = 100 * 1024
+ICON_RETRY_AFTER = timedelta(days=7)
+
+# 1x1 transparent gif, served until the icon for a domain has been fetched
+PLACEHOLDER_ICON = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+
+def attach_icons(links):
+    # resolve the icons for a page of links with a single query so that each
+    # row can point at an immutable, content-addressed icon url
+    domains = {link.domain() for link in links}
+    digests = dict(Favicon.objects.filter(domain__in=domains).exclude(digest="").values_list("domain", "digest"))
+
+    for link in links:
+        link.icon_digest = digests.get(link.domain())
+
+    return links
+
+
+def missing_domains():
+    # domains that failed are retried once ICON_RETRY_AFTER has passed
+    known = set(
+        Favicon.objects.filter(~Q(digest="") | Q(fetched__gte=timezone.now() - ICON_RETRY_AFTER)).values_list(
+            "domain", flat=True
+        )
+    )
+
+    domains = set()
+    for url in Link.objects.values_list("url", flat=True).iterator():
+        domain = urlsplit(url).netloc
+        if domain and domain not in known:
+            domains.add(domain)
+
+    return sorted(domains)
+
+
+def fetch(url):
+    # reads at most one byte more than ICON_MAX_BYTES, so an oversized response isn't downloaded in full
+    request = Request(url, headers={"User-Agent": "bm2"})
+    with urlopen(request, timeout=10) as response:  # nosec - always ICON_SOURCE
+        return response.headers.get_content_type(), response.read(ICON_MAX_BYTES + 1)
+
+
+def fetch_icon(domain):
+    favicon, _ = Favicon.objects.get_or_create(domain=domain)
+    favicon.fetched = timezone.now()
+
+    # the icon is fetched server side, once per domain, so the browser never
+    # has to talk to a third party to render the dashboard
+    hostname = urlsplit(f"https://{domain}").hostname
+    if hostname and domain_is_valid(hostname):
+        try:
+            content_type, content = fetch(ICON_SOURCE.format(hostname=hostname))
+        except (URLError, OSError, ValueError):
+            # an error status, timeout or unreachable upstream is saved as a failed fetch like a missing
+            # icon, so one domain can't stop the rest and it isn't retried until ICON_RETRY_AFTER
+            content_type, content = "", b""
+
+        if content_type.startswith("image/") and content and len(content) <= ICON_MAX_BYTES:
+            favicon.digest = save_blob(content)
+            favicon.content_type = content_type
+
+    favicon.save()
+    return favicon
@@ -1,6 +1,30 @@
+import httpx
+
+from links.models import UserSettings
+
+IMPORT_TIMEOUT = 60
+
+# every imported link is tagged with its source, `?source=github` filters on it
+SOURCE_TAGS = {
+    "github": "github-starred",
+    "feedbin": "feedbin-starred",
+    "hackernews": "hn-fav",
+}
+
+
 class MissingCredentialException(Exception):
     pass
 
 
 class ExpiredCredentialException(Exception):
     pass
+
+
+def get_user_settings(user):
+    # read for each import rather than cached, so the credentials are only ever in the database
+    return UserSettings.objects.get(user=user)
+
+
+def async_client():
+    # used by the async importers so a slow upstream doesn't hold a thread for the whole request
+    return httpx.AsyncClient(timeout=IMPORT_TIMEOUT)
@@ -1,7 +1,20 @@
 import thttp
+from asgiref.sync import sync_to_async
 
-from links.importers import ExpiredCredentialException, MissingCredentialException
-from links.models import Link, UserSettings
+from bm2.metrics import outbound_http
+from links.cache import deferred_invalidation
+from links.importers import (
+    SOURCE_TAGS,
+    ExpiredCredentialException,
+    MissingCredentialException,
+    async_client,
+    get_user_settings,
+)
+from links.models import Link
+from links.suggestions import add_suggested_tags
+
+STARRED_URL = "https://api.feedbin.com/v2/starred_entries.json"
+ENTRIES_URL = "https://api.feedbin.com/v2/entries.json"
 
 
 def short_text(text):
@@ -17,38 +30,65 @@ def short_text(text):
     return result
 
 
-def import_stars(user, request=None):
-    settings = UserSettings.objects.get(user=user)
-
+def credentials(settings):
     if not (settings.feedbin_username and settings.feedbin_password):
         raise MissingCredentialException()
 
-    response = thttp.request(
-        "https://api.feedbin.com/v2/starred_entries.json",
-        basic_auth=(settings.feedbin_username, settings.feedbin_password),
-    )
+    return (settings.feedbin_username, settings.feedbin_password)
+
+
+def entries_params(starred):
+    return {"ids": ",".join([str(x) for x in starred[-100:]])}
+
+
+@deferred_invalidation()
+def save_entries(user, entries):
+    added = []
+    for feedbin_link in entries:
+        # all_objects, so a link in the trash is left there rather than imported again
+        link, created = Link.all_objects.get_or_create(url=feedbin_link["url"] or "https://example.org", user=user)
+
+        if created:
+            added.append(link)
+            link.title = feedbin_link["title"] or short_text(feedbin_link.get("summary", "")) or "No title"
+            link.added = feedbin_link["created_at"]
+            link.tags.add(SOURCE_TAGS["feedbin"])
+            link.save()
+
+    add_suggested_tags(user, added)
+    return len(added)
+
+
+def import_stars(user, request=None):
+    auth = credentials(get_user_settings(user))
+    with outbound_http():
+        response = thttp.request(STARRED_URL, basic_auth=auth)
 
     if response.status != 200:
         raise ExpiredCredentialException()
 
-    if len(response.json) > 0:
-        entries = thttp.request(
-            "https://api.feedbin.com/v2/entries.json",
-            basic_auth=(settings.feedbin_username, settings.feedbin_password),
-            params={"ids": ",".join([str(x) for x in response.json[-100:]])},
-        )
-
-        count_added = 0
-        for feedbin_link in entries.json:
-            link, created = Link.objects.get_or_create(
-                url=feedbin_link["url"] or "https://example.org", user=request.user
-            )
-
-            if created:
-                count_added += 1
-                link.title = feedbin_link["title"] or short_text(feedbin_link.get("summary", "")) or "No title"
-                link.added = feedbin_link["created_at"]
-                link.tags.add("feedbin-starred")
-                link.save()
-
-        return count_added
+    if not response.json:
+        return 0
+
+    with outbound_http():
+        entries = thttp.request(ENTRIES_URL, basic_auth=auth, params=entries_params(response.json))
+    return save_entries(user, entries.json)
+
+
+async def aimport_stars(user):
+    auth = credentials(await sync_to_async(get_user_settings)(user))
+
+    async with async_client() as client:
+        with outbound_http():
+            response = await client.get(STARRED_URL, auth=auth)
+
+        if response.status_code != 200:
+            raise ExpiredCredentialException()
+
+        if not response.json():
+            return 0
+
+        with outbound_http():
+            entries = await client.get(ENTRIES_URL, auth=auth, params=entries_params(response.json()))
+
+    return await sync_to_async(save_entries)(user, entries.json())
@@ -1,34 +1,67 @@
 import thttp
+from asgiref.sync import sync_to_async
 
-from links.importers import ExpiredCredentialException, MissingCredentialException
-from links.models import Link, UserSettings
+from bm2.metrics import outbound_http
+from links.cache import deferred_invalidation
+from links.importers import (
+    SOURCE_TAGS,
+    ExpiredCredentialException,
+    MissingCredentialException,
+    async_client,
+    get_user_settings,
+)
+from links.models import Link
+from links.suggestions import add_suggested_tags
 
+STARS_URL = "https://api.github.com/user/starred"
 
-def import_stars(user, request=None):
-    settings = UserSettings.objects.get(user=user)
 
+def stars_headers(settings):
     if not settings.github_pat:
         raise MissingCredentialException()
 
-    url = "https://api.github.com/user/starred"
-    response = thttp.request(
-        url, headers={"Authorization": f"token {settings.github_pat}", "Accept": "application/vnd.github.v3.star+json"}
-    )
+    return {"Authorization": f"token {settings.github_pat}", "Accept": "application/vnd.github.v3.star+json"}
 
-    if response.status != 200:
-        raise ExpiredCredentialException()
 
-    count_added = 0
-    for star_json in response.json:
-        link, created = Link.objects.get_or_create(url=star_json["repo"]["html_url"], user=user)
+@deferred_invalidation()
+def save_stars(user, stars):
+    added = []
+    for star_json in stars:
+        # all_objects, so a link in the trash is left there rather than imported again
+        link, created = Link.all_objects.get_or_create(url=star_json["repo"]["html_url"], user=user)
 
         if created:
-            count_added += 1
+            added.append(link)
             link.title = star_json["repo"]["full_name"] or star_json["repo"]["name"]
             link.note = star_json["repo"]["description"] or ""
 
-            link.tags.add("github-starred", *star_json["repo"].get("topics", []))
+            link.tags.add(SOURCE_TAGS["github"], *star_json["repo"].get("topics", []))
             link.added = star_json["starred_at"]
             link.save()
 
-    return count_added
+    add_suggested_tags(user, added)
+    return len(added)
+
+
+def import_stars(user, request=None):
+    headers = stars_headers(get_user_settings(user))
+    with outbound_http():
+        response = thttp.request(STARS_URL, headers=headers)
+
+    if response.status != 200:
+        raise ExpiredCredentialException()
+
+    return save_stars(user, response.json)
+
+
+async def aimport_stars(user):
+    headers = stars_headers(await sync_to_async(get_user_settings)(user))
+
+    async with async_client() as client:
+        with outbound_http():
+            response = await client.get(STARS_URL, headers=headers)
+
+    if response.status_code != 200:
+        raise ExpiredCredentialException()
+
+    return await sync_to_async(save_stars)(user, response.json())
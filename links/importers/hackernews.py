@@ -1,29 +1,68 @@
 import thttp
+from asgiref.sync import sync_to_async
 
-from links.importers import MissingCredentialException
-from links.models import Link, UserSettings
+from bm2.metrics import outbound_http
+from links.cache import deferred_invalidation
+from links.importers import (
+    SOURCE_TAGS,
+    MissingCredentialException,
+    async_client,
+    get_user_settings,
+)
+from links.models import Link
+from links.suggestions import add_suggested_tags
 
+FAVOURITES_URL = "https://osnhvzckcf.execute-api.ap-southeast-2.amazonaws.com/api/users/{username}"
 
-def import_favourites(user, request=None):
-    settings = UserSettings.objects.get(user=user)
 
+def favourites_url(settings):
     if not settings.hn_username:
         raise MissingCredentialException()
 
-    url = f"https://osnhvzckcf.execute-api.ap-southeast-2.amazonaws.com/api/users/{settings.hn_username}"
-    response = thttp.request(url)
+    return FAVOURITES_URL.format(username=settings.hn_username)
+
+
+@deferred_invalidation()
+def save_favourites(user, favourites):
+    added = []
 
-    count_added = 0
+    if favourites:
+        for favourite in favourites.get("links", []):
+            # all_objects, so a link in the trash is left there rather than imported again
+            link, created = Link.all_objects.get_or_create(url=favourite["url"], user=user)
 
-    if response.json:
-        for favourite in response.json.get("links", []):
-            link, created = Link.objects.get_or_create(url=favourite["url"], user=user)
+            if link.deleted:
+                continue
 
             if created:
-                count_added += 1
+                added.append(link)
                 link.title = favourite["title"]
 
-            link.tags.add("hn-fav")
+            link.tags.add(SOURCE_TAGS["hackernews"])
             link.save()
 
-    return count_added
+    add_suggested_tags(user, added)
+    return len(added)
+
+
+def import_favourites(user, request=None):
+    url = favourites_url(get_user_settings(user))
+
+    with outbound_http():
+        response = thttp.request(url)
+    return save_favourites(user, response.json)
+
+
+async def aimport_favourites(user):
+    url = favourites_url(await sync_to_async(get_user_settings)(user))
+
+    async with async_client() as client:
+        with outbound_http():
+            response = await client.get(url)
+
+    try:
+        favourites = response.json()
+    except ValueError:
+        favourites = None
+
+    return await sync_to_async(save_favourites)(user, favourites)
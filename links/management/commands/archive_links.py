@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from links.archive import ARCHIVE_REFRESH_AFTER, archive_link, pending_links
+
+
+class Command(BaseCommand):
+    help = "Archive the text of new bookmarks, and re-archive those last fetched more than --refresh-days ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--refresh-days", type=int, default=ARCHIVE_REFRESH_AFTER.days)
+        parser.add_argument("--limit", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        links = pending_links(timedelta(days=options["refresh_days"]))[: options["limit"]]
+        count, stored = 0, 0
+
+        for link in links:
+            snapshot, size = archive_link(link)
+            count += 1
+            stored += size
+
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{link.url}: {snapshot.error or f'{snapshot.text_size} bytes of text'}")
+
+        average = stored / count / 1024 if count else 0
+        self.stdout.write(f"Archived {count} links, storing {stored / 1024:.1f}KB ({average:.1f}KB per link)")
@@ -0,0 +1,402 @@
+import itertools
+import json
+import statistics
+import subprocess  # nosec - only runs git
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from authuser.models import User
+from links.importers import feedbin, github, hackernews
+from links.models import Link, LinkScreenshot, UserSettings
+from links.tags import tag_counts
+
+"""
+Measures latency and throughput of the main endpoints for a user, seed one with `seed_links`
+
+Usage:
+    ./manage.py benchmark <email> [--suite] [--path=<path> ...] [--requests=<n>] [--concurrency=<n>] [--url=<url>]
+
+Prints the results as JSON, save them for each commit (or setting) to compare them.
+
+Without --url the requests go through Django's test Client in this process, which is quick
+to compare commits with but shares one interpreter (and its GIL) between the threads and
+never closes or pools database connections. To measure what production would do, run the
+server the way it's deployed (e.g. gunicorn with the same .env) and pass its --url, the
+requests are then sent over HTTP with a session for the user.
+"""
+
+
+# links created by the benchmark (added, imported and screenshots) all use this prefix so
+# they can be removed afterwards, leaving the seeded data the same for the next run
+BENCHMARK_PREFIX = "https://benchmark.invalid/"
+
+FAKE_STARS = [
+    {
+        "starred_at": "2023-01-01T00:00:00Z",
+        "repo": {
+            "html_url": f"{BENCHMARK_PREFIX}github/{i}",
+            "full_name": f"benchmark/repo-{i}",
+            "name": f"repo-{i}",
+            "description": "A starred repository",
+            "topics": ["python", "benchmark"],
+        },
+    }
+    for i in range(30)
+]
+
+FAKE_ENTRIES = [
+    {
+        "url": f"{BENCHMARK_PREFIX}feedbin/{i}",
+        "title": f"Feedbin entry {i}",
+        "summary": "A starred entry.",
+        "created_at": "2023-01-01T00:00:00Z",
+    }
+    for i in range(100)
+]
+
+FAKE_FAVOURITES = {"links": [{"url": f"{BENCHMARK_PREFIX}hackernews/{i}", "title": f"Story {i}"} for i in range(30)]}
+
+
+class FakeUpstream(BaseHTTPRequestHandler):
+    # canned Github, Feedbin and Hacker News responses so imports are measured without the network
+    routes = {
+        "/github/user/starred": FAKE_STARS,
+        "/feedbin/starred_entries.json": list(range(len(FAKE_ENTRIES))),
+        "/feedbin/entries.json": FAKE_ENTRIES,
+        "/hackernews/benchmark": FAKE_FAVOURITES,
+    }
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+
+        if path not in self.routes:
+            self.send_error(404)
+            return
+
+        body = json.dumps(self.routes[path]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def fake_upstreams():
+    # yields a throwaway user with credentials for each importer, so the benchmark never
+    # touches a real user's settings
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base = f"http://127.0.0.1:{server.server_port}"
+    urls = {
+        (github, "STARS_URL"): f"{base}/github/user/starred",
+        (feedbin, "STARRED_URL"): f"{base}/feedbin/starred_entries.json",
+        (feedbin, "ENTRIES_URL"): f"{base}/feedbin/entries.json",
+        (hackernews, "FAVOURITES_URL"): base + "/hackernews/{username}",
+    }
+    original_urls = {key: getattr(*key) for key in urls}
+
+    user = User.objects.create(email=f"{uuid.uuid4().hex}@benchmark.invalid")
+    UserSettings.objects.create(
+        user=user,
+        github_pat="benchmark",
+        feedbin_username="benchmark",
+        feedbin_password="benchmark",
+        hn_username="benchmark",
+    )
+
+    try:
+        for (module, name), url in urls.items():
+            setattr(module, name, url)
+
+        yield user
+    finally:
+        for (module, name), url in original_urls.items():
+            setattr(module, name, url)
+
+        # links are kept (without a user) when their user is deleted
+        Link.all_objects.filter(user=user).delete()
+        user.delete()
+        server.shutdown()
+        server.server_close()
+
+
+def suite(user):
+    # (name, method, path, body) for each endpoint, using the user's own links and tags
+    endpoints = [
+        ("dashboard", "get", "/", None),
+        ("dashboard_limit_20", "get", "/?limit=20", None),
+        ("dashboard_random", "get", "/?random", None),
+        ("json", "get", "/?json", None),
+    ]
+
+    if Link.objects.filter(user=user)[100:101].exists():
+        endpoints += [
+            ("dashboard_page_2", "get", "/?page=2", None),
+            ("json_page_2", "get", "/?json&page=2", None),
+        ]
+
+    tags = [count.tag.slug for count in tag_counts(user, limit=2)]
+    if tags:
+        endpoints += [
+            ("tag", "get", f"/?tag={tags[0]}", None),
+            ("tags_all", "get", f"/?tag={'&tag='.join(tags)}", None),
+            ("tags_any", "get", f"/?tag={'&tag='.join(tags)}&match=any", None),
+        ]
+
+    link = Link.objects.filter(user=user).first()
+    if link:
+        word = (link.title.split() or ["example"])[0]
+        endpoints += [
+            ("domain", "get", f"/?domain={link.domain()}", None),
+            ("date", "get", f"/?date={link.added.date()}", None),
+            ("q", "get", f"/?q={word}", None),
+            ("q_json", "get", f"/?q={word}&json", None),
+            ("api_link", "get", f"/api/{link.pk}/", None),
+            (
+                "api_link_screenshot",
+                "post",
+                f"/api/{link.pk}/",
+                lambda i: json.dumps({"screenshot_url": f"{BENCHMARK_PREFIX}screenshots/{i}.png"}),
+            ),
+        ]
+
+    return endpoints + [
+        ("add_form", "get", "/add/", None),
+        ("add", "post", "/add/", lambda i: {"url": f"{BENCHMARK_PREFIX}add/{i}", "title": "Added", "tags": "bench"}),
+    ]
+
+
+# measured as the throwaway user from `fake_upstreams`
+IMPORT_ENDPOINTS = [
+    ("import_github", "post", "/import/github/", None),
+    ("import_feedbin", "post", "/import/feedbin/", None),
+    ("import_hackernews", "post", "/import/hackernews/", None),
+]
+
+Response = namedtuple("Response", "status_code")
+
+
+class NoRedirects(HTTPRedirectHandler):
+    # like the test Client, a redirect is the response
+    def redirect_request(self, *args):
+        return None
+
+
+class HttpClient:
+    # the test Client's get and post, sent over HTTP to a running server with the user's session
+    def __init__(self, url, session_key):
+        self.url = url.rstrip("/")
+        self.opener = build_opener(NoRedirects)
+
+        # any 32 character secret works as a CSRF token, as long as the cookie and header match
+        csrf_token = get_random_string(32)
+        self.headers = {
+            "Cookie": f"{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}",
+            "X-CSRFToken": csrf_token,
+            "Referer": f"{self.url}/",
+        }
+
+    def request(self, method, path, data=None, content_type=None):
+        headers = dict(self.headers)
+        if isinstance(data, dict):
+            data, headers["Content-Type"] = urlencode(data), "application/x-www-form-urlencoded"
+        elif data is not None:
+            headers["Content-Type"] = content_type
+
+        request = Request(
+            self.url + path, data=data.encode() if data is not None else None, headers=headers, method=method.upper()
+        )
+        try:
+            with self.opener.open(request, timeout=60) as response:  # nosec - the url is the server being measured
+                response.read()
+                return Response(response.status)
+        except HTTPError as e:
+            e.read()
+            return Response(e.code)
+
+    def get(self, path, data=None):
+        return self.request("get", path)
+
+    def post(self, path, data=None, content_type=None):
+        return self.request("post", path, data if data is not None else {}, content_type)
+
+
+@contextmanager
+def local_clients(user):
+    def client():
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[-1], raise_request_exception=False)
+        client.force_login(user)
+        return client
+
+    yield client
+
+
+@contextmanager
+def http_clients(user, url):
+    # one session for every worker, logged out afterwards
+    session = Client()
+    session.force_login(user)
+
+    try:
+        yield lambda: HttpClient(url, session.session.session_key)
+    finally:
+        session.logout()
+
+
+def percentiles(timings):
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+    }
+
+
+def measure(clients, endpoint, requests, concurrency):
+    name, method, path, body = endpoint
+    counter = itertools.count()
+    results = []
+
+    def worker():
+        client = clients()
+
+        if method == "get":
+            client.get(path)  # warm up the connection and the user's cache
+
+        while (i := next(counter)) < requests:
+            data = body(i) if body else None
+            kwargs = {"content_type": "application/json"} if isinstance(data, str) else {}
+
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, **kwargs)
+            results.append((time.perf_counter() - start, response.status_code))
+
+    def threaded_worker():
+        try:
+            worker()
+        finally:
+            connections.close_all()
+
+    start = time.perf_counter()
+
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=threaded_worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - start
+    timings = [timing for timing, status in results]
+
+    return timings, {
+        "name": name,
+        "method": method.upper(),
+        "path": path,
+        "requests": len(results),
+        "errors": sum(1 for timing, status in results if status >= 400),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2),
+        **percentiles(timings),
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(  # nosec - fixed command
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = "Measure latency and throughput for a user, run with different settings or commits to compare them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", type=str)
+        parser.add_argument("--path", type=str, action="append", help="GET this path (repeatable, default: /)")
+        parser.add_argument("--suite", action="store_true", help="every main endpoint, including imports")
+        parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument(
+            "--url", type=str, help="send the requests over HTTP to the server running here (the imports are skipped)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["email"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist")
+
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2 to calculate percentiles")
+
+        if (
+            not options["url"]
+            and options["concurrency"] > 1
+            and connection.vendor == "sqlite"
+            and connection.is_in_memory_db()
+        ):
+            raise CommandError("--concurrency needs a database that's shared between threads")
+
+        endpoints = [(path, "get", path, None) for path in options["path"] or []]
+        if options["suite"]:
+            endpoints += suite(user)
+
+        def make_clients(user):
+            return http_clients(user, options["url"]) if options["url"] else local_clients(user)
+
+        results, timings = [], []
+
+        def run(clients, endpoints):
+            for endpoint in endpoints:
+                endpoint_timings, result = measure(clients, endpoint, options["requests"], options["concurrency"])
+                timings.extend(endpoint_timings)
+                results.append(result)
+
+        try:
+            with make_clients(user) as user_clients:
+                run(user_clients, endpoints or [("/", "get", "/", None)])
+
+            # the server's importers can't be pointed at the fake upstreams
+            if options["suite"] and not options["url"]:
+                with fake_upstreams() as importer, make_clients(importer) as importer_clients:
+                    run(importer_clients, IMPORT_ENDPOINTS)
+        finally:
+            Link.objects.filter(user=user, url__startswith=BENCHMARK_PREFIX).delete()
+            LinkScreenshot.objects.filter(link__user=user, url__startswith=BENCHMARK_PREFIX).delete()
+
+        summary = {
+            "commit": git_commit(),
+            "database": connection.vendor,
+            "url": options["url"],
+            "links": Link.objects.filter(user=user).count(),
+            "concurrency": options["concurrency"],
+            "requests": options["requests"],
+            "throughput_rps": round(len(timings) / sum(result["seconds"] for result in results), 2),
+            **percentiles(timings),
+            "endpoints": results,
+        }
+        self.stdout.write(json.dumps(summary, indent=2))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from links.duplicates import update_pending_signatures
+from links.models import Link
+
+
+class Command(BaseCommand):
+    help = "Compute the similarity signatures used to find duplicate links, for new links or --all of them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="recompute existing signatures too")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            Link.all_objects.update(simhash=None)
+
+        count = update_pending_signatures()
+        self.stdout.write(f"Computed signatures for {count} links")
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authuser.models import User
+from links.bulk import empty_trash
+
+
+class Command(BaseCommand):
+    help = "Permanently delete links that have been in the trash for more than --days"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        count = 0
+
+        for user in User.objects.filter(link__deleted__lt=before).distinct():
+            count += empty_trash(user, before=before)
+
+        self.stdout.write(f"Deleted {count} links from the trash")
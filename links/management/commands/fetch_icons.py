@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from links.icons import fetch_icon, missing_domains
+
+
+class Command(BaseCommand):
+    help = "Fetch and store the favicon for any bookmarked domain that doesn't have one yet"
+
+    def handle(self, *args, **options):
+        domains = missing_domains()
+
+        for domain in domains:
+            favicon = fetch_icon(domain)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{domain}: {favicon.digest or 'not found'}")
+
+        self.stdout.write(f"Fetched icons for {len(domains)} domains")
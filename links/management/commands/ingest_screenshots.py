@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from links.screenshots import ingest_screenshot, pending_screenshots
+
+
+class Command(BaseCommand):
+    help = "Download new screenshots into local storage and generate their thumbnails"
+
+    def handle(self, *args, **options):
+        count = 0
+
+        for screenshot in pending_screenshots().iterator():
+            ingest_screenshot(screenshot)
+            count += 1
+
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{screenshot.url}: {screenshot.digest or 'failed'}")
+
+        self.stdout.write(f"Ingested {count} screenshots")
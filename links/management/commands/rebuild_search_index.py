@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from links.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from each link's latest archived page"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(f"Indexed {count} archived pages")
@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from links.cache import invalidate
+from links.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recount the daily and domain stats for every user from their links"
+
+    def handle(self, *args, **options):
+        count = 0
+        for user in get_user_model().objects.all():
+            count += rebuild_stats(user)
+            invalidate(user.id)
+
+        self.stdout.write(f"Counted {count} links")
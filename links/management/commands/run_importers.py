@@ -0,0 +1,42 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from links.scheduler import (
+    IMPORT_CONCURRENCY,
+    Limits,
+    run_due_imports,
+    run_scheduler,
+    schedule_imports,
+)
+
+
+class Command(BaseCommand):
+    help = "Import stars and favourites for every user with credentials on a schedule, or the ones that are due --once"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="run the imports that are due and exit (e.g. from cron)"
+        )
+        parser.add_argument("--concurrency", type=int, default=IMPORT_CONCURRENCY, help="imports to run at once")
+
+    def report(self, scheduled, count, error):
+        if error:
+            self.stderr.write(f"{scheduled}: {error}")
+        else:
+            self.stdout.write(f"{scheduled}: imported {count} links")
+
+    async def run_once(self, concurrency):
+        await sync_to_async(schedule_imports)()
+        results = await run_due_imports(Limits(concurrency))
+        for result in results:
+            self.report(*result)
+        return len(results)
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            count = asyncio.run(self.run_once(options["concurrency"]))
+            self.stdout.write(f"Ran {count} imports")
+        else:
+            asyncio.run(run_scheduler(self.report, options["concurrency"]))
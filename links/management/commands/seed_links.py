@@ -0,0 +1,127 @@
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag
+
+from authuser.models import User
+from links.cache import invalidate
+from links.models import Link, LinkScreenshot, LinkTag
+from links.tags import rebuild_tag_counts
+
+"""
+Seeds a synthetic user with links, tags and screenshots for the `benchmark` command
+
+Usage:
+    ./manage.py seed_links 10k 100k 1m [--seed=<n>]
+
+Each size creates bench-<size>@example.org. The same seed always generates the same data.
+"""
+
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+BATCH_SIZE = 5000
+
+WORDS = (
+    "python django postgres sqlite async cache index query search design css html javascript rust go linux "
+    "security privacy performance database web api http browser testing deploy nginx docker kubernetes cloud "
+    "machine learning data science music books history science climate energy economics writing typography "
+    "photography travel food coffee cycling running health startup product management open source hardware"
+).split()
+
+DOMAINS = [f"{word}.example.{tld}" for word in WORDS for tld in ("com", "org", "net")]
+
+
+def email_for(size):
+    return f"bench-{size}@example.org"
+
+
+def zipf_choice(rng, population):
+    # a few tags and domains are very common and most are rare, like real bookmarks
+    return population[min(int(rng.paretovariate(1.2)) - 1, len(population) - 1)]
+
+
+@contextmanager
+def backdating():
+    # bulk_create always sets auto_now(_add) fields to now, seeded links are spread over years
+    fields = [Link._meta.get_field("added"), Link._meta.get_field("updated")]
+    try:
+        for field in fields:
+            field.auto_now = field.auto_now_add = False
+        yield
+    finally:
+        fields[0].auto_now_add = True
+        fields[1].auto_now = True
+
+
+def seed_user(user, count, rng):
+    now = timezone.now()
+    tags = {
+        slug: Tag.objects.get_or_create(slug=slug, defaults={"name": slug})[0].id
+        for slug in dict.fromkeys(slugify(f"{a}-{b}") if a != b else a for a in WORDS for b in WORDS[:12])
+    }
+    tag_ids = list(tags.values())
+    rng.shuffle(tag_ids)
+
+    for start in range(0, count, BATCH_SIZE):
+        links, link_tags, screenshots = [], [], []
+
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            added = now - timedelta(seconds=(count - i) * 3600 * 24 * 365 * 5 // count)
+            words = rng.sample(WORDS, rng.randint(2, 8))
+            link = Link(
+                id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                user=user,
+                url=f"https://{zipf_choice(rng, DOMAINS)}/{'-'.join(words)}/{i}",
+                title=" ".join(words).capitalize(),
+                note=" ".join(rng.choices(WORDS, k=rng.randint(0, 30))),
+                added=added,
+                updated=added,
+                random_key=rng.random(),
+            )
+            links.append(link)
+
+            for tag_id in {zipf_choice(rng, tag_ids) for _ in range(rng.randint(0, 5))}:
+                link_tags.append(LinkTag(content_object=link, tag_id=tag_id))
+
+            if rng.random() < 0.2:
+                for n in range(rng.randint(1, 3)):
+                    screenshots.append(
+                        LinkScreenshot(link=link, url=f"https://screenshots.example.org/{link.id}/{n}.png")
+                    )
+
+        with transaction.atomic(), backdating():
+            Link.objects.bulk_create(links)
+            LinkTag.objects.bulk_create(link_tags)
+            LinkScreenshot.objects.bulk_create(screenshots)
+
+    rebuild_tag_counts(user.id)
+    invalidate(user.id)
+
+
+class Command(BaseCommand):
+    help = "Seed synthetic benchmark users with 10k, 100k or 1m links"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sizes", nargs="+", choices=SIZES)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        for size in options["sizes"]:
+            user, _ = User.objects.get_or_create(email=email_for(size))
+            existing = Link.objects.filter(user=user).count()
+
+            if existing == SIZES[size]:
+                self.stdout.write(f"{user.email} already has {existing} links")
+                continue
+            elif existing:
+                raise CommandError(f"{user.email} has {existing} links, delete the user to seed it again")
+
+            seed_user(user, SIZES[size], random.Random(f"{options['seed']}:{size}"))  # nosec - not security sensitive
+            self.stdout.write(f"Seeded {user.email} with {SIZES[size]} links")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from links.models import Link, UserTagTokenCount, UserTokenCount
+from links.suggestions import update_pending_suggestions
+
+
+class Command(BaseCommand):
+    help = "Train the tag suggestion model on links that have changed, or retrain it from --all links"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="discard the model and retrain it from every link")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            UserTokenCount.objects.all().delete()
+            UserTagTokenCount.objects.all().delete()
+            Link.all_objects.update(suggestion_features=None, suggestions_updated=None)
+
+        count = update_pending_suggestions()
+        self.stdout.write(f"Trained tag suggestions on {count} links")
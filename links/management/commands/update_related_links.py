@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from links.models import Link
+from links.related import update_pending_related
+
+
+class Command(BaseCommand):
+    help = "Update the related links of links whose tags have changed, or of --all links"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="recompute every link's related links")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            Link.all_objects.update(related_updated=None)
+
+        count = update_pending_related()
+        self.stdout.write(f"Updated related links for {count} links")
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("links", "0006_alter_linkscreenshot_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Favicon",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("domain", models.CharField(max_length=255, unique=True)),
+                ("digest", models.CharField(blank=True, db_index=True, max_length=64)),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                ("fetched", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
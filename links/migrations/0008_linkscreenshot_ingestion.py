@@ -0,0 +1,48 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("links", "0007_favicon"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="content_type",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="digest",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="height",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="ingested",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="thumbnail_digest",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="webp_digest",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="linkscreenshot",
+            name="width",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_tag_counts(apps, schema_editor):
+    Link = apps.get_model("links", "Link")
+    UUIDTaggedItem = apps.get_model("links", "UUIDTaggedItem")
+    UserTagCount = apps.get_model("links", "UserTagCount")
+
+    links = Link.objects.filter(user__isnull=False)
+    users = dict(links.values_list("id", "user_id"))
+    counts = {}
+
+    for object_id, tag_id in UUIDTaggedItem.objects.filter(object_id__in=links.values("id")).values_list(
+        "object_id", "tag_id"
+    ):
+        key = (users[object_id], tag_id)
+        counts[key] = counts.get(key, 0) + 1
+
+    UserTagCount.objects.bulk_create(
+        [UserTagCount(user_id=user_id, tag_id=tag_id, count=count) for (user_id, tag_id), count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("taggit", "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("links", "0008_linkscreenshot_ingestion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserTagCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("tag", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="taggit.tag")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "-count"], name="links_usert_user_id_a4c4c7_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="usertagcount",
+            constraint=models.UniqueConstraint(fields=("user", "tag"), name="unique_user_tag_count"),
+        ),
+        migrations.RunPython(populate_tag_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:03
+
+import django.db.models.deletion
+import taggit.managers
+from django.db import migrations, models
+
+
+def copy_tagged_items(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Link = apps.get_model("links", "Link")
+    LinkTag = apps.get_model("links", "LinkTag")
+    UUIDTaggedItem = apps.get_model("links", "UUIDTaggedItem")
+
+    content_type = ContentType.objects.filter(app_label="links", model="link").first()
+    if not content_type:
+        return
+
+    items = UUIDTaggedItem.objects.filter(content_type=content_type, object_id__in=Link.objects.values("id"))
+
+    LinkTag.objects.bulk_create(
+        (
+            LinkTag(content_object_id=object_id, tag_id=tag_id)
+            for object_id, tag_id in items.values_list("object_id", "tag_id").iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def copy_link_tags(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    LinkTag = apps.get_model("links", "LinkTag")
+    UUIDTaggedItem = apps.get_model("links", "UUIDTaggedItem")
+
+    content_type, _ = ContentType.objects.get_or_create(app_label="links", model="link")
+
+    UUIDTaggedItem.objects.bulk_create(
+        (
+            UUIDTaggedItem(content_type=content_type, object_id=object_id, tag_id=tag_id)
+            for object_id, tag_id in LinkTag.objects.values_list("content_object_id", "tag_id").iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("taggit", "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx"),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("links", "0009_usertagcount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LinkTag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "content_object",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="tagged_items", to="links.link"
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="%(app_label)s_%(class)s_items",
+                        to="taggit.tag",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Tag",
+                "verbose_name_plural": "Tags",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="linktag",
+            index=models.Index(fields=["tag", "content_object"], name="links_linkt_tag_id_891d48_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="linktag",
+            constraint=models.UniqueConstraint(fields=("content_object", "tag"), name="unique_link_tag"),
+        ),
+        migrations.RunPython(copy_tagged_items, copy_link_tags),
+        migrations.AlterField(
+            model_name="link",
+            name="tags",
+            field=taggit.managers.TaggableManager(
+                blank=True,
+                help_text="A comma-separated list of tags.",
+                through="links.LinkTag",
+                to="taggit.Tag",
+                verbose_name="Tags",
+            ),
+        ),
+        migrations.DeleteModel(
+            name="UUIDTaggedItem",
+        ),
+    ]
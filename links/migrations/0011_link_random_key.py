@@ -0,0 +1,40 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:04
+
+from django.db import migrations, models
+
+import links.models
+
+
+def populate_random_keys(apps, schema_editor):
+    # AddField evaluates the default once, give every existing link its own key
+    Link = apps.get_model("links", "Link")
+
+    batch = []
+    for link in Link.objects.only("id").iterator():
+        link.random_key = links.models.random_key()
+        batch.append(link)
+
+        if len(batch) >= 1000:
+            Link.objects.bulk_update(batch, ["random_key"])
+            batch = []
+
+    Link.objects.bulk_update(batch, ["random_key"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0010_linktag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="random_key",
+            field=models.FloatField(default=links.models.random_key),
+        ),
+        migrations.RunPython(populate_random_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="link",
+            index=models.Index(fields=["user", "random_key"], name="links_link_user_id_4ba379_idx"),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0011_link_random_key"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="link",
+            index=models.Index(fields=["user", "-added"], name="links_link_user_id_e1dbe8_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0012_link_user_added_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="deleted",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:38
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0013_link_deleted"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LinkSnapshot",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("fetched", models.DateTimeField()),
+                ("url", models.URLField(blank=True, max_length=2000)),
+                ("status", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                ("error", models.CharField(blank=True, max_length=200)),
+                ("title", models.CharField(blank=True, max_length=1000)),
+                ("text_chunks", models.TextField(blank=True)),
+                ("text_size", models.PositiveIntegerField(default=0)),
+                ("html_chunks", models.TextField(blank=True)),
+                ("html_size", models.PositiveIntegerField(default=0)),
+                (
+                    "link",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="snapshots", to="links.link"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-fetched"],
+                "indexes": [models.Index(fields=["link", "-fetched"], name="links_links_link_id_9a0502_idx")],
+            },
+        ),
+    ]
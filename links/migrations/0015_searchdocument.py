@@ -0,0 +1,73 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The full-text index over SearchDocument, which the database keeps up to date itself.
+# sqlite: an external content FTS5 table (only the index, the text stays in
+# links_searchdocument) kept in sync by triggers.
+# postgres: a generated tsvector column with a GIN index.
+
+SEARCH_INDEX_SQL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE links_search USING fts5(title, text, content='links_searchdocument', "
+        "content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER links_search_insert AFTER INSERT ON links_searchdocument BEGIN "
+        "INSERT INTO links_search(rowid, title, text) VALUES (new.id, new.title, new.text); END",
+        "CREATE TRIGGER links_search_delete AFTER DELETE ON links_searchdocument BEGIN "
+        "INSERT INTO links_search(links_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text); END",
+        "CREATE TRIGGER links_search_update AFTER UPDATE ON links_searchdocument BEGIN "
+        "INSERT INTO links_search(links_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text); "
+        "INSERT INTO links_search(rowid, title, text) VALUES (new.id, new.title, new.text); END",
+    ],
+    "postgresql": [
+        "ALTER TABLE links_searchdocument ADD COLUMN document tsvector GENERATED ALWAYS AS "
+        "(setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', text), 'B')) STORED",
+        "CREATE INDEX links_searchdocument_document ON links_searchdocument USING gin(document)",
+    ],
+}
+
+DROP_SEARCH_INDEX_SQL = {
+    "sqlite": [
+        "DROP TRIGGER links_search_insert",
+        "DROP TRIGGER links_search_delete",
+        "DROP TRIGGER links_search_update",
+        "DROP TABLE links_search",
+    ],
+    "postgresql": ["ALTER TABLE links_searchdocument DROP COLUMN document"],
+}
+
+
+def create_search_index(apps, schema_editor):
+    # other databases fall back to searching the URL, title and tags
+    for sql in SEARCH_INDEX_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in DROP_SEARCH_INDEX_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0014_linksnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("title", models.CharField(blank=True, max_length=1000)),
+                ("text", models.TextField(blank=True)),
+                (
+                    "link",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="search_document", to="links.link"
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
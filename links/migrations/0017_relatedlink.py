@@ -0,0 +1,39 @@
+# Generated by Django 4.2.8 on 2026-10-19 14:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0016_link_simhash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="related_updated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="RelatedLink",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.FloatField()),
+                (
+                    "link",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="related_links", to="links.link"
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="links.link"),
+                ),
+            ],
+            options={
+                "ordering": ["-score"],
+                "indexes": [models.Index(fields=["link", "-score"], name="links_relat_link_id_6272f4_idx")],
+            },
+        ),
+    ]
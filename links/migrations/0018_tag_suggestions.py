@@ -0,0 +1,71 @@
+# Generated by Django 4.2.8 on 2026-10-19 14:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("taggit", "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx"),
+        ("links", "0017_relatedlink"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserTagTokenCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("token", models.IntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserTokenCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("token", models.IntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="suggestion_features",
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="suggestions_updated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="link",
+            index=models.Index(
+                condition=models.Q(("suggestions_updated", None)), fields=["user"], name="links_suggestions_pending"
+            ),
+        ),
+        migrations.AddField(
+            model_name="usertokencount",
+            name="user",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name="usertagtokencount",
+            name="tag",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="taggit.tag"),
+        ),
+        migrations.AddField(
+            model_name="usertagtokencount",
+            name="user",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name="usertokencount",
+            constraint=models.UniqueConstraint(fields=("user", "token"), name="unique_user_token_count"),
+        ),
+        migrations.AddConstraint(
+            model_name="usertagtokencount",
+            constraint=models.UniqueConstraint(fields=("user", "token", "tag"), name="unique_user_tag_token_count"),
+        ),
+    ]
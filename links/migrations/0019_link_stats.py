@@ -0,0 +1,71 @@
+# Generated by Django 4.2.8 on 2026-10-19 14:20
+
+from urllib.parse import urlsplit
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_link_stats(apps, schema_editor):
+    Link = apps.get_model("links", "Link")
+    DailyLinkCount = apps.get_model("links", "DailyLinkCount")
+    DomainLinkCount = apps.get_model("links", "DomainLinkCount")
+
+    days, domains = {}, {}
+    links = Link.objects.filter(user__isnull=False, deleted=None).values_list("user_id", "added", "url")
+
+    for user_id, added, url in links.iterator():
+        day, domain = (user_id, timezone.localdate(added)), (user_id, urlsplit(url).netloc.lower()[:255])
+        days[day] = days.get(day, 0) + 1
+        domains[domain] = domains.get(domain, 0) + 1
+
+    DailyLinkCount.objects.bulk_create(
+        [DailyLinkCount(user_id=user_id, day=day, count=count) for (user_id, day), count in days.items()],
+        batch_size=1000,
+    )
+    DomainLinkCount.objects.bulk_create(
+        [DomainLinkCount(user_id=user_id, domain=domain, count=count) for (user_id, domain), count in domains.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("links", "0018_tag_suggestions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyLinkCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DomainLinkCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("domain", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "-count"], name="links_domai_user_id_2851a5_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="domainlinkcount",
+            constraint=models.UniqueConstraint(fields=("user", "domain"), name="unique_domain_link_count"),
+        ),
+        migrations.AddConstraint(
+            model_name="dailylinkcount",
+            constraint=models.UniqueConstraint(fields=("user", "day"), name="unique_daily_link_count"),
+        ),
+        migrations.RunPython(populate_link_stats, migrations.RunPython.noop),
+    ]
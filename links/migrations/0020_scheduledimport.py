@@ -0,0 +1,35 @@
+# Generated by Django 4.2.8 on 2026-10-19 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("links", "0019_link_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduledImport",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("source", models.CharField(max_length=20)),
+                ("next_run", models.DateTimeField()),
+                ("last_run", models.DateTimeField(blank=True, null=True)),
+                ("last_count", models.PositiveIntegerField(blank=True, null=True)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("error", models.CharField(blank=True, max_length=200)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["next_run"], name="links_sched_next_ru_e523e7_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="scheduledimport",
+            constraint=models.UniqueConstraint(fields=("user", "source"), name="unique_scheduled_import"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.8 on 2026-10-19 16:05
+
+from importlib import import_module
+
+from django.db import migrations
+
+# Stops storing the text of archived pages in links_searchdocument, it's already in the
+# snapshot's blobs and only the index is needed to search it.
+# sqlite: a contentless FTS5 table that `links.search` inserts into, instead of the
+# external content table kept in sync with the text by triggers.
+# postgres: a tsvector column that `links.search` sets, instead of one generated from the text.
+
+search_document = import_module("links.migrations.0015_searchdocument")
+
+CONTENTLESS_INDEX_SQL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE links_search USING fts5(title, text, content='', "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        "INSERT INTO links_search(rowid, title, text) SELECT id, title, text FROM links_searchdocument",
+    ],
+    "postgresql": [
+        "ALTER TABLE links_searchdocument ADD COLUMN document tsvector",
+        "UPDATE links_searchdocument SET document = "
+        "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', text), 'B')",
+        "CREATE INDEX links_searchdocument_document ON links_searchdocument USING gin(document)",
+    ],
+}
+
+DROP_CONTENTLESS_INDEX_SQL = {
+    "sqlite": ["DROP TABLE links_search"],
+    "postgresql": ["ALTER TABLE links_searchdocument DROP COLUMN document"],
+}
+
+
+def make_index_contentless(apps, schema_editor):
+    # indexes the stored text one last time before it's removed
+    vendor = schema_editor.connection.vendor
+    for sql in search_document.DROP_SEARCH_INDEX_SQL.get(vendor, []) + CONTENTLESS_INDEX_SQL.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def restore_index(apps, schema_editor):
+    # the text column comes back empty, run `rebuild_search_index` to fill it
+    vendor = schema_editor.connection.vendor
+    for sql in DROP_CONTENTLESS_INDEX_SQL.get(vendor, []) + search_document.SEARCH_INDEX_SQL.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("links", "0020_scheduledimport"),
+    ]
+
+    operations = [
+        migrations.RunPython(make_index_contentless, restore_index),
+        migrations.RemoveField(
+            model_name="searchdocument",
+            name="text",
+        ),
+    ]
@@ -1,20 +1,52 @@
+import random
 import uuid
 from urllib.parse import urlsplit
 
 from django.conf import settings
 from django.db import models
 from django.urls import reverse
-from taggit.managers import TaggableManager
-from taggit.models import GenericUUIDTaggedItemBase, TaggedItemBase
+from taggit.managers import TaggableManager, _TaggableManager
+from taggit.models import TaggedItemBase
 
+from links.blobs import blob_url, read_compressed_blob
+
+
+def random_key():
+    return random.random()  # nosec - only used to sample links
 
-class UUIDTaggedItem(GenericUUIDTaggedItemBase, TaggedItemBase):
-    # Required to support foreign key from Tag -> Link with UUID as the primary key
-    # https://github.com/jazzband/django-taggit/issues/679
+
+class LinkTag(TaggedItemBase):
+    # A direct foreign key to Link (rather than taggit's generic relation) so
+    # tag lookups don't have to go through the content types table
+    content_object = models.ForeignKey("Link", on_delete=models.CASCADE, related_name="tagged_items")
 
     class Meta:
         verbose_name = "Tag"
         verbose_name_plural = "Tags"
+        constraints = [models.UniqueConstraint(fields=["content_object", "tag"], name="unique_link_tag")]
+        indexes = [models.Index(fields=["tag", "content_object"])]
+
+
+class LinkTagManager(_TaggableManager):
+    # Some databases (sqlite) return the UUID foreign key as a string when prefetching,
+    # convert it back so the prefetched tags can be matched up with their links
+    # https://github.com/jazzband/django-taggit/issues/679
+    def get_prefetch_querysets(self, instances, querysets=None):
+        qs, rel_obj_attr, *rest = super().get_prefetch_querysets(instances, querysets)
+
+        def uuid_rel_obj_attr(obj):
+            value = rel_obj_attr(obj)
+            if value is not None and not isinstance(value, uuid.UUID):
+                value = uuid.UUID(str(value))
+            return value
+
+        return (qs, uuid_rel_obj_attr, *rest)
+
+
+class LinkManager(models.Manager):
+    # links in the trash are hidden everywhere except the trash itself, use `Link.all_objects` there
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=None)
 
 
 class Link(models.Model):
@@ -24,13 +56,41 @@ class Link(models.Model):
     url = models.URLField(max_length=2000)
     title = models.CharField(max_length=1000, default="", blank=True)
     note = models.TextField(default="", blank=True)
-    tags = TaggableManager(blank=True, through=UUIDTaggedItem)
+    tags = TaggableManager(blank=True, through=LinkTag, manager=LinkTagManager)
 
     added = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    # a uniformly distributed key so ?random can seek into an index instead of ORDER BY RANDOM()
+    random_key = models.FloatField(default=random_key)
+
+    # set when the link is moved to the trash by `links.bulk.trash_links`
+    deleted = models.DateTimeField(null=True, blank=True)
+
+    # a SimHash of the title and archived text for `links.duplicates`, null until it's computed
+    # and 0 when there isn't enough text to compare
+    simhash = models.BigIntegerField(null=True, blank=True)
+
+    # when `links.related` last computed the link's related links, null when they need to be (again)
+    related_updated = models.DateTimeField(null=True, blank=True)
+
+    # the tokens and tags the link last added to its user's `links.suggestions` model, so they
+    # can be taken out again when it changes, and when that was (null when it's changed since)
+    suggestion_features = models.TextField(null=True, blank=True)
+    suggestions_updated = models.DateTimeField(null=True, blank=True)
+
+    objects = LinkManager()
+    all_objects = models.Manager()
+
     class Meta:
         ordering = ["-added"]
+        indexes = [
+            models.Index(fields=["user", "-added"]),
+            models.Index(fields=["user", "random_key"]),
+            models.Index(
+                fields=["user"], condition=models.Q(suggestions_updated=None), name="links_suggestions_pending"
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -39,7 +99,11 @@ class Link(models.Model):
         return reverse("edit-link", kwargs={"pk": self.pk})
 
     def icon(self):
-        return f"https://icons.duckduckgo.com/ip3/{self.domain()}.ico"
+        # `icon_digest` is attached to a page of links by `links.icons.attach_icons`
+        digest = getattr(self, "icon_digest", None)
+        if digest:
+            return reverse("icon", kwargs={"digest": digest})
+        return reverse("domain-icon", kwargs={"domain": self.domain()})
 
     def domain(self):
         parts = urlsplit(self.url)
@@ -54,6 +118,7 @@ class Link(models.Model):
             "added": self.added.isoformat(),
             "updated": self.updated.isoformat(),
             "screenshots": [s.as_json() for s in self.linkscreenshot_set.all()],
+            "snapshots": [s.as_json() for s in self.snapshots.all()],
         }
 
 
@@ -63,20 +128,209 @@ class LinkScreenshot(models.Model):
     url = models.URLField(max_length=2000)
     added = models.DateTimeField(auto_now_add=True)
 
+    # populated by `links.screenshots.ingest_screenshot`, all digests reference
+    # content-addressed files in `links.blobs`
+    digest = models.CharField(max_length=64, blank=True, db_index=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_digest = models.CharField(max_length=64, blank=True)
+    webp_digest = models.CharField(max_length=64, blank=True)
+    ingested = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ["-added"]
 
     def get_absolute_url(self):
         return reverse("screenshot", kwargs={"pk": self.pk})
 
+    def image_url(self):
+        if self.webp_digest:
+            return blob_url(self.webp_digest, ".webp")
+        return self.url
+
+    def thumbnail_url(self):
+        if self.thumbnail_digest:
+            return blob_url(self.thumbnail_digest, ".webp")
+        return None
+
     def as_json(self):
         return {
             "id": str(self.id),
             "url": self.url,
+            "image": self.image_url(),
+            "thumbnail": self.thumbnail_url(),
             "added": self.added.isoformat(),
         }
 
 
+class LinkSnapshot(models.Model):
+    # an archived copy of the page, created by `links.archive.archive_link`
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    link = models.ForeignKey("Link", on_delete=models.CASCADE, related_name="snapshots")
+    fetched = models.DateTimeField()
+
+    url = models.URLField(max_length=2000, blank=True)  # after redirects
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    error = models.CharField(max_length=200, blank=True)
+    title = models.CharField(max_length=1000, blank=True)
+
+    # space separated references to compressed, content-defined chunks in `links.blobs`
+    text_chunks = models.TextField(blank=True)
+    text_size = models.PositiveIntegerField(default=0)
+    html_chunks = models.TextField(blank=True)
+    html_size = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-fetched"]
+        indexes = [models.Index(fields=["link", "-fetched"])]
+
+    def get_absolute_url(self):
+        return reverse("snapshot", kwargs={"pk": self.pk})
+
+    def stream_text(self):
+        # one chunk in memory at a time
+        for ref in self.text_chunks.split():
+            yield read_compressed_blob(ref)
+
+    def stream_html(self):
+        for ref in self.html_chunks.split():
+            yield read_compressed_blob(ref)
+
+    def text(self):
+        return b"".join(self.stream_text()).decode()
+
+    def as_json(self):
+        return {
+            "id": str(self.id),
+            "url": self.url,
+            "title": self.title,
+            "fetched": self.fetched.isoformat(),
+            "archive": self.get_absolute_url() if self.text_chunks else None,
+        }
+
+
+class SearchDocument(models.Model):
+    # the link's latest archived page in the search index, `links.search` indexes its text
+    # without storing it here
+    link = models.OneToOneField("Link", on_delete=models.CASCADE, related_name="search_document")
+    title = models.CharField(max_length=1000, blank=True)
+
+
+class RelatedLink(models.Model):
+    # one of a link's most related links, computed by `links.related`
+    link = models.ForeignKey("Link", on_delete=models.CASCADE, related_name="related_links")
+    related = models.ForeignKey("Link", on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["-score"]
+        indexes = [models.Index(fields=["link", "-score"])]
+
+    def as_json(self):
+        return {
+            "id": str(self.related.id),
+            "url": self.related.url,
+            "title": self.related.title,
+            "score": round(self.score, 3),
+        }
+
+
+class SimhashBand(models.Model):
+    # a part of a link's simhash, links that share one are candidate duplicates
+    link = models.ForeignKey("Link", on_delete=models.CASCADE, related_name="simhash_bands")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "key"])]
+
+
+class Favicon(models.Model):
+    domain = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, blank=True, db_index=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    fetched = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.domain
+
+
+class UserTagCount(models.Model):
+    # kept up to date by the signal handlers in `links.signals`
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    tag = models.ForeignKey("taggit.Tag", on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "tag"], name="unique_user_tag_count")]
+        indexes = [models.Index(fields=["user", "-count"])]
+
+    def __str__(self):
+        return f"{self.tag} ({self.count})"
+
+
+class DailyLinkCount(models.Model):
+    # the number of the user's links (not in the trash) added each day, kept up to date by
+    # `links.stats` so the stats page doesn't have to count the links themselves
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "day"], name="unique_daily_link_count")]
+
+
+class DomainLinkCount(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    domain = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "domain"], name="unique_domain_link_count")]
+        indexes = [models.Index(fields=["user", "-count"])]
+
+
+class UserTokenCount(models.Model):
+    # the number of the user's links with a (hashed) token, for `links.suggestions`
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    token = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "token"], name="unique_user_token_count")]
+
+
+class UserTagTokenCount(models.Model):
+    # the number of the user's links with both a tag and a token
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    tag = models.ForeignKey("taggit.Tag", on_delete=models.CASCADE)
+    token = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "token", "tag"], name="unique_user_tag_token_count")]
+
+
+class ScheduledImport(models.Model):
+    # when `links.scheduler` next imports from one of the user's sources, and how the last import went
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    source = models.CharField(max_length=20)  # a key of `links.importers.SOURCE_TAGS`
+    next_run = models.DateTimeField()
+    last_run = models.DateTimeField(null=True, blank=True)
+    last_count = models.PositiveIntegerField(null=True, blank=True)
+    failures = models.PositiveIntegerField(default=0)  # in a row, each one doubles the interval
+    error = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "source"], name="unique_scheduled_import")]
+        indexes = [models.Index(fields=["next_run"])]
+
+    def __str__(self):
+        return f"{self.source} for {self.user}"
+
+
 class UserSettings(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     github_pat = models.CharField(
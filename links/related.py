@@ -0,0 +1,113 @@
+import heapq
+import math
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from links.models import Link, LinkTag, RelatedLink, UserTagCount
+
+# Related links, from the tags they share and their domain.
+#
+# Each link's most related links are stored as RelatedLink rows, so showing them is one
+# indexed lookup. Two links score the sum of the inverse document frequency of each tag
+# they share (a rare tag says more than a common one), plus a bonus for the same domain.
+# Tags on more than RELATED_MAX_TAG_LINKS of a user's links are ignored, which keeps
+# the work for each link bounded however many links there are.
+#
+# Changing a link's tags marks it, and the links that list it, as stale. The edit view
+# refreshes them straight away and `manage.py update_related_links` catches up the rest.
+
+RELATED_LIMIT = 10
+RELATED_MAX_TAG_LINKS = 1000
+RELATED_DOMAIN_WEIGHT = 1.0
+RELATED_CHUNK_SIZE = 500
+
+
+def update_related(link_ids):
+    links = Link.all_objects.filter(id__in=link_ids, deleted=None).exclude(user=None)
+    by_user = defaultdict(list)
+    for link_id, user_id in links.values_list("id", "user_id"):
+        by_user[user_id].append(link_id)
+
+    rows = []
+    for user_id, ids in by_user.items():
+        rows += related_rows(user_id, ids)
+
+    with transaction.atomic():
+        RelatedLink.objects.filter(link_id__in=link_ids).delete()
+        RelatedLink.objects.bulk_create(rows)
+        Link.all_objects.filter(id__in=link_ids).update(related_updated=timezone.now())
+
+    return len(link_ids)
+
+
+def related_rows(user_id, link_ids):
+    total = Link.objects.filter(user_id=user_id).count()
+
+    tagged = LinkTag.objects.filter(content_object_id__in=link_ids)
+    counts = dict(
+        UserTagCount.objects.filter(
+            user_id=user_id, tag_id__in=tagged.values("tag_id"), count__lte=RELATED_MAX_TAG_LINKS
+        ).values_list("tag_id", "count")
+    )
+    weights = {tag_id: math.log((total + 1) / count) for tag_id, count in counts.items()}
+
+    # every active link of the user's with one of those tags, at most RELATED_MAX_TAG_LINKS per tag
+    postings, domains = defaultdict(list), {}
+    for tag_id, link_id, url in LinkTag.objects.filter(
+        tag_id__in=list(counts), content_object__user_id=user_id, content_object__deleted=None
+    ).values_list("tag_id", "content_object_id", "content_object__url"):
+        postings[tag_id].append(link_id)
+        domains[link_id] = urlsplit(url).netloc
+
+    link_tags = defaultdict(list)
+    for link_id, tag_id in tagged.filter(tag_id__in=list(counts)).values_list("content_object_id", "tag_id"):
+        link_tags[link_id].append(tag_id)
+
+    rows = []
+    for link_id, tag_ids in link_tags.items():
+        scores = defaultdict(float)
+        for tag_id in tag_ids:
+            for other_id in postings[tag_id]:
+                scores[other_id] += weights[tag_id]
+
+        scores.pop(link_id, None)
+        for other_id in scores:
+            if domains[other_id] == domains[link_id]:
+                scores[other_id] += RELATED_DOMAIN_WEIGHT
+
+        best = heapq.nlargest(RELATED_LIMIT, scores.items(), key=lambda item: item[1])
+        rows += [
+            RelatedLink(link_id=link_id, related_id=other_id, score=score) for other_id, score in best if score > 0
+        ]
+
+    return rows
+
+
+def update_pending_related():
+    count = 0
+    pending = Link.all_objects.filter(related_updated=None)
+    while chunk := list(pending.values_list("id", flat=True)[:RELATED_CHUNK_SIZE]):
+        count += update_related(chunk)
+    return count
+
+
+def mark_related_stale(link_ids):
+    # the links themselves, and the links that currently list them
+    Link.all_objects.filter(Q(id__in=link_ids) | Q(related_links__related_id__in=link_ids)).update(related_updated=None)
+
+
+def refresh_related(link):
+    # the link's own list, then the lists it's in now or was in before, which are the
+    # ones most likely to change
+    listed_by = list(RelatedLink.objects.filter(related=link).values_list("link_id", flat=True))
+    update_related([link.pk])
+    neighbours = RelatedLink.objects.filter(link=link).values_list("related_id", flat=True)
+    update_related(list(set(listed_by) | set(neighbours)))
+
+
+def related_links(link):
+    return RelatedLink.objects.filter(link=link, related__deleted=None).select_related("related")[:RELATED_LIMIT]
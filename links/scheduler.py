@@ -0,0 +1,165 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+
+from links.importers import MissingCredentialException, feedbin, github, hackernews
+from links.models import ScheduledImport, UserSettings
+
+# Scheduled imports, so stars and favourites stay up to date without anyone pressing the
+# import buttons.
+#
+# Each source a user has credentials for is a ScheduledImport row with the time it's next
+# due, so a restart carries on where it left off rather than importing for everyone at
+# once. New rows are spread over the first interval and every run is moved by a little
+# jitter, so users drift apart instead of lining up. Imports that fail back off
+# exponentially, and ones whose credentials have been removed are unscheduled.
+#
+# The upstream APIs are protected by token buckets (one shared by every import and one for
+# each source) that limit how quickly imports start, and by caps on how many run at once.
+# The importers are the async ones the views use, so waiting on an upstream doesn't hold
+# a thread.
+
+IMPORT_INTERVAL = timedelta(hours=6)
+IMPORT_JITTER = 0.1  # each run is moved by up to this fraction of the interval
+IMPORT_MAX_INTERVAL = timedelta(days=7)  # the most that failures back off to
+IMPORT_POLL_SECONDS = 60
+IMPORT_BATCH_SIZE = 100
+IMPORT_CONCURRENCY = 4
+
+# (imports per second, burst) for every import together, and for each source
+IMPORT_RATE = (1.0, 5)
+SOURCE_RATES = {"github": (0.5, 2), "feedbin": (0.2, 2), "hackernews": (0.1, 1)}
+SOURCE_CONCURRENCY = {"github": 2, "feedbin": 1, "hackernews": 1}
+
+IMPORTERS = {
+    "github": github.aimport_stars,
+    "feedbin": feedbin.aimport_stars,
+    "hackernews": hackernews.aimport_favourites,
+}
+
+# the settings that each source needs
+CREDENTIALS = {
+    "github": ~Q(github_pat=""),
+    "feedbin": ~Q(feedbin_username="") & ~Q(feedbin_password=""),
+    "hackernews": ~Q(hn_username=""),
+}
+
+
+class TokenBucket:
+    # `rate` tokens a second up to `capacity`, there's only one event loop so taking a
+    # token doesn't need a lock
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate, self.capacity, self.clock = rate, capacity, clock
+        self.tokens, self.updated = capacity, clock()
+
+    def take(self):
+        # takes a token and returns 0, or returns how long until there is one
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while delay := self.take():
+            await asyncio.sleep(delay)
+
+
+class Limits:
+    def __init__(self, concurrency=IMPORT_CONCURRENCY):
+        self.rate = TokenBucket(*IMPORT_RATE)
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.source_rates = {source: TokenBucket(*rate) for source, rate in SOURCE_RATES.items()}
+        self.source_concurrency = {source: asyncio.Semaphore(n) for source, n in SOURCE_CONCURRENCY.items()}
+
+
+def next_run(now, failures=0):
+    interval = min(IMPORT_INTERVAL * 2**failures, IMPORT_MAX_INTERVAL)
+    return now + interval * random.uniform(1 - IMPORT_JITTER, 1 + IMPORT_JITTER)
+
+
+def schedule_imports():
+    # a row for each source with credentials that doesn't have one yet
+    now = timezone.now()
+    scheduled = set(ScheduledImport.objects.values_list("user_id", "source"))
+    new = [
+        ScheduledImport(user_id=user_id, source=source, next_run=now + IMPORT_INTERVAL * random.random())
+        for source, credentials in CREDENTIALS.items()
+        for user_id in UserSettings.objects.filter(credentials).values_list("user_id", flat=True)
+        if (user_id, source) not in scheduled
+    ]
+    ScheduledImport.objects.bulk_create(new, ignore_conflicts=True)
+    return len(new)
+
+
+def claim_due_imports(limit=IMPORT_BATCH_SIZE):
+    # moves each due import's next run on before it starts, so it isn't run twice by
+    # overlapping runners and a crash doesn't retry it straight away
+    now = timezone.now()
+    due = ScheduledImport.objects.filter(next_run__lte=now).select_related("user").order_by("next_run")
+    claimed = []
+
+    for scheduled in list(due[:limit]):
+        claimed_until = next_run(now, scheduled.failures)
+        unclaimed = ScheduledImport.objects.filter(pk=scheduled.pk, next_run=scheduled.next_run)
+        if unclaimed.update(next_run=claimed_until):
+            scheduled.next_run = claimed_until
+            claimed.append(scheduled)
+
+    return claimed
+
+
+def finish_import(scheduled, count=None, error=""):
+    scheduled.last_run = timezone.now()
+    scheduled.last_count = count
+    scheduled.error = error[:200]
+    scheduled.failures = scheduled.failures + 1 if error else 0
+    scheduled.next_run = next_run(scheduled.last_run, scheduled.failures)
+    scheduled.save(update_fields=["last_run", "last_count", "error", "failures", "next_run"])
+
+
+async def run_import(scheduled, limits):
+    # the source's limits first, so imports waiting on a busy source don't hold the shared ones
+    source = scheduled.source
+    async with limits.source_concurrency[source]:
+        await limits.source_rates[source].acquire()
+
+        async with limits.concurrency:
+            await limits.rate.acquire()
+
+            try:
+                count = await IMPORTERS[source](scheduled.user)
+            except (UserSettings.DoesNotExist, MissingCredentialException):
+                await sync_to_async(scheduled.delete)()
+                return scheduled, None, "unscheduled, the credentials have been removed"
+            except Exception as e:  # expired credentials or an upstream error, which can't stop the other imports
+                error = type(e).__name__ + (f": {e}" if str(e) else "")
+                await sync_to_async(finish_import)(scheduled, error=error)
+                return scheduled, None, error
+
+    await sync_to_async(finish_import)(scheduled, count)
+    return scheduled, count, ""
+
+
+async def run_due_imports(limits=None):
+    # (scheduled, count, error) for each import that was due
+    limits = limits or Limits()
+    due = await sync_to_async(claim_due_imports)()
+    return await asyncio.gather(*(run_import(scheduled, limits) for scheduled in due))
+
+
+async def run_scheduler(report=print, concurrency=IMPORT_CONCURRENCY):
+    limits = Limits(concurrency)
+    while True:
+        await sync_to_async(schedule_imports)()
+        for result in await run_due_imports(limits):
+            report(*result)
+        await asyncio.sleep(IMPORT_POLL_SECONDS)
@@ -0,0 +1,84 @@
+import io
+from urllib.request import Request, build_opener
+
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from links.blobs import open_blob, save_blob, save_blob_stream
+from links.models import LinkScreenshot
+from links.ssrf import SafeRedirectHandler, UnsafeRedirect, uri_is_safe
+
+SCREENSHOT_MAX_BYTES = 20 * 1024 * 1024
+SCREENSHOT_CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (320, 240)
+WEBP_MAX_WIDTH = 1280
+
+
+class ScreenshotTooLarge(Exception):
+    pass
+
+
+def stream(url):
+    request = Request(url, headers={"User-Agent": "bm2"})
+
+    with build_opener(SafeRedirectHandler).open(request, timeout=30) as response:  # nosec - checked by uri_is_safe
+        received = 0
+        while chunk := response.read(SCREENSHOT_CHUNK_SIZE):
+            received += len(chunk)
+            if received > SCREENSHOT_MAX_BYTES:
+                raise ScreenshotTooLarge()
+            yield chunk
+
+
+def webp(image, size, crop=False):
+    # crop fills `size` exactly, trimming the edges that don't match its aspect ratio,
+    # otherwise the image is only scaled down to fit within it
+    if crop:
+        image = ImageOps.fit(image, size)
+    else:
+        image = image.copy()
+        image.thumbnail(size)
+
+    out = io.BytesIO()
+    image.save(out, "WEBP", quality=80)
+    return save_blob(out.getvalue(), ".webp")
+
+
+def ingest_screenshot(screenshot):
+    screenshot.ingested = timezone.now()
+
+    if uri_is_safe(screenshot.url):
+        try:
+            ingest_image(screenshot)
+        except (OSError, ScreenshotTooLarge, UnsafeRedirect, Image.DecompressionBombError):
+            # unreachable, redirected somewhere unsafe or not a (sane) image, the page keeps
+            # hotlinking the original
+            pass
+
+    screenshot.save()
+    return screenshot
+
+
+def ingest_image(screenshot):
+    digest = save_blob_stream(stream(screenshot.url))
+
+    # identical images only need their variants generated once
+    existing = LinkScreenshot.objects.filter(digest=digest).exclude(webp_digest="").exclude(pk=screenshot.pk).first()
+
+    if existing:
+        for field in ["content_type", "width", "height", "thumbnail_digest", "webp_digest"]:
+            setattr(screenshot, field, getattr(existing, field))
+    else:
+        with open_blob(digest) as f, Image.open(f) as image:
+            screenshot.content_type = Image.MIME.get(image.format, "")
+            screenshot.width, screenshot.height = image.size
+
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            screenshot.thumbnail_digest = webp(image, THUMBNAIL_SIZE, crop=True)
+            screenshot.webp_digest = webp(image, (WEBP_MAX_WIDTH, image.height))
+
+    screenshot.digest = digest
+
+
+def pending_screenshots():
+    return LinkScreenshot.objects.filter(ingested__isnull=True).order_by("added")
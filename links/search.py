@@ -0,0 +1,145 @@
+import re
+import uuid
+from functools import cached_property
+
+from django.db import connection, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from links.models import Link, LinkSnapshot, SearchDocument
+
+# Full-text search over archived pages.
+#
+# `links.archive` indexes the text of each link's latest archived page against its
+# SearchDocument (see migration 0021): a contentless FTS5 table on sqlite, a tsvector
+# column with a GIN index on postgres. Only the index is kept, the text itself stays in
+# the snapshot's compressed blobs. Queries start from the index so they only touch the
+# matching documents, and on other databases `?q` only searches the URL, title and tags.
+#
+# A contentless FTS5 table can't remove a document without its original text, so a
+# document is never updated: re-archiving a link replaces it with a new one, and the
+# entries of deleted documents stay in the index (matching ids that are never reused)
+# until `rebuild_search_index`.
+
+RANKED_SQL = {
+    # `rank` is bm25(), lower is better
+    "sqlite": (
+        "SELECT d.link_id FROM links_search JOIN links_searchdocument d ON d.id = links_search.rowid "
+        "WHERE links_search MATCH %s AND d.link_id IN ({links}) "
+        "ORDER BY links_search.rank LIMIT %s OFFSET %s"
+    ),
+    "postgresql": (
+        "SELECT d.link_id FROM links_searchdocument d, websearch_to_tsquery('english', %s) query "
+        "WHERE d.document @@ query AND d.link_id IN ({links}) "
+        "ORDER BY ts_rank(d.document, query) DESC LIMIT %s OFFSET %s"
+    ),
+}
+
+
+def has_search_index():
+    return connection.vendor in RANKED_SQL
+
+
+def index_query(query):
+    if connection.vendor == "sqlite":
+        # every word as a quoted phrase, so FTS5 query syntax in the input can't cause an error
+        return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+    return query
+
+
+def matching_documents(query):
+    query = index_query(query)
+
+    if not has_search_index() or not query:
+        return SearchDocument.objects.none()
+
+    if connection.vendor == "sqlite":
+        matches = RawSQL("SELECT rowid FROM links_search WHERE links_search MATCH %s", [query])
+        return SearchDocument.objects.filter(id__in=matches)
+
+    matches = RawSQL("document @@ websearch_to_tsquery('english', %s)", [query], output_field=BooleanField())
+    return SearchDocument.objects.alias(matches=matches).filter(matches=True)
+
+
+def ranked_links(links, query, start, stop):
+    # the links in `links` with matching documents, best match first
+    links = links.order_by()
+    sql, params = links.values("id").query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RANKED_SQL[connection.vendor].format(links=sql), [index_query(query), *params, stop - start, start]
+        )
+        ids = [uuid.UUID(str(row[0])) for row in cursor.fetchall()]
+
+    # the ids came from `links`, so they don't need filtering again
+    found = Link.objects.in_bulk(ids)
+    return [found[link_id] for link_id in ids if link_id in found]
+
+
+class SearchResults:
+    # `links` (already filtered by ?q) for the Paginator, the links whose archived page
+    # matches most relevant first, then the URL, title and tag matches newest first
+    def __init__(self, links, query):
+        self.query = query
+        matches = matching_documents(query).values("link_id")
+        self.matched = links.filter(id__in=matches)
+        self.rest = links.exclude(id__in=matches)
+
+    @cached_property
+    def matched_count(self):
+        return self.matched.count()
+
+    def count(self):
+        return self.matched_count + self.rest.count()
+
+    def __getitem__(self, page):
+        start, stop = page.start or 0, page.stop
+        links = []
+
+        if start < self.matched_count:
+            links += ranked_links(self.matched, self.query, start, stop)
+
+        if stop > self.matched_count:
+            links += self.rest[max(start - self.matched_count, 0) : stop - self.matched_count]
+
+        return links
+
+
+def index_document(document, text):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "INSERT INTO links_search(rowid, title, text) VALUES (%s, %s, %s)", [document.id, document.title, text]
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "UPDATE links_searchdocument SET document = "
+                "setweight(to_tsvector('english', %s), 'A') || setweight(to_tsvector('english', %s), 'B') "
+                "WHERE id = %s",
+                [document.title, text, document.id],
+            )
+
+
+def index_snapshot(snapshot, text):
+    with transaction.atomic():
+        SearchDocument.objects.filter(link_id=snapshot.link_id).delete()
+        index_document(SearchDocument.objects.create(link_id=snapshot.link_id, title=snapshot.title), text)
+
+
+def rebuild_index():
+    # from each link's latest snapshot with text, e.g. after switching databases
+    SearchDocument.objects.all().delete()
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO links_search(links_search) VALUES ('delete-all')")
+
+    indexed = set()
+
+    for snapshot in LinkSnapshot.objects.exclude(text_chunks="").order_by("link_id", "-fetched").iterator():
+        if snapshot.link_id not in indexed:
+            document = SearchDocument.objects.create(link_id=snapshot.link_id, title=snapshot.title)
+            index_document(document, snapshot.text())
+            indexed.add(snapshot.link_id)
+
+    return len(indexed)
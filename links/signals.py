@@ -0,0 +1,85 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from links.cache import invalidate
+from links.models import Link, LinkScreenshot, LinkSnapshot
+from links.related import mark_related_stale
+from links.stats import move_stats
+from links.suggestions import mark_suggestions_stale, update_suggestions
+from links.tags import adjust_tag_counts
+
+
+@receiver(m2m_changed, sender=Link.tags.through)
+def update_tag_counts(sender, instance, action, pk_set, **kwargs):
+    if action == "post_add":
+        adjust_tag_counts(instance.user_id, pk_set, 1)
+    elif action == "post_remove":
+        adjust_tag_counts(instance.user_id, pk_set, -1)
+    elif action == "pre_clear":
+        adjust_tag_counts(instance.user_id, list(instance.tags.values_list("id", flat=True)), -1)
+
+    if action.startswith("post_"):
+        mark_related_stale([instance.pk])
+        mark_suggestions_stale([instance.pk])
+        invalidate(instance.user_id)
+
+
+@receiver(pre_save, sender=Link)
+def mark_suggestions_changed(sender, instance, **kwargs):
+    # saved with the link, `links.suggestions` retrains it before the next suggestions
+    instance.suggestions_updated = None
+
+
+@receiver(pre_save, sender=Link)
+def remember_stats(sender, instance, **kwargs):
+    # the link as it's counted in `links.stats`, in case it's been moved to another day or domain
+    instance.counted = None
+    if not instance._state.adding:
+        instance.counted = Link.objects.filter(pk=instance.pk).values_list("user_id", "added", "url").first()
+
+
+@receiver(post_save, sender=Link)
+def update_link_stats(sender, instance, **kwargs):
+    move_stats(
+        getattr(instance, "counted", None),
+        None if instance.deleted else (instance.user_id, instance.added, instance.url),
+    )
+
+
+@receiver(post_delete, sender=Link)
+def remove_stats(sender, instance, **kwargs):
+    if not instance.deleted:
+        move_stats((instance.user_id, instance.added, instance.url), None)
+
+
+@receiver(pre_delete, sender=Link)
+def remove_tag_counts(sender, instance, **kwargs):
+    # links in the trash have already been removed from the counts
+    if instance.deleted:
+        return
+
+    adjust_tag_counts(instance.user_id, list(instance.tags.values_list("id", flat=True)), -1)
+
+
+@receiver(pre_delete, sender=Link)
+def remove_suggestions(sender, instance, **kwargs):
+    update_suggestions([instance.pk], remove=True)
+
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+# the cached dashboard shows each link's screenshots and its latest archived page
+@receiver(post_save, sender=LinkScreenshot)
+@receiver(post_save, sender=LinkSnapshot)
+def invalidate_link_user_cache(sender, instance, **kwargs):
+    invalidate(Link.all_objects.filter(pk=instance.link_id).values_list("user_id", flat=True).first())
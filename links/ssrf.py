@@ -2,6 +2,7 @@ import ipaddress
 import re
 import socket
 from urllib.parse import urlparse
+from urllib.request import HTTPRedirectHandler
 
 
 def domain_is_valid(domain):
@@ -42,3 +43,15 @@ def uri_is_safe(uri):
         parts = urlparse(uri)
         return domain_is_safe(parts.netloc)
     return False
+
+
+class UnsafeRedirect(Exception):
+    pass
+
+
+class SafeRedirectHandler(HTTPRedirectHandler):
+    # the checks apply to every hop, not only the URL that was requested
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not uri_is_safe(newurl):
+            raise UnsafeRedirect("Redirected to an unsafe URL")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
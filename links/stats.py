@@ -0,0 +1,143 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from links.importers import SOURCE_TAGS
+from links.models import DailyLinkCount, DomainLinkCount, Link, UserTagCount
+from links.tags import tag_counts
+
+# Activity stats for the stats page and /api/stats/.
+#
+# Counting links by day and domain with GROUP BY gets slower with every link, so the
+# counts are rolled up as links are added, moved, trashed and deleted: one row for each
+# day that has links (DailyLinkCount) and one for each domain (DomainLinkCount). Tag and
+# source counts come from UserTagCount, which is kept up to date the same way. The stats
+# are then O(days) however many links there are.
+#
+# `manage.py rebuild_stats` recounts the rollups from the links and drops empty rows.
+
+STATS_TOP = 20
+STATS_RECENT_DAYS = 30
+
+
+def link_domain(url):
+    return urlsplit(url).netloc.lower()[:255]
+
+
+def adjust_counts(model, field, user_id, deltas):
+    # `deltas` maps values of `field` (e.g. days) to the change in their count, with one
+    # UPDATE for each distinct change like `links.tags.adjust_tag_counts`
+    by_delta = defaultdict(list)
+    for value, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(value)
+
+    for delta, values in by_delta.items():
+        if delta > 0:
+            model.objects.bulk_create(
+                [model(user_id=user_id, count=0, **{field: value}) for value in values], ignore_conflicts=True
+            )
+
+        counts = model.objects.filter(user_id=user_id, **{f"{field}__in": values})
+        counts.update(count=F("count") + delta)
+
+        if delta < 0:
+            counts.filter(count__lte=0).delete()
+
+
+def update_stats(rows, sign):
+    # `rows` are (user_id, added, url) of links that were added (sign=1) or removed (sign=-1)
+    days, domains = defaultdict(Counter), defaultdict(Counter)
+
+    for key in map(stats_key, rows):
+        if key:
+            user_id, day, domain = key
+            days[user_id][day] += sign
+            domains[user_id][domain] += sign
+
+    if not days:
+        return
+
+    with transaction.atomic():
+        for user_id in days:
+            adjust_counts(DailyLinkCount, "day", user_id, days[user_id])
+            adjust_counts(DomainLinkCount, "domain", user_id, domains[user_id])
+
+
+def update_stats_for(link_ids, sign):
+    update_stats(Link.objects.filter(id__in=link_ids).values_list("user_id", "added", "url"), sign)
+
+
+def stats_key(row):
+    # where a (user_id, added, url) row is counted
+    if not row or not row[0]:
+        return None
+
+    user_id, added, url = row
+    if isinstance(added, str):
+        added = parse_datetime(added)  # the importers set `added` from the API's timestamp
+    return (user_id, timezone.localdate(added), link_domain(url))
+
+
+def move_stats(before, after):
+    # for a link that was counted as the `before` row and now is the `after` row, either can be None
+    if stats_key(before) != stats_key(after):
+        update_stats([before], -1)
+        update_stats([after], 1)
+
+
+def rebuild_stats(user):
+    days, domains = Counter(), Counter()
+    for added, url in Link.objects.filter(user=user).values_list("added", "url").iterator():
+        days[timezone.localdate(added)] += 1
+        domains[link_domain(url)] += 1
+
+    with transaction.atomic():
+        DailyLinkCount.objects.filter(user=user).delete()
+        DomainLinkCount.objects.filter(user=user).delete()
+        DailyLinkCount.objects.bulk_create([DailyLinkCount(user=user, day=d, count=c) for d, c in days.items()])
+        DomainLinkCount.objects.bulk_create([DomainLinkCount(user=user, domain=d, count=c) for d, c in domains.items()])
+
+    return sum(days.values())
+
+
+def link_stats(user):
+    # plain data, so it can be cached and returned as JSON
+    days = dict(DailyLinkCount.objects.filter(user=user).values_list("day", "count"))
+    total = sum(days.values())
+
+    months = Counter()
+    for day, count in days.items():
+        months[day.strftime("%Y-%m")] += count
+
+    today = timezone.localdate()
+    recent = [today - timedelta(days=i) for i in range(STATS_RECENT_DAYS - 1, -1, -1)]
+
+    sources = dict(
+        UserTagCount.objects.filter(user=user, tag__name__in=SOURCE_TAGS.values()).values_list("tag__name", "count")
+    )
+
+    return {
+        "total": total,
+        "days": [{"date": day.isoformat(), "count": days.get(day, 0)} for day in recent],
+        "days_max": max([days.get(day, 0) for day in recent] + [1]),
+        "months": [{"month": month, "count": months[month]} for month in sorted(months, reverse=True)],
+        "months_max": max(list(months.values()) + [1]),
+        "domains": [
+            {"domain": domain, "count": count}
+            for domain, count in DomainLinkCount.objects.filter(user=user)
+            .order_by("-count", "domain")
+            .values_list("domain", "count")[:STATS_TOP]
+        ],
+        "tags": [
+            {"tag": tag_count.tag.name, "slug": tag_count.tag.slug, "count": tag_count.count}
+            for tag_count in tag_counts(user, STATS_TOP)
+        ],
+        "sources": [{"source": source, "count": sources.get(tag, 0)} for source, tag in SOURCE_TAGS.items()]
+        + [{"source": "other", "count": max(total - sum(sources.values()), 0)}],
+    }
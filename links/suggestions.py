@@ -0,0 +1,261 @@
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from taggit.models import Tag
+
+from links.cache import invalidate
+from links.importers import SOURCE_TAGS
+from links.models import Link, LinkTag, UserTagTokenCount, UserTokenCount
+from links.related import mark_related_stale
+from links.tags import adjust_tag_counts
+
+# Tag suggestions, from the tags the user has already given links with similar words.
+#
+# A naive Bayes model for each of the user's tags over the words in a link's title, note
+# and URL, and its domain. The model is only counts: how many of the user's links have
+# each token (UserTokenCount), and each tag and token together (UserTagTokenCount), with
+# tokens stored as 32 bit hashes. Saving a link or changing its tags marks it as changed,
+# and training takes out what it last added to the counts and adds what it has now, so
+# the model follows every edit without being rebuilt.
+#
+# Scoring a link is a few indexed queries however many links and tags the user has, and scoring a
+# batch of links (e.g. from an importer) is the same few queries for all of them.
+
+SUGGEST_LIMIT = 5
+SUGGEST_MAX_TOKENS = 64
+SUGGEST_MIN_LINKS = 3  # tags on fewer links than this aren't suggested
+SUGGEST_MIN_PROBABILITY = 0.5
+SUGGEST_AUTO_PROBABILITY = 0.9  # importers add suggestions that are at least this likely
+SUGGEST_SMOOTHING = 0.5
+SUGGEST_CHUNK_SIZE = 100
+PARAMS_PER_QUERY = 500  # sqlite allows 999 parameters per query
+
+STOPWORDS = set(
+    "and are but can com for from has have how html http https into its not our out the this that was what when "
+    "where which who why will with www you your".split()
+)
+
+
+def words(text):
+    return [word for word in re.findall(r"[^\W\d_]{3,}", text.lower()) if word not in STOPWORDS]
+
+
+def token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), "big", signed=True)
+
+
+# on every link, so its counts are the number of links (with each tag)
+LINKS_TOKEN = token_hash("")
+
+
+def tokens(url, title, note):
+    parts = urlsplit(url)
+    domain = parts.netloc.lower().removeprefix("www.")
+    features = [f"domain:{domain}"] + words(f"{title} {parts.path} {note}")
+    return sorted({token_hash(feature) for feature in list(dict.fromkeys(features))[:SUGGEST_MAX_TOKENS]})
+
+
+def slices(values, size=PARAMS_PER_QUERY):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def dump_features(tokens, tag_ids):
+    return " ".join(map(str, tokens)) + "|" + " ".join(map(str, sorted(tag_ids)))
+
+
+def load_features(value):
+    tokens, _, tag_ids = (value or "|").partition("|")
+    return [int(token) for token in tokens.split()], [int(tag_id) for tag_id in tag_ids.split()]
+
+
+def adjust_counts(model, fields, deltas):
+    # adds each delta to the count of the row with those `fields`, in a few UPDATEs rather
+    # than one for each row, and with F() so that concurrent changes aren't lost
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    model.objects.bulk_create(
+        [model(count=0, **dict(zip(fields, key))) for key, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True,
+        batch_size=PARAMS_PER_QUERY // len(fields),
+    )
+
+    by_delta = defaultdict(list)
+    for keys in slices(deltas):
+        rows = model.objects.filter(user_id__in={key[0] for key in keys}, token__in={key[1] for key in keys})
+        for row_id, *key in rows.values_list("id", *fields):
+            if tuple(key) in deltas:
+                by_delta[deltas[tuple(key)]].append(row_id)
+
+    for delta, ids in by_delta.items():
+        for chunk in slices(ids):
+            model.objects.filter(id__in=chunk).update(count=F("count") + delta)
+            if delta < 0:
+                model.objects.filter(id__in=chunk, count__lte=0).delete()
+
+
+def update_suggestions(link_ids, remove=False):
+    # trains the model on the links as they are now, or takes them out of it with `remove`
+    # (e.g. before they're deleted). Links in the trash aren't part of the model
+    rows = Link.all_objects.filter(id__in=link_ids).values_list(
+        "id", "user_id", "url", "title", "note", "deleted", "suggestion_features"
+    )
+    link_tags = defaultdict(list)
+    if not remove:
+        for link_id, tag_id in LinkTag.objects.filter(content_object_id__in=link_ids).values_list(
+            "content_object_id", "tag_id"
+        ):
+            link_tags[link_id].append(tag_id)
+
+    token_deltas, tag_token_deltas = Counter(), Counter()
+    links = []
+
+    for link_id, user_id, url, title, note, deleted, trained in rows:
+        if remove or deleted or not user_id:
+            features = ""
+        else:
+            features = dump_features([LINKS_TOKEN] + tokens(url, title, note), link_tags[link_id])
+
+        if user_id and features != (trained or ""):
+            for sign, value in [(-1, trained), (1, features)]:
+                link_tokens, tag_ids = load_features(value)
+                for token in link_tokens:
+                    token_deltas[user_id, token] += sign
+                    for tag_id in tag_ids:
+                        tag_token_deltas[user_id, token, tag_id] += sign
+
+        links.append(Link(id=link_id, suggestion_features=features, suggestions_updated=timezone.now()))
+
+    if remove and not token_deltas:
+        # they were never trained
+        return len(links)
+
+    with transaction.atomic():
+        adjust_counts(UserTokenCount, ["user_id", "token"], token_deltas)
+        adjust_counts(UserTagTokenCount, ["user_id", "token", "tag_id"], tag_token_deltas)
+        if not remove:
+            Link.all_objects.bulk_update(links, ["suggestion_features", "suggestions_updated"])
+
+    return len(links)
+
+
+def update_pending_suggestions(user=None, exclude=()):
+    pending = Link.all_objects.filter(suggestions_updated=None).exclude(id__in=exclude).order_by()
+    if user:
+        pending = pending.filter(user=user)
+
+    count = 0
+    while chunk := list(pending.values_list("id", flat=True)[:SUGGEST_CHUNK_SIZE]):
+        count += update_suggestions(chunk)
+    return count
+
+
+def mark_suggestions_stale(link_ids):
+    Link.all_objects.filter(id__in=link_ids).update(suggestions_updated=None)
+
+
+def suggest_tags_for(user, links, exclude=None, limit=SUGGEST_LIMIT, min_probability=SUGGEST_MIN_PROBABILITY):
+    # a list of (tag, probability) for each of `links`, which don't have to be saved, most likely
+    # first. `exclude` is the names of the tags each link already has. Links that have just been
+    # saved aren't trained on until afterwards, so they're scored on what the model knew before
+    update_pending_suggestions(user, exclude=[link.pk for link in links])
+    exclude = exclude or [[] for link in links]
+
+    link_tokens = [tokens(link.url, link.title, link.note) for link in links]
+
+    token_counts, tag_token_counts = {}, defaultdict(dict)
+    for chunk in slices(set().union([LINKS_TOKEN], *link_tokens)):
+        token_counts.update(UserTokenCount.objects.filter(user=user, token__in=chunk).values_list("token", "count"))
+        for tag_id, token, count in UserTagTokenCount.objects.filter(user=user, token__in=chunk).values_list(
+            "tag_id", "token", "count"
+        ):
+            tag_token_counts[tag_id][token] = count
+
+    total = token_counts.pop(LINKS_TOKEN, 0)
+    tag_counts = {tag_id: counts.pop(LINKS_TOKEN, 0) for tag_id, counts in tag_token_counts.items()}
+
+    # the tags that share a token with each link
+    link_tokens = [[token for token in known if token in token_counts] for known in link_tokens]
+    link_candidates = [
+        {tag_id for tag_id, counts in tag_token_counts.items() if any(token in counts for token in known)}
+        for known in link_tokens
+    ]
+
+    tags = {}
+    candidates = {tag_id for tag_id in set().union(*link_candidates) if tag_counts[tag_id] >= SUGGEST_MIN_LINKS}
+    for chunk in slices(candidates):
+        tags.update(Tag.objects.filter(id__in=chunk).exclude(name__in=SOURCE_TAGS.values()).in_bulk())
+
+    a = SUGGEST_SMOOTHING
+    suggestions = []
+
+    for known, candidates, names in zip(link_tokens, link_candidates, exclude):
+        existing = {name.lower() for name in names}
+        scored = []
+
+        for tag_id in candidates & tags.keys():
+            if tags[tag_id].name.lower() in existing:
+                continue
+
+            # the log odds of the tag against not the tag, each token counted as independent evidence
+            n = tag_counts[tag_id]
+            log_odds = math.log((n + a) / (total - n + a))
+            for token in known:
+                with_tag = tag_token_counts[tag_id].get(token, 0)
+                without_tag = max(token_counts[token] - with_tag, 0)
+                log_odds += math.log((with_tag + a) / (n + 2 * a)) - math.log((without_tag + a) / (total - n + 2 * a))
+
+            probability = 1 / (1 + math.exp(-max(min(log_odds, 50), -50)))
+            if probability >= min_probability:
+                scored.append((tags[tag_id], probability))
+
+        suggestions.append(sorted(scored, key=lambda item: -item[1])[:limit])
+
+    return suggestions
+
+
+def suggest_tags(user, link, tag_names=()):
+    return suggest_tags_for(user, [link], [tag_names])[0]
+
+
+def add_suggested_tags(user, links):
+    # tags `links` (e.g. just imported) with the suggestions the model is confident about
+    links = list(links)
+    if not links:
+        return 0
+
+    names = defaultdict(list)
+    for link_id, name in LinkTag.objects.filter(content_object__in=links).values_list("content_object_id", "tag__name"):
+        names[link_id].append(name)
+
+    suggestions = suggest_tags_for(
+        user, links, [names[link.pk] for link in links], min_probability=SUGGEST_AUTO_PROBABILITY
+    )
+    new_tags = [
+        LinkTag(content_object=link, tag=tag) for link, suggested in zip(links, suggestions) for tag, _ in suggested
+    ]
+
+    by_count = defaultdict(list)
+    for tag_id, count in Counter(link_tag.tag_id for link_tag in new_tags).items():
+        by_count[count].append(tag_id)
+
+    with transaction.atomic():
+        LinkTag.objects.bulk_create(new_tags)
+        for count, tag_ids in by_count.items():
+            adjust_tag_counts(user.id, tag_ids, count)
+
+        link_ids = [link.pk for link in links]
+        mark_suggestions_stale(link_ids)
+        mark_related_stale(link_ids)
+
+    invalidate(user.id)
+    return len(new_tags)
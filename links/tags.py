@@ -0,0 +1,56 @@
+from django.db.models import Count, F
+from taggit.models import Tag
+
+from links.models import LinkTag, UserTagCount
+
+
+def filter_by_tags(links, slugs, match="all"):
+    # taggit slugs are always lowercase, so folding the input lets the lookup
+    # use the unique slug index instead of an UPPER() comparison
+    slugs = {slug.lower() for slug in slugs}
+    tag_ids = list(Tag.objects.filter(slug__in=slugs).values_list("id", flat=True))
+
+    items = LinkTag.objects.filter(tag_id__in=tag_ids)
+
+    if match == "any":
+        return links.filter(id__in=items.values("content_object_id"))
+
+    if len(tag_ids) < len(slugs):
+        return links.none()
+
+    matching = items.values("content_object_id").annotate(tag_count=Count("tag_id")).filter(tag_count=len(tag_ids))
+    return links.filter(id__in=matching.values("content_object_id"))
+
+
+def adjust_tag_counts(user_id, tag_ids, delta):
+    if not user_id or not tag_ids:
+        return
+
+    if delta > 0:
+        UserTagCount.objects.bulk_create(
+            [UserTagCount(user_id=user_id, tag_id=tag_id, count=0) for tag_id in tag_ids], ignore_conflicts=True
+        )
+
+    counts = UserTagCount.objects.filter(user_id=user_id, tag_id__in=tag_ids)
+    counts.update(count=F("count") + delta)
+
+    if delta < 0:
+        counts.filter(count__lte=0).delete()
+
+
+def rebuild_tag_counts(user_id):
+    UserTagCount.objects.filter(user_id=user_id).delete()
+
+    counts = (
+        LinkTag.objects.filter(content_object__user_id=user_id, content_object__deleted=None)
+        .values("tag_id")
+        .annotate(count=Count("id"))
+    )
+
+    UserTagCount.objects.bulk_create(
+        [UserTagCount(user_id=user_id, tag_id=row["tag_id"], count=row["count"]) for row in counts]
+    )
+
+
+def tag_counts(user, limit=50):
+    return UserTagCount.objects.filter(user=user).select_related("tag").order_by("-count", "tag__name")[:limit]
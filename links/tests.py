@@ -1,13 +1,82 @@
+import gzip
+import io
+import json
+import random
 import secrets
-from datetime import timedelta
+import tempfile
+from datetime import datetime, timedelta
+from email.message import Message
 from unittest import mock
-
-from django.test import TestCase
+from urllib.error import URLError
+from urllib.request import Request
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import Http404, HttpResponse, QueryDict
+from django.template.loader import render_to_string
+from django.test import (
+    AsyncRequestFactory,
+    LiveServerTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
 from django.utils import timezone
+from PIL import Image
+from taggit.models import Tag
 from thttp import Response
 
-from authuser.models import User
-from links.models import Link, UserSettings
+from authuser.models import ApiKey, User
+from bm2.queries import RepeatedQueriesError, inspecting
+from links import async_views
+from links.archive import archive_link, pending_links, save_chunks
+from links.blobs import open_blob
+from links.bulk import delete_links, restore_links, trash_links
+from links.cache import cache_key
+from links.duplicates import possible_duplicates, update_signatures
+from links.icons import ICON_MAX_BYTES, fetch_icon, missing_domains
+from links.importers import SOURCE_TAGS, get_user_settings
+from links.importers.feedbin import save_entries
+from links.importers.github import save_stars
+from links.importers.hackernews import save_favourites
+from links.management.commands.seed_links import seed_user
+from links.models import (
+    DailyLinkCount,
+    DomainLinkCount,
+    Favicon,
+    Link,
+    LinkScreenshot,
+    LinkSnapshot,
+    LinkTag,
+    RelatedLink,
+    ScheduledImport,
+    SearchDocument,
+    UserSettings,
+    UserTagCount,
+    UserTagTokenCount,
+    UserTokenCount,
+)
+from links.related import related_links
+from links.scheduler import (
+    IMPORT_INTERVAL,
+    IMPORT_JITTER,
+    TokenBucket,
+    run_due_imports,
+    schedule_imports,
+)
+from links.screenshots import THUMBNAIL_SIZE, ingest_screenshot, pending_screenshots
+from links.ssrf import SafeRedirectHandler, UnsafeRedirect
+from links.suggestions import suggest_tags, update_pending_suggestions
+from links.tags import rebuild_tag_counts, tag_counts
+from links.views import LINK_PREFETCH, filter_links
 
 
 class LinkModelTestCase(TestCase):
@@ -15,9 +84,29 @@ class LinkModelTestCase(TestCase):
         link = Link.objects.create(url="https://example.org", title="Example Site")
         self.assertEqual("Example Site", str(link))
 
-    def test_icon_uses_ddg_service(self):
+    def test_tags_are_stored_against_the_link(self):
+        link = Link.objects.create(url="https://example.org")
+        link.tags.add("a", "b")
+
+        self.assertEqual(2, LinkTag.objects.filter(content_object=link).count())
+        self.assertEqual(["a", "b"], sorted(link.tags.names()))
+
+    def test_tags_can_be_prefetched(self):
+        link = Link.objects.create(url="https://example.org")
+        link.tags.add("a")
+
+        link = Link.objects.prefetch_related("tags").get(pk=link.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(["a"], [t.name for t in link.tags.all()])
+
+    def test_icon_uses_local_domain_icon(self):
+        link = Link.objects.create(url="https://example.org")
+        self.assertEqual("/icons/example.org.ico", link.icon())
+
+    def test_icon_uses_digest_when_attached(self):
         link = Link.objects.create(url="https://example.org")
-        self.assertEqual("https://icons.duckduckgo.com/ip3/example.org.ico", link.icon())
+        link.icon_digest = "abc123"
+        self.assertEqual("/icons/abc123/", link.icon())
 
 
 class DashboardTestCase(TestCase):
@@ -81,6 +170,43 @@ class DashboardTestCase(TestCase):
         response = self.client.get(f"/?date={date_str}")
         self.assertEqual(5, len(response.context["links"]))
 
+    def test_dashboard_filtering_by_date_range(self):
+        self.client.force_login(self.user)
+
+        for added in ["2023-12-31T23:59:59", "2024-01-01T00:00:00", "2024-02-29T12:00:00", "2024-03-01T00:00:00"]:
+            link = Link.objects.create(user=self.user, url=f"https://example.org/{secrets.token_hex()}")
+            link.added = timezone.make_aware(datetime.fromisoformat(added))
+            link.save()
+
+        def count(query):
+            return len(self.client.get(f"/?{query}").context["links"])
+
+        self.assertEqual(1, count("date=2023-12-31"))
+        self.assertEqual(2, count("from=2024-01-01&to=2024-02-29"))
+        self.assertEqual(1, count("month=2024-02"))
+        self.assertEqual(3, count("year=2024"))
+        self.assertEqual(1, count("year=2024&to=2024-01-31"))
+
+        # a range of `added` rather than a date cast of it, so the index can be used
+        sql = str(filter_links(Link.objects.filter(user=self.user), QueryDict("month=2024-02")).query)
+        self.assertNotIn("django_datetime_cast_date", sql)
+
+        for query in [
+            "from=2024-13-01",
+            "to=9999-12-31",
+            "month=2024-13",
+            "year=abc",
+            "year=0",
+            "date=2024-02-30&json",
+        ]:
+            self.assertEqual(400, self.client.get(f"/?{query}").status_code, query)
+            self.assertEqual(400, self.client.get(f"/trash/?{query}").status_code, query)
+
+        for month in ["2024-13", None, 202401]:
+            response = self.client.post("/api/delete/", {"filter": {"month": month}}, content_type="application/json")
+            self.assertEqual(400, response.status_code)
+        self.assertEqual(4, Link.objects.count())
+
     def test_dashboard_filtering_by_tag(self):
         self.client.force_login(self.user)
 
@@ -94,6 +220,31 @@ class DashboardTestCase(TestCase):
         response = self.client.get("/?tag=a")
         self.assertEqual(10, len(response.context["links"]))
 
+    def test_dashboard_filtering_by_tag_is_case_insensitive(self):
+        self.client.force_login(self.user)
+
+        link = Link.objects.create(user=self.user, url="https://example.org/")
+        link.tags.add("Python")
+
+        response = self.client.get("/?tag=PYTHON")
+        self.assertEqual(1, len(response.context["links"]))
+
+    def test_dashboard_filtering_by_multiple_tags(self):
+        self.client.force_login(self.user)
+
+        for tags in [["a"], ["b"], ["a", "b"], ["a", "b", "c"]]:
+            link = Link.objects.create(user=self.user, url=f"https://example.org/{secrets.token_hex()}")
+            link.tags.add(*tags)
+
+        response = self.client.get("/?tag=a&tag=b")
+        self.assertEqual(2, len(response.context["links"]))
+
+        response = self.client.get("/?tag=a&tag=b&match=any")
+        self.assertEqual(4, len(response.context["links"]))
+
+        response = self.client.get("/?tag=a&tag=missing")
+        self.assertEqual(0, len(response.context["links"]))
+
     def test_pagination_returns_first_page_if_invalid_page(self):
         self.client.force_login(self.user)
 
@@ -153,6 +304,26 @@ class DashboardTestCase(TestCase):
 
         self.assertTrue(False)
 
+    def test_random_param_respects_filters_and_limit(self):
+        self.client.force_login(self.user)
+
+        for x in range(50):
+            Link.objects.create(user=self.user, url=f"https://example.org/{x}")
+            Link.objects.create(user=self.user, url=f"https://example.com/{x}")
+
+        response = self.client.get("/?random=1&domain=example.com&limit=20")
+        self.assertEqual(20, len(response.context["links"]))
+        self.assertTrue(all(link.domain() == "example.com" for link in response.context["links"]))
+
+    def test_random_param_returns_every_link_when_limit_exceeds_count(self):
+        self.client.force_login(self.user)
+
+        for x in range(5):
+            Link.objects.create(user=self.user, url=f"https://example.org/{x}")
+
+        response = self.client.get("/?random=1")
+        self.assertEqual(5, len({link.pk for link in response.context["links"]}))
+
     def test_search(self):
         self.client.force_login(self.user)
 
@@ -167,6 +338,132 @@ class DashboardTestCase(TestCase):
         self.assertEqual(3, len(response.context["links"]))
 
 
+class TagCountTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+
+    def counts(self):
+        return {c.tag.name: c.count for c in tag_counts(self.user)}
+
+    def test_adding_and_removing_tags_updates_counts(self):
+        first = Link.objects.create(user=self.user, url="https://example.org/1")
+        second = Link.objects.create(user=self.user, url="https://example.org/2")
+
+        first.tags.add("a", "b")
+        second.tags.add("a")
+        self.assertEqual({"a": 2, "b": 1}, self.counts())
+
+        first.tags.remove("a")
+        self.assertEqual({"a": 1, "b": 1}, self.counts())
+
+        first.tags.clear()
+        self.assertEqual({"a": 1}, self.counts())
+
+    def test_deleting_link_updates_counts(self):
+        link = Link.objects.create(user=self.user, url="https://example.org/1")
+        link.tags.add("a")
+        link.delete()
+        self.assertEqual({}, self.counts())
+
+    def test_counts_are_per_user(self):
+        second_user = User.objects.create(email="test2@example.org")
+        Link.objects.create(user=self.user, url="https://example.org/1").tags.add("a")
+        Link.objects.create(user=second_user, url="https://example.org/1").tags.add("a")
+        self.assertEqual({"a": 1}, self.counts())
+
+    def test_rebuild_tag_counts(self):
+        link = Link.objects.create(user=self.user, url="https://example.org/1")
+        link.tags.add("a", "b")
+        UserTagCount.objects.all().delete()
+
+        rebuild_tag_counts(self.user.id)
+        self.assertEqual({"a": 1, "b": 1}, self.counts())
+
+    def test_tags_added_through_form_are_counted(self):
+        self.client.force_login(self.user)
+        self.client.post("/add/", {"url": "https://example.org/added", "tags": "a, b"})
+        self.assertEqual({"a": 1, "b": 1}, self.counts())
+
+    def test_sidebar_lists_tags(self):
+        self.client.force_login(self.user)
+        Link.objects.create(user=self.user, url="https://example.org/1").tags.add("wordle")
+
+        response = self.client.get("/")
+        self.assertContains(response, 'href="/?tag=wordle"')
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+    def cache_version(self):
+        return User.objects.get(pk=self.user.pk).cache_version
+
+    def test_dashboard_first_page_is_cached(self):
+        Link.objects.create(user=self.user, url="https://example.org/1")
+        self.assertEqual(1, len(self.client.get("/").context["links"]))
+
+        # bulk_create skips the signals that invalidate the cache
+        Link.objects.bulk_create([Link(user=self.user, url="https://example.org/2")])
+        self.assertEqual(1, len(self.client.get("/").context["links"]))
+        self.assertEqual(2, len(self.client.get("/?domain=example.org").context["links"]))
+
+    def test_imports_invalidate_the_cache_once(self):
+        stars = [
+            {
+                "repo": {"html_url": f"https://github.com/example/{i}", "full_name": f"example/{i}", "description": ""},
+                "starred_at": "2023-06-29T23:39:35Z",
+            }
+            for i in range(3)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            save_stars(self.user, stars)
+
+        self.assertEqual(3, Link.objects.filter(user=self.user).count())
+        self.assertEqual(1, len([query for query in queries if query["sql"].startswith('UPDATE "authuser_user"')]))
+
+    def test_settings_are_not_cached(self):
+        UserSettings.objects.create(user=self.user, github_pat="secret")
+        get_user_settings(self.user)
+        self.assertIsNone(cache.get(cache_key(self.user, "settings")))
+
+    def test_archiving_invalidates_the_cache(self):
+        link = Link.objects.create(user=self.user, url="https://example.org/1")
+        self.assertNotContains(self.client.get("/"), "archived</a>")
+
+        with mock.patch("links.archive.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = FakePage(b"<p>Archived text</p>")
+            snapshot, stored = archive_link(link)
+
+        self.assertContains(self.client.get("/"), snapshot.get_absolute_url())
+
+    def test_writes_invalidate_the_cache(self):
+        self.assertEqual(0, len(self.client.get("/").context["links"]))
+
+        version = self.cache_version()
+        link = Link.objects.create(user=self.user, url="https://example.org/1")
+        self.assertNotEqual(version, self.cache_version())
+        self.assertEqual(1, len(self.client.get("/").context["links"]))
+
+        version = self.cache_version()
+        link.tags.add("a")
+        self.assertNotEqual(version, self.cache_version())
+        self.assertEqual(["a"], [t.name for t in self.client.get("/").context["links"][0].tags.all()])
+
+        self.client.post(f"/delete/{link.pk}/")
+        self.assertEqual(0, len(self.client.get("/").context["links"]))
+
+    def test_cache_is_per_user(self):
+        second_user = User.objects.create(email="test2@example.org")
+        Link.objects.create(user=second_user, url="https://example.org/1")
+        self.client.get("/")
+
+        self.client.force_login(second_user)
+        self.assertEqual(1, len(self.client.get("/").context["links"]))
+
+
 class AddLinkTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create(email="tester@example.org")
@@ -289,6 +586,20 @@ class ImporterTestCase(TestCase):
             self.assertEqual(1, Link.objects.filter(user=self.user).count())
             self.assertEqual("https://github.com/sesh/thttp", Link.objects.filter(user=self.user)[0].url)
 
+    def test_imports_leave_trashed_links_in_the_trash(self):
+        urls = ["https://github.com/sesh/thttp", "https://example.org/feedbin", "https://example.org/hn"]
+        for url in urls:
+            trash_links(self.user, Link.objects.filter(pk=Link.objects.create(user=self.user, url=url).pk))
+
+        repo = {"html_url": urls[0], "full_name": "sesh/thttp", "description": ""}
+        save_stars(self.user, [{"repo": repo, "starred_at": "2023-06-29T23:39:35Z"}])
+        save_entries(self.user, [{"url": urls[1], "title": "Feedbin", "created_at": "2023-06-29T23:39:35Z"}])
+        save_favourites(self.user, {"links": [{"url": urls[2], "title": "Hacker News"}]})
+
+        self.assertEqual(3, Link.all_objects.filter(user=self.user).count())
+        self.assertFalse(Link.objects.filter(user=self.user).exists())
+        self.assertFalse(LinkTag.objects.exists())
+
     def test_import_feedbin_entries(self):
         UserSettings.objects.create(user=self.user, feedbin_username="aaa", feedbin_password="aaa")  # nosec
 
@@ -364,6 +675,424 @@ class ImporterTestCase(TestCase):
             self.assertEqual("ICAAN Example Site", Link.objects.filter(user=self.user)[0].title)
 
 
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.link = Link.objects.create(url="https://example.org", title="Example Site", user=self.user)
+
+    def request(self, method, path, user=None):
+        request = getattr(AsyncRequestFactory(), method)(path)
+        request.user = user or self.user
+        request.session = {}
+        request._messages = CookieStorage(request)
+        return request
+
+    async def test_redirects_anonymous_users_to_login(self):
+        response = await async_views.dashboard(self.request("get", "/", user=AnonymousUser()))
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(response.url.startswith("/accounts/login/"))
+
+    async def test_dashboard(self):
+        response = await async_views.dashboard(self.request("get", "/"))
+        self.assertContains(response, "Example Site")
+
+    async def test_dashboard_json(self):
+        response = await async_views.dashboard(self.request("get", "/?json"))
+        self.assertEqual("https://example.org", json.loads(response.content)["data"][0]["url"])
+
+    async def test_dashboard_invalid_filter(self):
+        response = await async_views.dashboard(self.request("get", "/?id=abc"))
+        self.assertEqual(400, response.status_code)
+
+    async def test_api_link(self):
+        response = await async_views.api_link(self.request("get", f"/api/{self.link.pk}/"), pk=self.link.pk)
+        self.assertEqual(str(self.link.pk), json.loads(response.content)["data"]["id"])
+
+    async def test_api_link_for_another_user_is_not_found(self):
+        other = await User.objects.acreate(email="other@example.org")
+
+        with self.assertRaises(Http404):
+            await async_views.api_link(self.request("get", f"/api/{self.link.pk}/", user=other), pk=self.link.pk)
+
+    async def test_import_fails_with_missing_credential(self):
+        await UserSettings.objects.acreate(user=self.user)
+
+        request = self.request("post", "/import/github/")
+        await async_views.import_github(request)
+        self.assertTrue("in settings" in list(request._messages)[0].message)
+
+    async def test_import_github_stars(self):
+        await UserSettings.objects.acreate(user=self.user, github_pat="AAA")
+        stars = [
+            {
+                "repo": {
+                    "html_url": "https://github.com/sesh/thttp",
+                    "full_name": "sesh/thttp",
+                    "description": "",
+                    "topics": ["http"],
+                },
+                "starred_at": "2023-06-29T23:39:35Z",
+            }
+        ]
+
+        with mock.patch("httpx.AsyncClient.get", return_value=httpx.Response(200, json=stars)):
+            request = self.request("post", "/import/github/")
+            await async_views.import_github(request)
+
+        self.assertTrue(await Link.objects.filter(user=self.user, url="https://github.com/sesh/thttp").aexists())
+        self.assertEqual("Imported 1 stars from Github", list(request._messages)[0].message)
+
+    async def test_import_feedbin_with_no_starred_entries(self):
+        await UserSettings.objects.acreate(user=self.user, feedbin_username="aaa", feedbin_password="aaa")  # nosec
+
+        with mock.patch("httpx.AsyncClient.get", return_value=httpx.Response(200, json=[])):
+            request = self.request("post", "/import/feedbin/")
+            await async_views.import_feedbin(request)
+
+        self.assertEqual("Imported 0 starred entries from Feedbin", list(request._messages)[0].message)
+
+    async def test_middleware_logs_in_with_api_key(self):
+        api_key = await ApiKey.objects.acreate(user=self.user)
+
+        response = await self.async_client.get(
+            f"/api/{self.link.pk}/", headers={"authorization": f"Bearer {api_key.key}"}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("same-origin", response.headers["Referrer-Policy"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IconTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+    def mocked_icon(self, content=b"GIF89a-icon"):
+        return FakePage(content, "image/x-icon")
+
+    def test_fetch_icon_stores_content(self):
+        with mock.patch("links.icons.urlopen", side_effect=lambda *args, **kwargs: self.mocked_icon()):
+            favicon = fetch_icon("example.org")
+
+        self.assertEqual(64, len(favicon.digest))
+        self.assertEqual("image/x-icon", favicon.content_type)
+
+    def test_fetch_icon_dedupes_identical_icons(self):
+        with mock.patch("links.icons.urlopen", side_effect=lambda *args, **kwargs: self.mocked_icon()):
+            first = fetch_icon("example.org")
+            second = fetch_icon("example.com")
+
+        self.assertEqual(first.digest, second.digest)
+
+    def test_fetch_icon_failures_are_saved(self):
+        Link.objects.create(user=self.user, url="https://example.org/")
+        with mock.patch("links.icons.urlopen", side_effect=URLError("timed out")):
+            favicon = fetch_icon("example.org")
+
+        self.assertEqual("", favicon.digest)
+        self.assertIsNotNone(favicon.fetched)
+        self.assertEqual([], missing_domains())
+
+    def test_fetch_icon_stops_reading_large_icons(self):
+        icon = self.mocked_icon(b"x" * (ICON_MAX_BYTES * 2))
+        icon.read = mock.Mock(wraps=icon.read)
+
+        with mock.patch("links.icons.urlopen", return_value=icon):
+            favicon = fetch_icon("example.org")
+
+        self.assertEqual("", favicon.digest)
+        icon.read.assert_called_once_with(ICON_MAX_BYTES + 1)
+
+    def test_missing_domains_skips_fetched_domains(self):
+        Link.objects.create(user=self.user, url="https://example.org/a")
+        Link.objects.create(user=self.user, url="https://example.org/b")
+        Link.objects.create(user=self.user, url="https://example.com/")
+        Favicon.objects.create(domain="example.com", digest="abc")
+
+        self.assertEqual(["example.org"], missing_domains())
+
+    def test_dashboard_uses_cached_icons(self):
+        Link.objects.create(user=self.user, url="https://example.org")
+        with mock.patch("links.icons.urlopen", side_effect=lambda *args, **kwargs: self.mocked_icon()):
+            favicon = fetch_icon("example.org")
+
+        response = self.client.get("/")
+        self.assertContains(response, f"/icons/{favicon.digest}/")
+
+    def test_icon_is_served_with_immutable_caching(self):
+        with mock.patch("links.icons.urlopen", side_effect=lambda *args, **kwargs: self.mocked_icon()):
+            favicon = fetch_icon("example.org")
+
+        response = self.client.get(f"/icons/{favicon.digest}/")
+        self.assertEqual(b"GIF89a-icon", b"".join(response.streaming_content))
+        self.assertTrue("immutable" in response.headers["Cache-Control"])
+
+    def test_domain_icon_placeholder_when_missing(self):
+        response = self.client.get("/icons/example.org.ico")
+        self.assertEqual("image/gif", response.headers["Content-Type"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ScreenshotIngestionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.link = Link.objects.create(user=self.user, url="https://example.org")
+
+    def png(self, size=(1600, 1200)):
+        out = io.BytesIO()
+        Image.new("RGB", size, "red").save(out, "PNG")
+        out.seek(0)
+        return out
+
+    def test_new_screenshots_are_pending(self):
+        screenshot = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/1.png")
+        self.assertEqual([screenshot], list(pending_screenshots()))
+
+    def test_ingest_generates_thumbnail_and_webp(self):
+        screenshot = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/1.png")
+
+        with mock.patch("links.screenshots.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = self.png()
+            ingest_screenshot(screenshot)
+
+        self.assertEqual("image/png", screenshot.content_type)
+        self.assertEqual((1600, 1200), (screenshot.width, screenshot.height))
+        self.assertTrue(screenshot.thumbnail_url().endswith(f"{screenshot.thumbnail_digest}.webp"))
+        self.assertEqual([], list(pending_screenshots()))
+
+    def test_thumbnails_are_cropped_to_size(self):
+        screenshot = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/1.png")
+
+        with mock.patch("links.screenshots.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = self.png(size=(1600, 400))
+            ingest_screenshot(screenshot)
+
+        with open_blob(screenshot.thumbnail_digest, ".webp") as f, Image.open(f) as thumbnail:
+            self.assertEqual(THUMBNAIL_SIZE, thumbnail.size)
+
+        with open_blob(screenshot.webp_digest, ".webp") as f, Image.open(f) as preview:
+            self.assertEqual((1280, 320), preview.size)
+
+    def test_ingest_dedupes_identical_images(self):
+        first = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/1.png")
+        second = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/2.png")
+
+        with mock.patch("links.screenshots.build_opener") as build_opener:
+            build_opener.return_value.open.side_effect = [self.png(), self.png()]
+            ingest_screenshot(first)
+            with mock.patch("links.screenshots.Image.open") as image_open:
+                ingest_screenshot(second)
+                image_open.assert_not_called()
+
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(first.webp_digest, second.webp_digest)
+
+    def test_ingest_skips_unsafe_urls(self):
+        screenshot = LinkScreenshot.objects.create(link=self.link, url="http://127.0.0.1/1.png")
+
+        with mock.patch("links.screenshots.build_opener") as build_opener:
+            ingest_screenshot(screenshot)
+            build_opener.assert_not_called()
+
+        self.assertEqual("", screenshot.digest)
+        self.assertEqual(screenshot.url, screenshot.image_url())
+
+    def test_redirects_to_unsafe_urls_are_refused(self):
+        request = Request("https://media.example.org/1.png")
+        with self.assertRaises(UnsafeRedirect):
+            SafeRedirectHandler().redirect_request(request, None, 302, "Found", {}, "http://169.254.169.254/")
+
+    def test_ingest_skips_decompression_bombs(self):
+        screenshot = LinkScreenshot.objects.create(link=self.link, url="https://media.example.org/1.png")
+
+        with mock.patch("links.screenshots.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = self.png()
+            with mock.patch("links.screenshots.Image.open", side_effect=Image.DecompressionBombError()):
+                ingest_screenshot(screenshot)
+
+        self.assertIsNotNone(screenshot.ingested)
+        self.assertEqual(screenshot.url, screenshot.image_url())
+
+
+class BenchmarkCommandTestCase(TestCase):
+    def test_benchmark_reports_percentiles(self):
+        user = User.objects.create(email="tester@example.org")
+        Link.objects.create(user=user, url="https://example.org")
+
+        out = io.StringIO()
+        call_command("benchmark", user.email, requests=5, stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertEqual(5, result["requests"])
+        self.assertTrue(result["p50_ms"] <= result["p99_ms"])
+
+    def test_benchmark_needs_two_requests(self):
+        user = User.objects.create(email="tester@example.org")
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark", user.email, requests=1, stdout=io.StringIO())
+
+    def test_seeded_links_are_reproducible(self):
+        user = User.objects.create(email="tester@example.org")
+        seed_user(user, 50, random.Random(1))
+        seeded = list(Link.objects.filter(user=user).values_list("id", "url"))
+
+        # tag counts are rebuilt after the bulk inserts
+        self.assertEqual(
+            LinkTag.objects.filter(content_object__user=user).count(),
+            sum(UserTagCount.objects.filter(user=user).values_list("count", flat=True)),
+        )
+
+        Link.objects.filter(user=user).delete()
+        seed_user(user, 50, random.Random(1))
+
+        self.assertEqual(50, len(seeded))
+        self.assertEqual(seeded, list(Link.objects.filter(user=user).values_list("id", "url")))
+
+    # the importers save one link at a time
+    @override_settings(QUERY_INSPECTION_RAISE=False)
+    def test_benchmark_suite_cleans_up(self):
+        user = User.objects.create(email="tester@example.org")
+        UserSettings.objects.create(user=user, github_pat="secret")
+        seed_user(user, 20, random.Random(1))
+
+        out = io.StringIO()
+        call_command("benchmark", user.email, suite=True, requests=2, stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertIn("import_feedbin", [endpoint["name"] for endpoint in result["endpoints"]])
+        self.assertEqual([], [endpoint["name"] for endpoint in result["endpoints"] if endpoint["errors"]])
+
+        self.assertEqual(20, Link.objects.filter(user=user).count())
+
+        # the imports ran as a throwaway user
+        self.assertEqual("secret", UserSettings.objects.get(user=user).github_pat)
+        self.assertEqual(["tester@example.org"], list(User.objects.values_list("email", flat=True)))
+        self.assertFalse(Link.objects.filter(url__startswith="https://benchmark.invalid/").exists())
+
+
+class BenchmarkServerTestCase(LiveServerTestCase):
+    def test_benchmark_over_http(self):
+        user = User.objects.create(email="tester@example.org")
+        seed_user(user, 20, random.Random(1))
+
+        out = io.StringIO()
+        call_command("benchmark", user.email, url=self.live_server_url, suite=True, requests=2, stdout=out)
+
+        # the posts are rejected without the session and CSRF token
+        result = json.loads(out.getvalue())
+        self.assertIn("api_link_screenshot", [endpoint["name"] for endpoint in result["endpoints"]])
+        self.assertNotIn("import_github", [endpoint["name"] for endpoint in result["endpoints"]])
+        self.assertEqual([], [endpoint["name"] for endpoint in result["endpoints"] if endpoint["errors"]])
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(20, Link.objects.filter(user=user).count())
+
+
+@override_settings(PERFORMANCE_METRICS=True)
+class PerformanceMetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        Link.objects.create(url="https://example.org", title="Example Site", user=self.user)
+        self.client.force_login(self.user)
+
+    def test_server_timing_header(self):
+        self.client.get("/")
+        response = self.client.get("/")
+
+        self.assertIn("total;dur=", response.headers["Server-Timing"])
+        self.assertRegex(response.headers["Server-Timing"], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn('cache;desc="2 hits, 0 misses"', response.headers["Server-Timing"])
+
+    def test_metrics_requires_staff_or_api_key(self):
+        self.client.get("/")
+        self.assertEqual(403, self.client.get("/metrics").status_code)
+
+        api_key = ApiKey.objects.create(user=self.user)
+        response = self.client.get("/metrics", headers={"authorization": f"Bearer {api_key.key}"})
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'bm2_request_duration_seconds_bucket{view="dashboard",le="+Inf"}')
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)  # the api key request logs out at the end
+        self.assertContains(self.client.get("/metrics"), 'bm2_db_queries_total{view="dashboard"}')
+
+    @override_settings(PERFORMANCE_METRICS=False)
+    def test_disabled(self):
+        self.assertNotIn("Server-Timing", self.client.get("/").headers)
+        self.assertEqual(404, self.client.get("/metrics").status_code)
+
+
+class QueryInspectionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        for i in range(12):
+            link = Link.objects.create(url=f"https://example.org/{i}", title=f"Example {i}", user=self.user)
+            link.tags.add("example", f"tag-{i}")
+            LinkScreenshot.objects.create(link=link, url=f"https://media.example.org/{i}.png")
+
+    def test_reports_repeated_queries_in_python(self):
+        with inspecting() as inspection:
+            for link in Link.objects.all():
+                list(link.tags.all())
+
+        report = inspection.report("test")
+        self.assertIn("12 repeated queries at links/tests.py:", report)
+        self.assertIn("in test_reports_repeated_queries_in_python", report)
+
+    def test_reports_repeated_queries_in_templates(self):
+        with inspecting() as inspection:
+            for link in Link.objects.all():
+                render_to_string("includes/link.html", {"link": link})
+
+        self.assertIn("repeated queries at includes/link.html:", inspection.report("test"))
+
+    def test_ignores_prefetched_queries(self):
+        with inspecting() as inspection:
+            for link in Link.objects.prefetch_related(*LINK_PREFETCH):
+                render_to_string("includes/link.html", {"link": link})
+
+        self.assertIsNone(inspection.report("test"))
+
+    def test_dashboard_has_no_repeated_queries(self):
+        # the test runner raises for repeated queries in any request
+        self.assertEqual(200, self.client.get("/").status_code)
+        self.assertEqual(200, self.client.get("/?json").status_code)
+        self.assertEqual(200, self.client.get("/?tag=example").status_code)
+
+    def test_raises_for_repeated_queries(self):
+        with override_settings(ROOT_URLCONF="links.tests"):
+            with self.assertRaises(RepeatedQueriesError):
+                self.client.get("/n-plus-one/")
+
+
+def n_plus_one(request):
+    return HttpResponse(", ".join(str(link.tags.count()) for link in Link.objects.all()))
+
+
+urlpatterns = [path("n-plus-one/", n_plus_one)]
+
+
+class CompressedStaticFilesTestCase(TestCase):
+    def test_collectstatic_writes_gzip_siblings(self):
+        static_root = tempfile.mkdtemp()
+
+        storages = {
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {"BACKEND": "bm2.storage.CompressedManifestStaticFilesStorage"},
+        }
+
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name("css/style.css")
+
+        for name in ["css/style.css", hashed]:
+            with open(f"{static_root}/{name}", "rb") as original, gzip.open(f"{static_root}/{name}.gz") as compressed:
+                self.assertEqual(original.read(), compressed.read())
+
+
 class WellKnownTestCase(TestCase):
     def test_robots(self):
         response = self.client.get("/robots.txt")
@@ -373,6 +1102,11 @@ class WellKnownTestCase(TestCase):
         response = self.client.get("/.well-known/security.txt")
         self.assertTrue("security@brntn.me" in response.content.decode())
 
+    def test_health(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/health/")
+        self.assertEqual(200, response.status_code)
+
 
 class DeleteLinkTestCase(TestCase):
     def setUp(self):
@@ -390,3 +1124,670 @@ class DeleteLinkTestCase(TestCase):
 
         self.assertEqual(404, response.status_code)
         self.assertEqual(1, Link.objects.count())
+
+
+class BulkDeleteTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        self.imported = []
+        for i in range(3):
+            link = Link.objects.create(url=f"https://github.com/example/{i}", user=self.user)
+            link.tags.add("github-starred", "python")
+            LinkScreenshot.objects.create(link=link, url=f"https://media.example.org/{i}.png")
+            self.imported.append(link)
+
+        self.kept = Link.objects.create(url="https://example.org", user=self.user)
+        self.kept.tags.add("python")
+
+    def counts(self):
+        return dict(UserTagCount.objects.filter(user=self.user).values_list("tag__slug", "count"))
+
+    def test_bulk_delete_by_source(self):
+        with self.assertNumQueries(27):
+            self.client.post("/delete/?source=github", {"delete": "Delete Permanently"})
+
+        self.assertEqual([self.kept], list(Link.all_objects.all()))
+        self.assertEqual(0, LinkScreenshot.objects.count())
+        self.assertEqual(1, LinkTag.objects.count())
+        self.assertEqual({"python": 1}, self.counts())
+
+    def test_bulk_delete_requires_a_filter(self):
+        self.client.post("/delete/")
+        self.assertEqual(4, Link.objects.count())
+
+    def test_bulk_delete_shows_count(self):
+        response = self.client.get("/delete/?tag=python")
+        self.assertContains(response, "Delete 4 Bookmarks")
+
+    def test_trash_and_restore(self):
+        self.client.post("/delete/?tag=github-starred", {"trash": "Move to Trash"})
+
+        self.assertEqual([self.kept], list(Link.objects.all()))
+        self.assertEqual({"python": 1}, self.counts())
+        self.assertNotContains(self.client.get("/"), "github.com/example")
+        self.assertContains(self.client.get("/trash/"), "github.com/example/0")
+
+        self.client.post(f"/trash/?id={self.imported[0].pk}", {"action": "restore"})
+        self.assertEqual({"python": 2, "github-starred": 1}, self.counts())
+
+        self.client.post("/trash/", {"action": "empty"})
+        self.assertEqual(2, Link.all_objects.count())
+        self.assertEqual({"python": 2, "github-starred": 1}, self.counts())
+
+    def test_empty_trash_command(self):
+        trash_links(self.user, Link.objects.filter(pk=self.kept.pk))
+        Link.all_objects.filter(pk=self.kept.pk).update(deleted=timezone.now() - timedelta(days=31))
+        trash_links(self.user, Link.objects.filter(pk=self.imported[0].pk))
+
+        call_command("empty_trash", stdout=io.StringIO())
+
+        self.assertEqual(3, Link.all_objects.count())
+        self.assertEqual({"python": 2, "github-starred": 2}, self.counts())
+
+    def test_api_bulk_delete(self):
+        ids = [str(link.pk) for link in self.imported[:2]]
+        response = self.client.post("/api/delete/", {"ids": ids, "trash": True}, content_type="application/json")
+
+        self.assertEqual({"trashed": 2}, response.json()["data"])
+        self.assertEqual(2, Link.objects.count())
+
+        response = self.client.post(
+            "/api/delete/", {"filter": {"domain": "github.com"}}, content_type="application/json"
+        )
+        self.assertEqual({"deleted": 1}, response.json()["data"])
+
+    def test_invalid_ids_are_bad_requests(self):
+        for url in ["/?id=abc", "/?id=abc&json", "/delete/?id=abc", "/tags/?id=abc", "/trash/?id=abc"]:
+            self.assertEqual(400, self.client.get(url).status_code, url)
+
+        self.assertEqual(400, self.client.post("/delete/?id=abc", {"trash": "Move to Trash"}).status_code)
+        self.assertEqual(4, Link.objects.count())
+
+    def test_api_bulk_delete_errors(self):
+        for body in [{}, {"ids": ["not-a-uuid"]}, {"filter": ["domain"]}, [str(self.kept.pk)], "x"]:
+            response = self.client.post("/api/delete/", body, content_type="application/json")
+            self.assertEqual(400, response.status_code)
+
+        self.assertEqual(400, self.client.post("/api/delete/", {"ids": [str(self.kept.pk)]}).status_code)
+        self.assertEqual(4, Link.objects.count())
+
+    def test_other_users_links_are_not_deleted(self):
+        other = User.objects.create(email="other@example.org")
+        link = Link.objects.create(url="https://github.com/other", user=other)
+
+        self.client.post("/api/delete/", {"ids": [str(link.pk)]}, content_type="application/json")
+        self.assertTrue(Link.objects.filter(pk=link.pk).exists())
+
+
+class BulkTagTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        self.links = []
+        for i in range(4):
+            link = Link.objects.create(url=f"https://example.org/{i}", user=self.user)
+            link.tags.add("github-starred")
+            self.links.append(link)
+
+        # tags created before TAGGIT_CASE_INSENSITIVE can differ only by case
+        self.links[0].tags.add("python")
+        self.links[2].tags.add("python")
+        upper = Tag.objects.create(name="Python")
+        LinkTag.objects.create(content_object=self.links[1], tag=upper)
+        LinkTag.objects.create(content_object=self.links[2], tag=upper)
+        rebuild_tag_counts(self.user.id)
+
+    def counts(self):
+        return dict(UserTagCount.objects.filter(user=self.user).values_list("tag__name", "count"))
+
+    def assertCountsMatchTags(self):
+        before = self.counts()
+        rebuild_tag_counts(self.user.id)
+        self.assertEqual(self.counts(), before)
+
+    def test_merge_tags(self):
+        response = self.client.post("/tags/", {"action": "rename", "tag": ["python", "python_1"], "name": "python"})
+
+        self.assertEqual(302, response.status_code)
+        self.assertEqual({"github-starred": 4, "python": 3}, self.counts())
+        self.assertEqual(["python"], [t.name for t in self.links[1].tags.all() if t.name != "github-starred"])
+        self.assertCountsMatchTags()
+
+    def test_rename_tag_only_changes_this_user(self):
+        other = Link.objects.create(url="https://example.org", user=User.objects.create(email="other@example.org"))
+        other.tags.add("github-starred")
+
+        self.client.post("/tags/", {"action": "rename", "tag": ["github-starred"], "name": "github"})
+
+        self.assertEqual({"github": 4, "python": 2, "Python": 2}, self.counts())
+        self.assertEqual(["github-starred"], [t.name for t in other.tags.all()])
+        self.assertCountsMatchTags()
+
+    def test_add_and_remove_tag_on_filtered_links(self):
+        self.client.post("/tags/?tag=python&tag=python_1&match=any", {"action": "add", "name": "languages"})
+        self.assertEqual(3, Link.objects.filter(tags__name="languages").count())
+
+        self.client.post("/tags/?id=" + str(self.links[0].pk), {"action": "remove", "name": "Languages"})
+        self.assertEqual(2, self.counts()["languages"])
+        self.assertCountsMatchTags()
+
+    def test_tags_page_shows_count(self):
+        self.assertContains(self.client.get("/tags/?tag=github-starred"), "Tag 4 Bookmarks")
+        self.assertNotContains(self.client.get("/tags/"), "Add to All")
+
+    def test_api_tags(self):
+        response = self.client.post(
+            "/api/tags/",
+            {"action": "add", "name": "example", "filter": {"domain": "example.org"}},
+            content_type="application/json",
+        )
+        self.assertEqual({"changed": 4}, response.json()["data"])
+
+        response = self.client.post(
+            "/api/tags/", {"action": "rename", "tags": ["Python"], "name": "python"}, content_type="application/json"
+        )
+        self.assertEqual({"changed": 2}, response.json()["data"])
+        self.assertEqual({"github-starred": 4, "python": 3, "example": 4}, self.counts())
+
+    def test_api_tags_errors(self):
+        for body in [
+            {"action": "add", "name": "example"},
+            {"action": "add", "filter": {"domain": "example.org"}},
+            {"action": "delete", "name": "example", "filter": {"domain": "example.org"}},
+            {"action": "add", "name": "example", "filter": "example.org"},
+            ["add", "example"],
+        ]:
+            response = self.client.post("/api/tags/", body, content_type="application/json")
+            self.assertEqual(400, response.status_code)
+
+
+class FakePage(io.BytesIO):
+    def __init__(self, content, content_type="text/html; charset=utf-8", url="https://example.org/"):
+        super().__init__(content)
+        self.headers = Message()
+        self.headers["Content-Type"] = content_type
+        self.status = 200
+        self.url = url
+
+    def geturl(self):
+        return self.url
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+        self.link = Link.objects.create(user=self.user, url="https://example.org")
+
+    def archive(self, *pages):
+        with mock.patch("links.archive.build_opener") as build_opener:
+            build_opener.return_value.open.side_effect = pages
+            return archive_link(self.link)
+
+    def page(self, paragraphs):
+        body = "".join(f"<p>{p}</p>" for p in paragraphs)
+        return f"<html><head><title>Example\n Page</title><style>p {{}}</style></head><body>{body}</body></html>"
+
+    def test_archives_text(self):
+        snapshot, stored = self.archive(FakePage(self.page(["Hello &amp; welcome", "Second"]).encode()))
+
+        self.assertEqual("Example Page", snapshot.title)
+        self.assertEqual("Hello & welcome\nSecond", snapshot.text())
+        self.assertTrue(snapshot.text_chunks.endswith(".gz"))
+        self.assertEqual("", snapshot.html_chunks)
+        self.assertTrue(0 < stored)
+
+    def test_recrawl_reuses_chunks(self):
+        rng = random.Random(0)
+        words = "the page about what happened next and why it matters for everyone reading".split()
+        paragraphs = [" ".join(rng.choices(words, k=40)) for i in range(300)]
+        first, stored = self.archive(FakePage(self.page(paragraphs).encode()))
+        second, stored_again = self.archive(FakePage(self.page(["A new paragraph at the top"] + paragraphs).encode()))
+
+        first_chunks, second_chunks = first.text_chunks.split(), second.text_chunks.split()
+        self.assertTrue(len(first_chunks) > 3)
+        self.assertEqual(first_chunks[1:], second_chunks[1:])
+        self.assertTrue(stored_again < stored / 2)
+        self.assertEqual("A new paragraph at the top\n" + first.text(), second.text())
+
+    def test_unchanged_page_keeps_one_snapshot(self):
+        self.archive(FakePage(b"<p>Same</p>"))
+        self.archive(FakePage(b"<p>Same</p>"))
+        self.assertEqual(1, self.link.snapshots.count())
+
+    @override_settings(ARCHIVE_HTML=True)
+    def test_archived_html_is_sandboxed(self):
+        snapshot, _ = self.archive(FakePage(b"<p>Hello</p><script>alert(1)</script>"))
+
+        response = self.client.get(f"{snapshot.get_absolute_url()}?html")
+        self.assertEqual(b"<p>Hello</p><script>alert(1)</script>", b"".join(response.streaming_content))
+        self.assertTrue(response.headers["Content-Security-Policy"].endswith("; sandbox"))
+
+        response = self.client.get(snapshot.get_absolute_url())
+        self.assertEqual("text/plain; charset=utf-8", response.headers["Content-Type"])
+        self.assertEqual(b"Hello", b"".join(response.streaming_content))
+
+    def test_records_errors(self):
+        snapshot, _ = self.archive(FakePage(b"%PDF", content_type="application/pdf"))
+        self.assertEqual("Not archived: application/pdf", snapshot.error)
+
+        self.link.url = "http://127.0.0.1/"
+        snapshot, _ = self.archive()
+        self.assertEqual("Unsafe URL", snapshot.error)
+
+    def test_pending_links(self):
+        self.assertEqual([self.link], list(pending_links()))
+
+        self.archive(FakePage(b"<p>Hello</p>"))
+        self.assertEqual([], list(pending_links()))
+        self.assertEqual([self.link], list(pending_links(timedelta(0))))
+
+    def test_other_users_snapshots_are_private(self):
+        snapshot, _ = self.archive(FakePage(b"<p>Hello</p>"))
+        self.client.force_login(User.objects.create(email="other@example.org"))
+        self.assertEqual(404, self.client.get(snapshot.get_absolute_url()).status_code)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        self.brief = self.archived("https://example.org/1", "<p>A quick brown fox jumps over the dog</p>")
+        self.foxes = self.archived("https://example.org/2", "<title>Foxes</title><p>Foxes, foxes everywhere</p>")
+        self.titled = Link.objects.create(user=self.user, url="https://example.org/3", title="A fox in the title")
+        Link.objects.create(user=self.user, url="https://example.org/4", title="Nothing to see")
+
+    def archived(self, url, html):
+        link = Link.objects.create(user=self.user, url=url)
+        with mock.patch("links.archive.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = FakePage(html.encode())
+            archive_link(link)
+        return link
+
+    def search(self, params):
+        return [link.url for link in self.client.get(f"/?{params}").context["links"]]
+
+    def test_ranks_archived_matches_first(self):
+        self.assertEqual([self.foxes.url, self.brief.url, self.titled.url], self.search("q=fox"))
+        self.assertEqual([self.brief.url], self.search("q=jumping+DOG"))
+
+    def test_paginates_results(self):
+        self.assertEqual([self.brief.url], self.search("q=fox&limit=1&page=2"))
+        self.assertEqual([self.titled.url], self.search("q=fox&limit=1&page=3"))
+
+        response = self.client.get("/?q=fox&limit=2&json")
+        self.assertEqual([self.foxes.url, self.brief.url], [link["url"] for link in response.json()["data"]])
+        self.assertIn("page=2", response.json()["next"])
+
+    def test_query_syntax_is_ignored(self):
+        self.assertEqual([self.brief.url], self.search('q="quick+(brown*'))
+        self.assertEqual([], self.search("q=%22%22"))
+
+    def test_index_follows_archive_and_delete(self):
+        with mock.patch("links.archive.build_opener") as build_opener:
+            build_opener.return_value.open.return_value = FakePage(b"<p>Rewritten completely</p>")
+            archive_link(self.brief)
+
+        self.assertEqual([], self.search("q=quick"))
+        self.assertEqual([self.brief.url], self.search("q=rewritten"))
+
+        delete_links(self.user, Link.objects.filter(pk=self.brief.pk))
+        self.assertEqual([], self.search("q=rewritten"))
+        self.assertEqual(1, SearchDocument.objects.count())
+
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO links_search(links_search) VALUES ('integrity-check')")
+
+    def test_index_does_not_store_the_text(self):
+        self.assertEqual(["id", "link_id", "title"], sorted(field.attname for field in SearchDocument._meta.fields))
+
+        # a contentless FTS5 table returns NULL for every column
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT title, text FROM links_search")
+                self.assertEqual({(None, None)}, set(cursor.fetchall()))
+
+    def test_rebuild_index(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual([self.titled.url], self.search("q=fox"))
+
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual([self.foxes.url, self.brief.url, self.titled.url], self.search("q=fox"))
+
+
+class DuplicatesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        text = "We rewrote the query planner and the storage engine over the last year. " * 5
+        self.original = self.link("https://example.org/faster", "How we made our database ten times faster", text)
+        self.mirror = self.link(
+            "https://news.example.com/item?id=1", "How we made our database ten times faster | Example News", text
+        )
+        self.other = self.link("https://example.org/bread", "A recipe for bread", "Flour, water and salt. " * 5)
+        self.untitled = self.link("https://example.org/untitled", "", "")
+
+        other_user = User.objects.create(email="other@example.org")
+        Link.objects.create(user=other_user, url=self.original.url, title=self.original.title)
+
+        call_command("compute_signatures", stdout=io.StringIO())
+
+    def link(self, url, title, text):
+        link = Link.objects.create(user=self.user, url=url, title=title)
+        if text:
+            LinkSnapshot.objects.create(link=link, fetched=timezone.now(), text_chunks=save_chunks(text.encode())[0])
+        return link
+
+    def test_finds_possible_duplicates(self):
+        self.original.refresh_from_db()
+        self.assertEqual([self.mirror], possible_duplicates(self.original))
+
+        self.untitled.refresh_from_db()
+        self.assertEqual(0, self.untitled.simhash)
+        self.assertEqual([], possible_duplicates(self.untitled))
+
+        response = self.client.get("/duplicates/")
+        self.assertEqual([[self.original, self.mirror]], response.context["groups"])
+
+    def test_merge(self):
+        self.original.tags.add("databases")
+        self.mirror.tags.add("databases", "hn-fav")
+        self.mirror.note = "Great discussion"
+        self.mirror.save()
+        LinkScreenshot.objects.create(link=self.mirror, url="https://example.org/screenshot.png")
+
+        response = self.client.post(
+            "/duplicates/", {"keep": self.original.pk, "id": [self.original.pk, self.mirror.pk]}
+        )
+
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(Link.objects.filter(pk=self.mirror.pk).exists())
+        self.assertEqual(["databases", "hn-fav"], sorted(self.original.tags.names()))
+        self.assertEqual({"databases": 1, "hn-fav": 1}, {c.tag.name: c.count for c in tag_counts(self.user)})
+        self.assertEqual(1, self.original.linkscreenshot_set.count())
+
+        self.original.refresh_from_db()
+        self.assertEqual("Great discussion", self.original.note)
+        self.assertEqual([], self.client.get("/duplicates/").context["groups"])
+
+    def test_editing_the_title_updates_the_signature(self):
+        self.client.post(f"/edit/{self.mirror.pk}/", {"url": self.mirror.url, "title": "Something else entirely"})
+        LinkSnapshot.objects.filter(link=self.mirror).delete()
+        update_signatures([self.mirror.pk])
+
+        self.original.refresh_from_db()
+        self.assertEqual([], possible_duplicates(self.original))
+
+
+class RelatedLinksTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        self.link = self.tagged("https://example.org/sqlite", "sqlite", "databases", "python")
+        self.same_tags = self.tagged("https://example.com/wal", "sqlite", "databases")
+        self.same_domain = self.tagged("https://example.org/postgres", "databases")
+        self.common_tag = self.tagged("https://example.net/flask", "python")
+        self.unrelated = self.tagged("https://example.net/bread", "baking")
+        for i in range(5):
+            self.tagged(f"https://example.net/{i}", "python")
+
+    def tagged(self, url, *tags):
+        link = Link.objects.create(user=self.user, url=url)
+        link.tags.add(*tags)
+        return link
+
+    def related(self, link):
+        return [item.related for item in related_links(link)]
+
+    def test_related_links(self):
+        call_command("update_related_links", stdout=io.StringIO())
+
+        related = self.related(self.link)
+        self.assertEqual([self.same_tags, self.same_domain], related[:2])
+        self.assertIn(self.common_tag, related)
+        self.assertNotIn(self.unrelated, related)
+        self.assertEqual([], self.related(self.unrelated))
+
+        response = self.client.get(f"/api/{self.link.pk}/")
+        self.assertEqual(str(self.same_tags.pk), response.json()["data"]["related"][0]["id"])
+
+        with self.assertNumQueries(1):
+            self.related(self.link)
+
+    def test_editing_tags_refreshes_related_links(self):
+        call_command("update_related_links", stdout=io.StringIO())
+        self.assertEqual([], self.related(self.unrelated))
+
+        self.client.post(f"/edit/{self.unrelated.pk}/", {"url": self.unrelated.url, "tags": "baking, sqlite"})
+
+        self.assertEqual({self.link, self.same_tags}, set(self.related(self.unrelated)))
+        self.assertIn(self.unrelated, self.related(self.link))
+
+        response = self.client.get(f"/edit/{self.unrelated.pk}/")
+        self.assertContains(response, self.link.url)
+
+    def test_deleted_links_are_removed(self):
+        call_command("update_related_links", stdout=io.StringIO())
+
+        trash_links(self.user, Link.objects.filter(pk=self.same_tags.pk))
+        self.assertNotIn(self.same_tags, self.related(self.link))
+        self.assertIsNone(Link.objects.get(pk=self.link.pk).related_updated)
+
+        call_command("update_related_links", stdout=io.StringIO())
+        self.assertEqual(self.same_domain, self.related(self.link)[0])
+
+        delete_links(self.user, Link.all_objects.filter(pk=self.same_domain.pk))
+        self.assertEqual(0, RelatedLink.objects.filter(related_id=self.same_domain.pk).count())
+        self.assertIsNone(Link.objects.get(pk=self.link.pk).related_updated)
+
+        call_command("update_related_links", stdout=io.StringIO())
+        self.assertNotIn(self.same_domain, self.related(self.link))
+        self.assertIn(self.common_tag, self.related(self.link))
+
+
+class TagSuggestionsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+        for title in ["Django tips", "Python packaging", "Flask tutorial for python", "Django python async views"]:
+            Link.objects.create(user=self.user, url=f"https://example.org/{title}", title=title).tags.add("python")
+        for title in ["Sourdough bread", "Bread baking basics", "Sourdough starter"]:
+            Link.objects.create(user=self.user, url=f"https://example.com/{title}", title=title).tags.add("baking")
+
+    def model(self):
+        return sorted(UserTokenCount.objects.values_list("token", "count")), sorted(
+            UserTagTokenCount.objects.values_list("tag__name", "token", "count")
+        )
+
+    def test_suggest_tags(self):
+        link = Link(url="https://example.net/django", title="Upgrading Django")
+        self.assertEqual(["python"], [tag.name for tag, probability in suggest_tags(self.user, link)])
+        self.assertEqual([], suggest_tags(self.user, link, ["Python"]))
+        self.assertEqual([], suggest_tags(self.user, Link(url="https://example.net/", title="Something new")))
+
+        response = self.client.get("/add/", {"url": "https://example.net/sourdough", "title": "Sourdough pizza"})
+        tag, url = response.context["suggestions"][0]
+        self.assertEqual("baking", tag.name)
+        self.assertIn("tags=baking", url)
+
+    def test_model_follows_changes(self):
+        links = Link.objects.filter(user=self.user)
+        self.client.post(f"/edit/{links[0].pk}/", {"url": links[0].url, "title": "Bread", "tags": "baking"})
+        trash_links(self.user, links.filter(pk=links[1].pk))
+        delete_links(self.user, links.filter(pk=links[2].pk))
+        links[3].delete()
+        update_pending_suggestions(self.user)
+
+        trained = self.model()
+        call_command("train_tag_suggestions", "--all", stdout=io.StringIO())
+        self.assertEqual(trained, self.model())
+
+    def test_import_adds_suggested_tags(self):
+        for title in ["Django REST", "Django debug toolbar"]:
+            Link.objects.create(user=self.user, url=f"https://example.org/{title}", title=title).tags.add("python")
+
+        stars = [
+            {
+                "repo": {
+                    "html_url": "https://github.com/django/django",
+                    "full_name": "django/django",
+                    "description": "The Web framework for perfectionists with deadlines.",
+                    "topics": ["web"],
+                },
+                "starred_at": "2023-06-29T23:39:35Z",
+            }
+        ]
+        self.assertEqual(1, save_stars(self.user, stars))
+
+        link = Link.objects.get(url="https://github.com/django/django")
+        self.assertEqual(["github-starred", "python", "web"], sorted(link.tags.names()))
+        self.assertEqual(
+            {"baking": 3, "github-starred": 1, "python": 7, "web": 1},
+            {c.tag.name: c.count for c in tag_counts(self.user)},
+        )
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="tester@example.org")
+        self.client.force_login(self.user)
+
+    def rollups(self):
+        return sorted(DailyLinkCount.objects.values_list("user_id", "day", "count")), sorted(
+            DomainLinkCount.objects.values_list("user_id", "domain", "count")
+        )
+
+    def test_rollups_follow_changes(self):
+        links = [Link.objects.create(user=self.user, url=f"https://example.org/{i}") for i in range(5)]
+        Link.objects.create(user=User.objects.create(email="other@example.org"), url="https://example.com/")
+
+        links[0].added = timezone.now() - timedelta(days=400)
+        links[0].save()
+        links[1].url = "https://example.com/moved"
+        links[1].save()
+        trash_links(self.user, Link.objects.filter(pk=links[2].pk))
+        delete_links(self.user, Link.objects.filter(pk=links[3].pk))
+        links[4].delete()
+        save_stars(
+            self.user,
+            [
+                {
+                    "repo": {
+                        "html_url": "https://github.com/sesh/bm2",
+                        "full_name": "sesh/bm2",
+                        "description": "",
+                        "topics": [],
+                    },
+                    "starred_at": "2023-06-29T23:39:35Z",
+                }
+            ],
+        )
+
+        updated = self.rollups()
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(updated, self.rollups())
+
+        restore_links(self.user, Link.all_objects.filter(pk=links[2].pk))
+        restored = self.rollups()
+        self.assertNotEqual(updated, restored)
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(restored, self.rollups())
+
+    def test_stats(self):
+        for url in ["https://example.org/1", "https://example.org/2", "https://github.com/sesh/bm2"]:
+            Link.objects.create(user=self.user, url=url)
+        Link.objects.get(url="https://github.com/sesh/bm2").tags.add(SOURCE_TAGS["github"], "python")
+
+        stats = self.client.get("/api/stats/").json()["data"]
+        self.assertEqual(3, stats["total"])
+        self.assertEqual({"date": timezone.localdate().isoformat(), "count": 3}, stats["days"][-1])
+        self.assertEqual([{"month": timezone.localdate().strftime("%Y-%m"), "count": 3}], stats["months"])
+        self.assertEqual({"domain": "example.org", "count": 2}, stats["domains"][0])
+        self.assertIn({"source": "github", "count": 1}, stats["sources"])
+        self.assertIn({"source": "other", "count": 2}, stats["sources"])
+
+        response = self.client.get("/stats/")
+        self.assertContains(response, "/?domain=example.org")
+        self.assertContains(response, "/?tag=python")
+
+    def test_calendar(self):
+        link = Link.objects.create(user=self.user, url="https://example.org/")
+        link.added = timezone.make_aware(datetime(2021, 3, 14, 12))
+        link.save()
+        Link.objects.create(user=self.user, url="https://example.org/today")
+
+        response = self.client.get("/calendar/2021/")
+        self.assertContains(response, 'href="/?date=2021-03-14"')
+        self.assertContains(response, 'href="/?month=2021-03"')
+        self.assertNotContains(response, 'href="/?month=2021-04"')
+        self.assertEqual(1, response.context["calendar"]["total"])
+        self.assertEqual([2021, timezone.localdate().year], response.context["years"])
+
+        # the latest year by default
+        response = self.client.get("/calendar/")
+        self.assertEqual(timezone.localdate().year, response.context["calendar"]["year"])
+        self.assertEqual(404, self.client.get("/calendar/9999/").status_code)
+
+
+class SchedulerTestCase(TestCase):
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = TokenBucket(0.5, 2, clock=lambda: now[0])
+
+        self.assertEqual([0, 0, 2.0], [bucket.take(), bucket.take(), bucket.take()])
+        now[0] = 1.0
+        self.assertEqual(1.0, bucket.take())
+        now[0] = 100.0
+        self.assertEqual([0, 0, 2.0], [bucket.take(), bucket.take(), bucket.take()])
+
+    async def test_run_due_imports(self):
+        user = await User.objects.acreate(email="tester@example.org")
+        await UserSettings.objects.acreate(
+            user=user, github_pat="AAA", feedbin_username="aaa", feedbin_password="aaa"  # nosec
+        )
+        await sync_to_async(schedule_imports)()
+        self.assertEqual(
+            {"github", "feedbin"}, {source async for source in ScheduledImport.objects.values_list("source", flat=True)}
+        )
+
+        # a user without settings any more is unscheduled
+        other = await User.objects.acreate(email="other@example.org")
+        await ScheduledImport.objects.acreate(user=other, source="hackernews", next_run=timezone.now())
+        await ScheduledImport.objects.all().aupdate(next_run=timezone.now() - timedelta(minutes=1))
+
+        stars = [
+            {
+                "repo": {"html_url": "https://github.com/sesh/bm2", "full_name": "sesh/bm2", "description": ""},
+                "starred_at": "2023-06-29T23:39:35Z",
+            }
+        ]
+
+        def get(url, **kwargs):
+            return httpx.Response(200, json=stars) if "github" in url else httpx.Response(401)
+
+        with mock.patch("httpx.AsyncClient.get", side_effect=get):
+            results = await run_due_imports()
+            self.assertEqual([], await run_due_imports())  # they've all moved on
+
+        self.assertEqual(3, len(results))
+        self.assertFalse(await ScheduledImport.objects.filter(user=other).aexists())
+
+        github = await ScheduledImport.objects.aget(user=user, source="github")
+        self.assertEqual((1, 0, ""), (github.last_count, github.failures, github.error))
+        self.assertLess(
+            abs(github.next_run - github.last_run - IMPORT_INTERVAL), IMPORT_INTERVAL * IMPORT_JITTER * 1.01
+        )
+
+        feedbin = await ScheduledImport.objects.aget(user=user, source="feedbin")
+        self.assertEqual((1, "ExpiredCredentialException"), (feedbin.failures, feedbin.error))
+        self.assertGreater(feedbin.next_run - feedbin.last_run, IMPORT_INTERVAL * 1.5)
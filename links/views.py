@@ -1,24 +1,66 @@
 import json
+import random
 from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import Q, prefetch_related_objects
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-
+from taggit.models import Tag
+from taggit.utils import edit_string_for_tags, parse_tags
+
+from links.blobs import open_blob
+from links.bulk import (
+    add_tag,
+    delete_links,
+    remove_tag,
+    rename_tags,
+    restore_links,
+    trash_links,
+)
+from links.cache import cached
+from links.dates import calendar_year, date_range, link_years
+from links.duplicates import duplicate_groups, merge_links, update_signatures
 from links.forms import LinkForm, UserSettingsForm
+from links.icons import PLACEHOLDER_ICON, attach_icons
 from links.importers import (
+    SOURCE_TAGS,
     ExpiredCredentialException,
     MissingCredentialException,
     feedbin,
     github,
     hackernews,
 )
-from links.models import Link, LinkScreenshot, UserSettings
+from links.models import (
+    Favicon,
+    Link,
+    LinkScreenshot,
+    LinkSnapshot,
+    UserSettings,
+    random_key,
+)
+from links.related import refresh_related, related_links
+from links.search import SearchResults, has_search_index, matching_documents
 from links.ssrf import uri_is_safe
+from links.stats import link_stats
+from links.suggestions import suggest_tags
+from links.tags import filter_by_tags, tag_counts
+
+# everything includes/link.html and Link.as_json use
+LINK_PREFETCH = ["tags", "linkscreenshot_set", "snapshots"]
 
 
 def build_absolute_uri_with_added_params(request, *, params={}):
@@ -33,28 +75,81 @@ def build_absolute_uri_with_added_params(request, *, params={}):
     return url
 
 
-@login_required
-def dashboard(request):
-    links = Link.objects.filter(user=request.user)
+def bad_request(message):
+    return JsonResponse({"errors": [{"code": "bad_request", "message": message}]}, status=400)
+
+
+def invalid_filter(request, error):
+    # a filter that can't be applied, like ?id=abc or ?month=2024-13
+    message = " ".join(error.messages)
+    return bad_request(message) if "json" in request.GET else HttpResponseBadRequest(message)
+
 
-    # filtering
-    if "domain" in request.GET:
-        domain = request.GET["domain"]
+def random_links(links, limit):
+    # seek to a random point in the (user, random_key) index and read forward,
+    # wrapping around to the start if we run off the end
+    pivot = random_key()
+    sample = list(links.filter(random_key__gte=pivot).order_by("random_key")[:limit])
+
+    if len(sample) < limit:
+        sample += links.filter(random_key__lt=pivot).order_by("random_key")[: limit - len(sample)]
+
+    random.shuffle(sample)  # nosec - not security sensitive
+    return sample
+
+
+def page_of_links(links, page, limit):
+    current_page = Paginator(links, limit).page(page)
+    links = list(current_page.object_list)
+    prefetch_related_objects(links, *LINK_PREFETCH)
+    return links, current_page.has_next(), current_page.has_previous()
+
+
+FILTERS = ["domain", "date", "from", "to", "month", "year", "tag", "source", "q", "id"]
+
+
+def filter_links(links, params):
+    # the dashboard filters, shared with the bulk operations so they act on exactly what was shown
+    if "domain" in params:
+        domain = params["domain"]
         links = links.filter(Q(url__startswith=f"https://{domain}") | Q(url__startswith=f"http://{domain}"))
 
-    if "date" in request.GET:
-        d = request.GET["date"]
-        links = links.filter(added__date=d)
+    # ?date, ?from, ?to, ?month and ?year, as a range of `added` that can use its index
+    start, end = date_range(params)
+    if start:
+        links = links.filter(added__gte=start)
+    if end:
+        links = links.filter(added__lt=end)
+
+    if "tag" in params:
+        # ?tag=a&tag=b matches links with all of the tags, add &match=any for links with any of them
+        links = filter_by_tags(links, params.getlist("tag"), match=params.get("match", "all"))
 
-    if "tag" in request.GET:
-        tag = request.GET["tag"]
-        links = links.filter(tags__slug__iexact=tag)
+    if "source" in params:
+        links = filter_by_tags(links, [SOURCE_TAGS.get(source, source) for source in params.getlist("source")], "any")
 
-    if "q" in request.GET:
-        query = request.GET["q"]
+    if "q" in params:
+        # the URL, title and tags, or the archived page's text
+        query = params["q"]
         links = links.filter(
-            Q(url__icontains=query) | Q(title__icontains=query) | Q(tags__slug__iexact=query)
-        ).distinct()
+            Q(url__icontains=query)
+            | Q(title__icontains=query)
+            | Q(id__in=filter_by_tags(links, [query]).values("id"))
+            | Q(id__in=matching_documents(query).values("link_id"))
+        )
+
+    if "id" in params:
+        links = links.filter(id__in=params.getlist("id"))
+
+    return links
+
+
+def is_filtered(params):
+    return any(f in params for f in FILTERS)
+
+
+def dashboard_links(request):
+    links = filter_links(Link.objects.filter(user=request.user), request.GET)
 
     if "limit" in request.GET:
         limit = int(request.GET["limit"])
@@ -62,27 +157,49 @@ def dashboard(request):
     else:
         limit = 100
 
+    next_url, prev_url = None, None
+
     if "random" in request.GET:
-        links = links.order_by("?")
+        # a random sample isn't paginated, reload for another one
+        links = random_links(links, limit)
+        prefetch_related_objects(links, *LINK_PREFETCH)
+    else:
+        try:
+            page = int(request.GET.get("page", 1))
+        except ValueError:
+            page = 1
+
+        if "q" in request.GET and has_search_index():
+            # best matches first, rather than newest
+            links = SearchResults(links, request.GET["q"])
+
+        # the unfiltered first page is by far the most requested, keep it until the user's data changes
+        if page == 1 and not set(request.GET) - {"json", "limit", "page"}:
+            links, has_next, has_previous = cached(
+                request.user, f"dashboard:{limit}", lambda: page_of_links(links, page, limit)
+            )
+        else:
+            links, has_next, has_previous = page_of_links(links, page, limit)
 
-    # pagination
-    paginator = Paginator(links, limit)
+        if has_next:
+            next_url = build_absolute_uri_with_added_params(request, params={"page": page + 1})
 
-    try:
-        page = int(request.GET.get("page", 1))
-    except ValueError:
-        page = 1
+        if has_previous:
+            prev_url = build_absolute_uri_with_added_params(request, params={"page": page - 1})
 
-    current_page = paginator.page(page)
-    next_url, prev_url = None, None
+    return attach_icons(links), next_url, prev_url
 
-    if current_page.has_next():
-        next_url = build_absolute_uri_with_added_params(request, params={"page": page + 1})
 
-    if current_page.has_previous():
-        prev_url = build_absolute_uri_with_added_params(request, params={"page": page - 1})
+def dashboard_tags(user):
+    return cached(user, "tags", lambda: list(tag_counts(user)))
 
-    links = current_page.object_list.prefetch_related("tags").prefetch_related("linkscreenshot_set")
+
+@login_required
+def dashboard(request):
+    try:
+        links, next_url, prev_url = dashboard_links(request)
+    except ValidationError as e:
+        return invalid_filter(request, e)
 
     if "json" in request.GET:
         data = {
@@ -99,10 +216,26 @@ def dashboard(request):
             "links": links,
             "next": next_url,
             "prev": prev_url,
+            "tags": dashboard_tags(request.user),
+            "filtered": is_filtered(request.GET),
         },
     )
 
 
+def tag_suggestions(request):
+    # for the bookmarklet's ?url and ?title, each linking back to the form with the tag added
+    tags = parse_tags(request.GET.get("tags", ""))
+    link = Link(url=request.GET["url"], title=request.GET.get("title", ""), note=request.GET.get("note", ""))
+    suggestions = []
+
+    for tag, probability in suggest_tags(request.user, link, tags):
+        params = request.GET.copy()
+        params["tags"] = edit_string_for_tags([Tag(name=name) for name in tags] + [tag])
+        suggestions.append((tag, f"?{params.urlencode()}"))
+
+    return suggestions
+
+
 @login_required
 def add(request):
     url = request.GET.get("url")
@@ -112,23 +245,29 @@ def add(request):
         if existing_links:
             return redirect(existing_links[0])
 
+    suggestions = []
+
     if request.method == "POST":
         form = LinkForm(request.POST)
 
         if form.is_valid():
-            link = form.save()
+            # the user has to be set before the tags are saved so that they're counted against them
+            link = form.save(commit=False)
             link.user = request.user
             link.save()
+            form.save_m2m()
+            refresh_related(link)
 
             messages.info(request, "Bookmark added")
             return redirect("/")
     else:
         if url:
             form = LinkForm(request.GET)
+            suggestions = tag_suggestions(request)
         else:
             form = LinkForm()
 
-    return render(request, "add.html", {"form": form})
+    return render(request, "add.html", {"form": form, "suggestions": suggestions})
 
 
 @login_required
@@ -139,12 +278,16 @@ def edit(request, pk):
         form = LinkForm(request.POST, instance=link)
         if form.is_valid():
             form.save()
+            if "title" in form.changed_data:
+                update_signatures([link.pk])
+            if "tags" in form.changed_data:
+                refresh_related(link)
             messages.info(request, "Bookmark saved successfully")
             return redirect("/")
     else:
         form = LinkForm(instance=link)
 
-    return render(request, "edit.html", {"form": form})
+    return render(request, "edit.html", {"form": form, "related": related_links(link)})
 
 
 def screenshot(request, pk):
@@ -153,10 +296,53 @@ def screenshot(request, pk):
     screenshot = get_object_or_404(LinkScreenshot, pk=pk)
     if request.user == screenshot.link.user:
         link = screenshot.link
+        related = related_links(link)
     else:
         link = None
+        related = None
+
+    return render(request, "screenshot.html", {"screenshot": screenshot, "link": link, "related": related})
+
+
+@login_required
+def snapshot(request, pk):
+    # the archived text, or the archived HTML with ?html, streamed a chunk at a time
+    snapshot = get_object_or_404(LinkSnapshot, pk=pk, link__user=request.user)
+
+    if "html" in request.GET and snapshot.html_chunks:
+        response = StreamingHttpResponse(snapshot.stream_html(), content_type="text/html; charset=utf-8")
+        response.csp_sandbox = True
+    elif snapshot.text_chunks:
+        response = StreamingHttpResponse(snapshot.stream_text(), content_type="text/plain; charset=utf-8")
+    else:
+        raise Http404()
+
+    return response
+
+
+def icon(request, digest):
+    # icons are content addressed so they can be cached forever
+    favicon = Favicon.objects.filter(digest=digest).first()
+    if not favicon:
+        raise Http404()
+
+    response = FileResponse(open_blob(digest), content_type=favicon.content_type)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@login_required
+def domain_icon(request, domain):
+    favicon = Favicon.objects.filter(domain=domain).exclude(digest="").first()
 
-    return render(request, "screenshot.html", {"screenshot": screenshot, "link": link})
+    if favicon:
+        response = redirect("icon", digest=favicon.digest)
+        response.headers["Cache-Control"] = "private, max-age=86400"
+    else:
+        response = HttpResponse(PLACEHOLDER_ICON, content_type="image/gif")
+        response.headers["Cache-Control"] = "private, max-age=3600"
+
+    return response
 
 
 @login_required
@@ -164,12 +350,130 @@ def delete(request, pk):
     link = get_object_or_404(Link, pk=pk, user=request.user)
 
     if request.method == "POST":
-        link.delete()
+        if "trash" in request.POST:
+            trash_links(request.user, Link.objects.filter(pk=link.pk))
+        else:
+            delete_links(request.user, Link.objects.filter(pk=link.pk))
         return redirect("/")
 
     return render(request, "delete.html", {"link": link})
 
 
+@login_required
+def bulk_delete(request):
+    # takes the dashboard filters (or ?id=...&id=...) and deletes, or moves to the trash, every matching link
+    if not is_filtered(request.GET):
+        messages.warning(request, "Filter the bookmarks to delete first")
+        return redirect("/")
+
+    try:
+        links = filter_links(Link.objects.filter(user=request.user), request.GET)
+    except ValidationError as e:
+        return invalid_filter(request, e)
+
+    if request.method == "POST":
+        if "trash" in request.POST:
+            count = trash_links(request.user, links)
+            messages.info(request, f"Moved {count} bookmarks to the trash")
+        else:
+            count = delete_links(request.user, links)
+            messages.info(request, f"Deleted {count} bookmarks")
+        return redirect("/")
+
+    sample = list(links[:10])
+    prefetch_related_objects(sample, *LINK_PREFETCH)
+    return render(request, "bulk_delete.html", {"count": links.count(), "links": attach_icons(sample)})
+
+
+@login_required
+def tags(request):
+    # renames and merges the user's tags, and adds or removes a tag on every link matching the dashboard filters
+    filtered = is_filtered(request.GET)
+
+    try:
+        links = filter_links(Link.objects.filter(user=request.user), request.GET)
+    except ValidationError as e:
+        return invalid_filter(request, e)
+
+    if request.method == "POST":
+        action = request.POST.get("action")
+        name = request.POST.get("name", "").strip()
+
+        if not name:
+            messages.warning(request, "Enter a tag name")
+        elif action == "rename":
+            count = rename_tags(request.user, request.POST.getlist("tag"), name)
+            messages.info(request, f"Moved {count} bookmarks to #{name}")
+        elif action == "add" and filtered:
+            count = add_tag(request.user, links, name)
+            messages.info(request, f"Added #{name} to {count} bookmarks")
+        elif action == "remove" and filtered:
+            count = remove_tag(request.user, links, name)
+            messages.info(request, f"Removed #{name} from {count} bookmarks")
+
+        return redirect(request.get_full_path())
+
+    return render(
+        request,
+        "tags.html",
+        {"tags": tag_counts(request.user, limit=None), "count": links.count() if filtered else None},
+    )
+
+
+@login_required
+def trash(request):
+    try:
+        links = filter_links(Link.all_objects.filter(user=request.user).exclude(deleted=None), request.GET)
+    except ValidationError as e:
+        return invalid_filter(request, e)
+
+    if request.method == "POST":
+        if request.POST.get("action") == "restore":
+            count = restore_links(request.user, links)
+            messages.info(request, f"Restored {count} bookmarks")
+        elif request.POST.get("action") == "empty":
+            count = delete_links(request.user, links)
+            messages.info(request, f"Deleted {count} bookmarks")
+        return redirect("/trash/")
+
+    return render(request, "trash.html", {"links": links.order_by("-deleted")[:100], "count": links.count()})
+
+
+@login_required
+def stats(request):
+    return render(request, "stats.html", {"stats": cached(request.user, "stats", lambda: link_stats(request.user))})
+
+
+@login_required
+def calendar(request, year=None):
+    years = cached(request.user, "calendar", lambda: link_years(request.user))
+    year = year or (years[-1] if years else timezone.localdate().year)
+    if not 1 < year < 9999:
+        raise Http404()
+
+    return render(
+        request,
+        "calendar.html",
+        {
+            "calendar": cached(request.user, f"calendar:{year}", lambda: calendar_year(request.user, year)),
+            "years": years,
+            "previous": year - 1,
+            "next": year + 1,
+        },
+    )
+
+
+@login_required
+def duplicates(request):
+    if request.method == "POST":
+        keep = get_object_or_404(Link, pk=request.POST.get("keep"), user=request.user)
+        count = merge_links(request.user, keep, Link.objects.filter(id__in=request.POST.getlist("id")))
+        messages.info(request, f"Merged {count} bookmarks into {keep.title or keep.url}")
+        return redirect("/duplicates/")
+
+    return render(request, "duplicates.html", {"groups": duplicate_groups(request.user)})
+
+
 @login_required
 def user_settings(request):
     user_settings_obj, created = UserSettings.objects.get_or_create(user=request.user)
@@ -239,6 +543,11 @@ def import_hackernews(request):
     return redirect("/")
 
 
+def link_json(link):
+    # a single link in the API, with its related links
+    return {**link.as_json(), "related": [related.as_json() for related in related_links(link)]}
+
+
 @login_required
 @csrf_exempt
 def api_link(request, pk):
@@ -248,10 +557,10 @@ def api_link(request, pk):
         try:
             request_body = json.loads(request.body)
         except Exception:
-            return JsonResponse(
-                {"errors": [{"code": "bad_request", "message": "Failed to parse JSON body"}]},
-                status=400,
-            )
+            return bad_request("Failed to parse JSON body")
+
+        if not isinstance(request_body, dict):
+            return bad_request("The JSON body must be an object")
 
         if "screenshot_url" in request_body:
             url = request_body["screenshot_url"]
@@ -259,13 +568,106 @@ def api_link(request, pk):
                 screenshot, created = LinkScreenshot.objects.get_or_create(link=link, url=url)
 
                 if created:
-                    return JsonResponse({"data": link.as_json(), "messages": ["screeshot added"]}, status=201)
+                    return JsonResponse({"data": link_json(link), "messages": ["screeshot added"]}, status=201)
                 else:
-                    return JsonResponse({"data": link.as_json(), "messages": ["screeshot already exists"]})
+                    return JsonResponse({"data": link_json(link), "messages": ["screeshot already exists"]})
 
-        return JsonResponse(
-            {"errors": [{"code": "bad_request", "message": "Invalid body or unsupported action"}]}, status=400
-        )
+        return bad_request("Invalid body or unsupported action")
 
     else:
-        return JsonResponse({"data": link.as_json()})
+        return JsonResponse({"data": link_json(link)})
+
+
+def filter_params(request_body):
+    # the dashboard filters from a JSON body as {"filter": {"tag": ["a", "b"], ...}, "ids": [...]}
+    params = QueryDict(mutable=True)
+    filters = request_body.get("filter", {})
+    if not isinstance(filters, dict):
+        raise ValidationError("The filter must be an object")
+
+    for key, value in filters.items():
+        params.setlist(key, value if isinstance(value, list) else [value])
+
+    if "ids" in request_body:
+        ids = request_body["ids"]
+        params.setlist("id", ids if isinstance(ids, list) else [ids])
+
+    return params
+
+
+@login_required
+@csrf_exempt
+def api_bulk_delete(request):
+    # only accepts JSON, which a cross-site form can't send, so it's safe without the CSRF token
+    if request.method != "POST" or request.content_type != "application/json":
+        return bad_request("POST a JSON body")
+
+    try:
+        request_body = json.loads(request.body)
+    except Exception:
+        return bad_request("Failed to parse JSON body")
+
+    if not isinstance(request_body, dict):
+        return bad_request("The JSON body must be an object")
+
+    # {"filter": {"tag": ["a", "b"], "domain": "example.org"}, "ids": [...], "trash": true}
+    try:
+        params = filter_params(request_body)
+        if not is_filtered(params):
+            return bad_request("A filter or a list of ids is required")
+
+        links = filter_links(Link.objects.filter(user=request.user), params)
+
+        if request_body.get("trash"):
+            data = {"trashed": trash_links(request.user, links)}
+        else:
+            data = {"deleted": delete_links(request.user, links)}
+    except ValidationError as e:
+        return bad_request(" ".join(e.messages))
+
+    return JsonResponse({"data": data})
+
+
+@login_required
+def api_stats(request):
+    return JsonResponse({"data": cached(request.user, "stats", lambda: link_stats(request.user))})
+
+
+@login_required
+@csrf_exempt
+def api_tags(request):
+    # {"action": "rename", "tags": ["Python", "python"], "name": "python"}
+    # {"action": "add" or "remove", "name": "python", "filter": {...}, "ids": [...]}
+    if request.method != "POST" or request.content_type != "application/json":
+        return bad_request("POST a JSON body")
+
+    try:
+        request_body = json.loads(request.body)
+    except Exception:
+        return bad_request("Failed to parse JSON body")
+
+    if not isinstance(request_body, dict):
+        return bad_request("The JSON body must be an object")
+
+    action, name = request_body.get("action"), str(request_body.get("name", "")).strip()
+
+    if not name:
+        return bad_request("A tag name is required")
+
+    if action == "rename":
+        return JsonResponse({"data": {"changed": rename_tags(request.user, request_body.get("tags", []), name)}})
+
+    if action not in ["add", "remove"]:
+        return bad_request("Unsupported action")
+
+    try:
+        params = filter_params(request_body)
+        if not is_filtered(params):
+            return bad_request("A filter or a list of ids is required")
+
+        links = filter_links(Link.objects.filter(user=request.user), params)
+        changed = (add_tag if action == "add" else remove_tag)(request.user, links, name)
+    except ValidationError as e:
+        return bad_request(" ".join(e.messages))
+
+    return JsonResponse({"data": {"changed": changed}})
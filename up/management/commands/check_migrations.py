@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations import operations
+from django.db.migrations.executor import MigrationExecutor
+
+"""
+Checks that the unapplied migrations are safe to run while the previous release is still serving requests
+
+Usage:
+    ./manage.py check_migrations [--database=<alias>]
+"""
+
+
+# the previous release keeps running until the new one is healthy, so it has to keep
+# working against the migrated schema, and the migration can't lock busy tables
+UNSAFE_OPERATIONS = {
+    operations.RemoveField: "the running release still reads and writes this column",
+    operations.DeleteModel: "the running release still uses this table",
+    operations.RenameField: "the running release uses the old column name",
+    operations.RenameModel: "the running release uses the old table name",
+    operations.AlterField: "may rewrite or lock the table, or add a constraint the running release doesn't satisfy",
+    operations.AlterUniqueTogether: "builds an index, locking writes to the table",
+    operations.AddIndex: "builds an index, locking writes to the table",
+    operations.AddConstraint: "validates every row, locking writes to the table",
+    operations.RunSQL: "can't be checked",
+}
+
+
+def unsafe_reason(operation):
+    if isinstance(operation, operations.AddField):
+        field = operation.field
+
+        # Django drops the default after adding the column, so inserts from the running release fail
+        if not (field.null or field.many_to_many or getattr(field, "db_default", None) is not None):
+            return "adds a NOT NULL column without a database default, inserts from the running release will fail"
+
+    for operation_class, reason in UNSAFE_OPERATIONS.items():
+        if isinstance(operation, operation_class):
+            return reason
+
+
+class Command(BaseCommand):
+    help = "Check that unapplied migrations are safe to run before switching releases"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        executor = MigrationExecutor(connections[options["database"]])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+        unsafe = []
+        created = set()
+
+        for migration, backwards in plan:
+            for operation in migration.operations:
+                # nothing is using a table created by this deployment yet
+                if isinstance(operation, operations.CreateModel):
+                    created.add((migration.app_label, operation.name_lower))
+                    continue
+
+                if (migration.app_label, getattr(operation, "model_name_lower", None)) in created:
+                    continue
+
+                reason = unsafe_reason(operation)
+                if reason:
+                    unsafe.append(f"{migration.app_label}.{migration.name}: {operation.describe()} ({reason})")
+
+        if unsafe:
+            raise CommandError("Unsafe migrations:\n" + "\n".join(unsafe))
+
+        self.stdout.write(f"{len(plan)} unapplied migrations, all safe to run alongside the live release")
@@ -1,5 +1,7 @@
 from __future__ import print_function
 
+import fnmatch
+import hashlib
 import os
 import shutil
 import string
@@ -17,9 +19,65 @@ from django.utils.crypto import get_random_string
 Deploying Django applications as quickly as you create them
 
 Usage:
-    ./manage.py up <hostname> [--email=<email>] [--debug] [--verbose]
+    ./manage.py up <hostname>... [--email=<email>] [--debug] [--verbose] [--incremental] [--forks=<n>]
+                                 [--allow-unsafe-migrations]
 """
 
+# never shipped to the server
+EXCLUDE = ["*.pyc", ".git", "*.sqlite3", "__pycache__", "*.log"]
+
+
+def is_excluded(name, exclude):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in exclude)
+
+
+def update_with_file(digest, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+
+
+def tree_hash(root, exclude, *extra):
+    # hashes the paths and contents of everything that goes into the tarball, an
+    # unchanged tree deploys to the same directory so there's nothing to upload
+    digest = hashlib.sha256("\0".join(extra).encode())
+
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        dirnames[:] = sorted(d for d in dirnames if not is_excluded(d, exclude))
+
+        for filename in sorted(f for f in filenames if not is_excluded(f, exclude)):
+            path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(path, root).encode() + b"\0")
+            update_with_file(digest, path)
+
+    return digest.hexdigest()
+
+
+def requirements_hash(*extra):
+    # the venv is reused until the requirements (or the packages up installs) change
+    digest = hashlib.sha256("\0".join(extra).encode())
+
+    for path in ["requirements.txt", "Pipfile.lock"]:
+        if os.path.exists(path):
+            update_with_file(digest, path)
+
+    return digest.hexdigest()
+
+
+def static_hash():
+    # hashes the files collectstatic would copy, so it can be skipped when none have changed
+    from django.contrib.staticfiles.finders import get_finders
+
+    digest = hashlib.sha256(str(getattr(settings, "STORAGES", {}).get("staticfiles", "")).encode())
+
+    for finder in get_finders():
+        for path, storage in sorted(finder.list(["CVS", ".*", "*~"]), key=lambda found: found[0]):
+            digest.update(path.encode() + b"\0")
+            with storage.open(path) as f:
+                digest.update(f.read())
+
+    return digest.hexdigest()
+
 
 class Command(BaseCommand):
     help = "Deploy your Django site to a remote server"
@@ -30,6 +88,21 @@ class Command(BaseCommand):
         parser.add_argument("--domain", nargs=1, type=str, dest="domain")
         parser.add_argument("--debug", action="store_true", default=False, dest="debug")
         parser.add_argument("--verbose", action="store_true", default=False, dest="verbose")
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            default=False,
+            dest="incremental",
+            help="Only deploy the application, skip provisioning the server (packages, firewall, database, nginx)",
+        )
+        parser.add_argument("--forks", type=int, dest="forks", help="Number of hosts to deploy to in parallel")
+        parser.add_argument(
+            "--allow-unsafe-migrations",
+            action="store_true",
+            default=False,
+            dest="allow_unsafe_migrations",
+            help="Stop the live release while running migrations that aren't safe to run alongside it",
+        )
 
     def handle(self, *args, **options):
         ansible_dir = os.path.join(os.path.dirname(__file__), "..", "..", "ansible")
@@ -81,27 +154,9 @@ class Command(BaseCommand):
 
         # create a tarball of our application code, excluding some common directories
         # and files that are unlikely to be wanted on the remote machine
-        subprocess.call(
-            [
-                "tar",
-                "--exclude",
-                "*.pyc",
-                "--exclude",
-                ".git",
-                "--exclude",
-                "*.sqlite3",
-                "--exclude",
-                "__pycache__",
-                "--exclude",
-                "*.log",
-                "--exclude",
-                "{}.tar".format(app_name),
-                "--dereference",
-                "-cf",
-                app_tar.name,
-                ".",
-            ]
-        )
+        exclude = EXCLUDE + ["{}.tar".format(app_name)]
+        tar_excludes = [arg for pattern in exclude for arg in ["--exclude", pattern]]
+        subprocess.call(["tar", *tar_excludes, "--dereference", "-cf", app_tar.name, "."])
 
         # use allowed_hosts to set up our domain names
         domains = []
@@ -119,6 +174,36 @@ class Command(BaseCommand):
             if h not in domains:
                 sys.exit("{} isn't in allowed domains or DJANGO_ALLOWED_HOSTS".format(h))
 
+        # an ASGI worker class serves the application's async views from an event loop,
+        # "asgi" is shorthand for uvicorn's gunicorn worker
+        worker_class = getattr(settings, "UP_GUNICORN_WORKER_CLASS", "sync")
+        if worker_class == "asgi":
+            worker_class = "uvicorn.workers.UvicornWorker"
+        asgi = worker_class.startswith("uvicorn.")
+
+        # the django role sizes gunicorn from the target's CPU and memory facts, only
+        # pass the settings that have been set so they override that
+        gunicorn_settings = {
+            "gunicorn_workers": "UP_GUNICORN_WORKERS",
+            "gunicorn_threads": "UP_GUNICORN_THREADS",
+            "gunicorn_worker_memory_mb": "UP_GUNICORN_WORKER_MEMORY_MB",
+            "gunicorn_timeout": "UP_GUNICORN_TIMEOUT",
+            "gunicorn_preload": "UP_GUNICORN_PRELOAD",
+            "gunicorn_max_requests": "UP_GUNICORN_MAX_REQUESTS",
+            "gunicorn_max_requests_jitter": "UP_GUNICORN_MAX_REQUESTS_JITTER",
+            "gunicorn_log_level": "UP_GUNICORN_LOG_LEVEL",
+        }
+        gunicorn_vars = {
+            var: getattr(settings, name) for var, name in gunicorn_settings.items() if hasattr(settings, name)
+        }
+
+        # long-running management commands, each is a systemd service next to the application's
+        workers = [{"name": name, "command": command} for name, command in getattr(settings, "UP_WORKERS", {}).items()]
+
+        python_version = getattr(settings, "UP_PYTHON_VERSION", "python3.8")
+        code_hash = tree_hash(".", exclude, "debug" if options["debug"] else "")
+        venv_hash = requirements_hash(python_version, worker_class)
+
         yam = [
             {
                 "hosts": app_name,
@@ -127,15 +212,29 @@ class Command(BaseCommand):
                 "vars": {
                     # app_name is used for our user, database and to refer to our main application folder
                     "app_name": app_name,
-                    # app_path is the directory for this specific deployment
-                    "app_path": app_name + "-" + str(get_random_string(6, string.ascii_letters + string.digits)),
+                    # app_path is the directory for this specific deployment, named by the hash of
+                    # the code so an unchanged tree is already on the server
+                    "app_path": app_name + "-" + code_hash[:12],
+                    # venv_path is shared by every deployment with the same requirements
+                    "venv_path": "/srv/www/{}/venvs/{}".format(app_name, venv_hash[:12]),
+                    "static_hash": static_hash(),
                     # service_name is our systemd service (you cannot have _ or other special characters)
                     "service_name": app_name.replace("_", ""),
                     "domain_names": " ".join(domains),
                     "certbot_domains": "-d " + " -d ".join(domains),
                     "gunicorn_port": getattr(settings, "UP_GUNICORN_PORT", "9000"),
+                    "gunicorn_worker_class": worker_class,
+                    "gunicorn_application": "{}.{}:application".format(app_name, "asgi" if asgi else "wsgi"),
+                    "gunicorn_asgi": asgi,
+                    **gunicorn_vars,
+                    "workers": workers,
+                    "nginx_brotli": getattr(settings, "UP_NGINX_BROTLI", False),
+                    # blue/green deploys health check the new release before switching to it
+                    "health_check_path": getattr(settings, "UP_HEALTH_CHECK_PATH", "/"),
+                    "drain_seconds": getattr(settings, "UP_DRAIN_SECONDS", 10),
+                    "allow_unsafe_migrations": options["allow_unsafe_migrations"],
                     "app_tar": app_tar.name,
-                    "python_version": getattr(settings, "UP_PYTHON_VERSION", "python3.8"),
+                    "python_version": python_version,
                     # create a random database password to use for the database user, this is
                     # saved on the remote machine and will be overridden by the ansible run
                     # if it exists
@@ -145,12 +244,16 @@ class Command(BaseCommand):
                     "certbot_email": email,
                     "domain": domains[0],
                 },
-                "roles": ["base", "ufw", "opensmtpd", "postgres", "nginx", "django"],
+                "roles": (
+                    ["django"]
+                    if options["incremental"]
+                    else ["base", "ufw", "opensmtpd", "postgres", "nginx", "django"]
+                ),
             }
         ]
 
-        app_yml = open(os.path.join(up_dir, "{}.yml".format(app_name)), "w")
-        yaml.dump(yam, app_yml)
+        with open(os.path.join(up_dir, "{}.yml".format(app_name)), "w") as app_yml:
+            yaml.dump(yam, app_yml)
 
         # create the hosts file for ansible
         with open(os.path.join(up_dir, "hosts"), "w") as hosts_file:
@@ -162,11 +265,14 @@ class Command(BaseCommand):
         if options["verbose"]:
             ansible_args.append("-vvvv")
 
+        # deploy to every host at once unless told otherwise
+        ansible_args.extend(["--forks", str(options["forks"] or len(hostnames))])
+
         # build the ansible command
         command = ["ansible-playbook", "-i", os.path.join(up_dir, "hosts")]
         command.extend(ansible_args)
         command.extend([os.path.join(up_dir, "{}.yml".format(app_name))])
 
-        # execute ansible
-        return_code = subprocess.call(command)
+        # execute ansible, pipelining runs each task over a single ssh connection
+        return_code = subprocess.call(command, env={**os.environ, "ANSIBLE_PIPELINING": "True"})
         sys.exit(return_code)